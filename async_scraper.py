@@ -0,0 +1,366 @@
+import asyncio
+import time
+from playwright.async_api import async_playwright
+from playwright_stealth import stealth_async
+
+from budget import timeout_until
+from fetch_tiers import TIER_HTTP, TIER_RSS, TierAttempt, TierMemory, fetch_http
+from instance_health import InstanceHealth
+from rss_feed import RssCache, fetch_rss
+from extractors import parse_timeline
+from metrics import METRICS, timer
+from nitter import (
+    CHALLENGE_KEYWORDS, PAGE_STATE_JS, READY_SELECTOR, announce_tweet, build_target_url, get_random_user_agent, group_tweets_by_author, is_challenge_page,
+    make_batches, should_block_request,
+)
+
+class AsyncScraper:
+    """
+    基于 Playwright 异步 API 的并发抓取引擎
+    持有独立的事件循环与一个长驻 Chromium，多个目标同时抓取；
+    通过 "全局" 与 "单实例" 两级信号量限制同时打开的页面数
+    """
+
+    def __init__(self, max_concurrency=4, per_instance_concurrency=2, headless=True, tier_memory=None,
+                 rss_cache=None, batch_size=1, health=None, hedge=False, hedge_delay=None,
+                 max_hedges=2, block_resources=True, ready_timeout=25, storage_states=None, catchup=False,
+                 budget=None):
+        self.catchup = catchup
+        # 单次运行的时间预算: 抓取阶段结束时取消尚未完成的目标，各请求的超时不越过该时间点
+        self.budget = budget
+        self._until = None
+        self.storage_states = storage_states
+        self.block_resources = block_resources
+        self.ready_timeout = ready_timeout
+        self.batch_size = batch_size
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.max_hedges = max(1, max_hedges)
+        self.health = health or InstanceHealth()
+        self.tier_memory = tier_memory or TierMemory()
+        self.rss_cache = rss_cache or RssCache()
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_instance_concurrency = max(1, per_instance_concurrency)
+        self.headless = headless
+        self._loop = asyncio.new_event_loop()
+        self._playwright = None
+        self._browser = None
+        self._launch_lock = None
+        self._global_sem = None
+        self._instance_sems = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def scrape(self, targets, instances):
+        """
+        并发抓取所有目标，按 targets 的原始顺序返回 [(target, 推文列表或 None), ...]
+        列表规则与同步路径的 scrape_nitter_with_playwright 一致；时间预算用完时被取消的目标不在结果中
+        """
+        return self._loop.run_until_complete(self._scrape_all(targets, instances))
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        self._loop.run_until_complete(self._shutdown())
+        self._loop.close()
+
+    async def _shutdown(self):
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+    async def _ensure_browser(self):
+        async with self._launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+            if self._browser is not None:
+                print("[浏览器] 检测到 Chromium 已断开，正在重启...")
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            with timer('browser_launch'):
+                self._browser = await self._playwright.chromium.launch(headless=self.headless)
+            print("[浏览器] Chromium (异步) 已启动")
+            return self._browser
+
+    async def _scrape_all(self, targets, instances):
+        # 同步原语需要在事件循环内创建
+        if self._global_sem is None:
+            self._launch_lock = asyncio.Lock()
+            self._global_sem = asyncio.Semaphore(self.max_concurrency)
+
+        # 普通用户按组走合并时间线，其余目标单独抓取
+        batches = make_batches(targets, self.batch_size)
+        batched = {username for chunk in batches for username in chunk}
+        singles = [target for target in dict.fromkeys(targets) if target not in batched]
+
+        tasks = [asyncio.ensure_future(self._scrape_batch(chunk, instances)) for chunk in batches]
+        tasks += [asyncio.ensure_future(self._scrape_target(target, instances)) for target in singles]
+        timeout = None
+        if self.budget:
+            timeout = max(0.0, self.budget.fetch_remaining())
+            self._until = time.time() + timeout
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                print(f"[系统] 抓取时间预算已用完，取消 {len(pending)} 个未完成的抓取，留待下一次运行")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        outcomes = [
+            None if task.cancelled() else (task.exception() or task.result())
+            for task in tasks
+        ]
+
+        results = {}
+        for chunk, outcome, task in zip(batches, outcomes[:len(batches)], tasks):
+            if task.cancelled():
+                continue
+            if isinstance(outcome, BaseException):
+                print(f"[系统] 合并抓取 {', '.join(chunk)} 异常: {outcome}")
+                outcome = {}
+            for username in chunk:
+                results[username] = outcome.get(username)
+        for target, outcome, task in zip(singles, outcomes[len(batches):], tasks[len(batches):]):
+            if task.cancelled():
+                continue
+            if isinstance(outcome, BaseException):
+                print(f"[{target}] 抓取异常: {outcome}")
+                outcome = None
+            results[target] = outcome
+
+        # 被取消的目标本次不产出结果 (视为未检查)
+        return [(target, results.get(target)) for target in targets if target in results]
+
+    async def _scrape_target(self, target, instances):
+        if self.catchup:
+            instance, tweets = await self._first_success(target, instances, scan_limit=None, max_tweets=None)
+        else:
+            instance, tweets = await self._first_success(target, instances)
+        if tweets:
+            announce_tweet(target, instance, tweets[0])
+            return tweets
+        return None
+
+    async def _scrape_batch(self, usernames, instances):
+        """
+        合并时间线抓取，规则与同步路径的 scrape_batch 一致
+        """
+        batch_target = ','.join(usernames)
+        instance, tweets = await self._first_success(batch_target, instances, scan_limit=None, max_tweets=None)
+        if not tweets:
+            return {}
+        results = {}
+        fallback = []
+        for username, user_tweets in group_tweets_by_author(tweets, usernames).items():
+            if user_tweets is None:
+                print(f"[{username}] 合并时间线中有无法归属的转发，单独抓取该用户")
+                fallback.append(username)
+                continue
+            results[username] = (user_tweets if self.catchup else user_tweets[:1]) or None
+            if user_tweets:
+                announce_tweet(username, instance, user_tweets[0])
+            else:
+                print(f"[{username}] 合并时间线中没有该用户的近期推文")
+        if fallback:
+            # 页面上有无法归属的转发时，显示名称未知的用户各自单独加载一次
+            singles = await asyncio.gather(*(self._scrape_target(username, instances) for username in fallback))
+            results.update(zip(fallback, singles))
+        return results
+
+    def _hedge_delay_for(self, instance):
+        """
+        对冲延迟: 优先使用配置值，否则取该实例最近成功耗时的 p90
+        """
+        if self.hedge_delay:
+            return self.hedge_delay
+        p90 = self.health.latency_quantile(0.9, instance)
+        return min(30.0, max(1.0, p90)) if p90 else 8.0
+
+    async def _first_success(self, target, instances, scan_limit=8, max_tweets=1):
+        """
+        按健康度顺序在各实例上抓取，返回 (instance, tweets)，全部失败时返回 (None, None)
+        开启对冲时: 当前实例在对冲延迟内没有产出结果，就在下一个实例上并行发起同样的抓取，
+        先拿到有效结果的获胜，其余请求被取消；进行中的请求全部失败时立即换下一个实例
+        """
+        ordered = iter(self.health.order(instances))
+        running = {}
+
+        def launch():
+            instance = next(ordered, None)
+            if instance is None:
+                return False
+            task = asyncio.ensure_future(self._scrape_instance(target, instance, scan_limit, max_tweets))
+            running[task] = instance
+            return True
+
+        launch()
+        exhausted = False
+        try:
+            while running:
+                timeout = None
+                if self.hedge and not exhausted and len(running) < self.max_hedges:
+                    timeout = self._hedge_delay_for(next(iter(running.values())))
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if launch():
+                        print(f"[{target}] {timeout:.1f}s 内未拿到结果，对冲请求 {list(running.values())[-1]}")
+                    else:
+                        # 没有更多实例可对冲，继续等待已有请求
+                        exhausted = True
+                    continue
+
+                for task in done:
+                    instance = running.pop(task)
+                    try:
+                        tweets = task.result()
+                    except Exception as e:
+                        print(f"[{target}] 访问 {instance} 出错: {e}")
+                        tweets = None
+                    if tweets:
+                        return instance, tweets
+
+                # 没有进行中的请求时立即由下一个实例补位
+                if not running:
+                    launch()
+        finally:
+            # 输掉比赛的请求直接取消 (浏览器上下文会在 _load_page 的 finally 中关闭)
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        return None, None
+
+    async def _scrape_instance(self, target, instance, scan_limit=8, max_tweets=1):
+        """
+        按层级在某个实例上抓取，返回推文列表，规则与同步路径的 scrape_instance 一致
+        """
+        instance_sem = self._instance_sems.get(instance)
+        if instance_sem is None:
+            instance_sem = self._instance_sems[instance] = asyncio.Semaphore(self.per_instance_concurrency)
+
+        attempt = None
+        tweets, html = None, None
+        try:
+            # 先占实例名额再占全局名额，避免排队等慢实例时占着全局并发
+            async with instance_sem, self._global_sem:
+                attempt = TierAttempt(self.tier_memory, self.health, target, instance)
+                for tier in attempt.tiers():
+                    if tier == TIER_RSS:
+                        with timer('fetch_rss', target, instance):
+                            tweets, reason = await asyncio.to_thread(
+                                fetch_rss, instance, target, self.rss_cache, timeout=timeout_until(15, self._until),
+                                max_tweets=max_tweets
+                            )
+                    elif tier == TIER_HTTP:
+                        clearance_ua, clearance_cookies = (
+                            self.storage_states.cookies_for(instance) if self.storage_states else (None, None)
+                        )
+                        with timer('fetch_http', target, instance):
+                            html, reason = await asyncio.to_thread(
+                                fetch_http, instance, target, timeout=timeout_until(15, self._until),
+                                user_agent=clearance_ua, cookies=clearance_cookies
+                            )
+                    else:
+                        with timer('browser_load', target, instance):
+                            html, reason = await self._load_page(target, instance)
+                    attempt.result(tier, reason)
+        except asyncio.CancelledError:
+            # 对冲中输掉 (或因时间预算被取消) 的请求，排队时被取消的不计
+            if attempt is not None:
+                attempt.cancel(self._hedge_delay_for(instance))
+            raise
+
+        if attempt.reason is None and html is not None:
+            # 解析是纯 CPU 操作，放到线程里避免阻塞其他页面的 I/O，且不占用并发名额
+            with timer('parse', target, instance):
+                tweets = await asyncio.to_thread(parse_timeline, html, instance, target, scan_limit, max_tweets)
+        return attempt.finish(tweets)
+
+    async def _load_page(self, target, instance):
+        """
+        使用浏览器加载目标页面，返回 (html, reason)，规则与同步路径的 load_with_browser 一致
+        """
+        context = None
+        cached = self.storage_states.get(instance) if self.storage_states else None
+        user_agent = cached['user_agent'] if cached else get_random_user_agent()
+        try:
+            browser = await self._ensure_browser()
+            with timer('browser_context', target, instance):
+                context = await browser.new_context(
+                    user_agent=user_agent,
+                    viewport={'width': 1280, 'height': 720},
+                    storage_state=cached['state'] if cached else None
+                )
+                page = await context.new_page()
+                await stealth_async(page)
+
+            if self.block_resources:
+                async def handle_route(route):
+                    if should_block_request(route.request.resource_type, route.request.url, instance):
+                        await route.abort()
+                    else:
+                        await route.continue_()
+                await page.route("**/*", handle_route)
+
+            url = build_target_url(instance, target)
+            print(f"[{target}] 正在加载: {url}")
+
+            try:
+                with timer('goto', target, instance):
+                    response = await page.goto(url, wait_until="domcontentloaded",
+                                                timeout=timeout_until(45, self._until) * 1000)
+            except Exception as e:
+                print(f"[{target}] 加载 {instance} 超时或失败: {e}")
+                return None, 'error'
+            if response and response.status == 403:
+                print(f"[{target}] 访问 {instance} 被拒 (403 Forbidden)")
+                return None, '403'
+
+            try:
+                with timer('page_ready', target, instance):
+                    handle = await page.wait_for_function(PAGE_STATE_JS, arg=CHALLENGE_KEYWORDS,
+                                                          timeout=timeout_until(self.ready_timeout, self._until) * 1000)
+                    state = await handle.json_value()
+            except Exception:
+                state = None
+            if state == 'challenge':
+                METRICS.incr('challenge', target=target, instance=instance)
+                if cached:
+                    self.storage_states.invalidate(instance)
+                print(f"[{target}] 检测到浏览器验证，等待通过...")
+                try:
+                    with timer('challenge_wait', target, instance):
+                        await page.wait_for_selector(READY_SELECTOR, timeout=timeout_until(self.ready_timeout, self._until) * 1000)
+                except Exception:
+                    pass
+
+            html = await page.content()
+            if is_challenge_page(html):
+                print(f"[{target}] {instance} 浏览器验证未通过")
+                return None, 'challenge'
+            if state == 'challenge' and self.storage_states:
+                self.storage_states.save(instance, await context.storage_state(), user_agent)
+            return html, None
+        except Exception as e:
+            print(f"[{target}] 访问 {instance} 出错: {e}")
+            return None, 'error'
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
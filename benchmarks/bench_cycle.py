@@ -0,0 +1,231 @@
+"""
+端到端轮询基准测试 (离线)
+
+在本地启动替身服务: 若干个 Nitter 实例 (以 fixtures/ 中录制的页面为模板按目标改写，可配置延迟、验证页与 403 的比例，
+并提供带 ETag 的 RSS)，以及翻译、ImgBB 与钉钉 Webhook 替身；然后对 N 个合成目标按不同抓取策略运行 main() 若干轮
+(每个策略一个子进程、全新的缓存与状态目录)，输出每轮耗时、单个目标抓取耗时的分位数、各外部服务的请求次数与峰值 RSS
+(主进程与子进程分别统计: 子进程为分片子进程中最大的一个，不是总和)。
+第 1 轮为冷启动 (每个目标推送最新一条推文: 翻译、上传图片、推送)，之后各轮页面不变，只有抓取开销。
+
+用法: python benchmarks/bench_cycle.py [--targets 20] [--cycles 2] [--strategies http,rss,async,batch]
+      [--latency 0.2] [--challenge-rate 0.1] [--forbidden-rate 0.05] [--save result.json] [--compare result.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_extractors import load_fixtures
+
+# 各抓取策略对应的环境变量 (浏览器层级需要 Chromium，离线对比只使用静态层级)
+STRATEGIES = {
+    'http': {'FETCH_TIERS': 'http'},
+    'rss': {'FETCH_TIERS': 'rss,http'},
+    'async': {'FETCH_TIERS': 'http', 'ASYNC_MODE': 'true'},
+    'batch': {'FETCH_TIERS': 'http', 'BATCH_SIZE': '5'},
+    'hedge': {'FETCH_TIERS': 'http', 'HEDGE_MODE': 'true'},
+    'shard': {'FETCH_TIERS': 'http', 'SHARDS': '2'},
+}
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def run_worker(cycles, verbose, result_path):
+    """
+    子进程入口: 按环境变量中的配置运行 main() cycles 轮，结果以 JSON 写入 result_path
+    """
+    import twitter_monitor
+
+    results = []
+    try:
+        for _ in range(cycles):
+            if verbose:
+                twitter_monitor.main()
+            else:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    twitter_monitor.main()
+            with open(os.path.join(twitter_monitor.METRICS_DIR, 'cycle_report.json'), 'r', encoding='utf-8') as f:
+                report = json.load(f)
+            # 单个目标的抓取耗时: 该目标在各实例上 (含失败重试) 的耗时之和
+            per_target = {}
+            for timing in report['timings']:
+                if timing['stage'] == 'scrape':
+                    per_target[timing['target']] = per_target.get(timing['target'], 0.0) + timing['seconds']
+            results.append({
+                'seconds': report['duration_seconds'],
+                'target_latencies': list(per_target.values()),
+                'stages': report['stages'],
+            })
+    finally:
+        twitter_monitor.STATE.close()
+
+    # 分片子进程在每轮结束时都已回收，RUSAGE_CHILDREN 给出其中峰值最大的一个 (不分片时为 0)
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'cycles': results,
+            'rss_peak_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'rss_children_peak_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        }, f)
+
+def run_strategy(name, overrides, targets, nitters, services, args):
+    """
+    在全新的临时目录中以子进程运行一个策略，返回结果摘要
+    """
+    with tempfile.TemporaryDirectory(prefix=f'bench_{name}_') as workdir:
+        instances_file = os.path.join(workdir, 'instances.json')
+        with open(instances_file, 'w', encoding='utf-8') as f:
+            json.dump([server.url for server in nitters], f)
+
+        env = dict(os.environ)
+        env.update({
+            'TWITTER_USER': ','.join(targets),
+            'LOOP_MODE': 'false',
+            'CACHE_DIR': os.path.join(workdir, 'cache'),
+            'METRICS_DIR': os.path.join(workdir, 'metrics'),
+            'LAST_ID_FILE': os.path.join(workdir, 'last_id.json'),
+            'HEALTH_FILE': os.path.join(workdir, 'instance_health.json'),
+            'INSTANCES_FILE': instances_file,
+            'DINGTALK_WEBHOOK': f"{services.url}/robot/send?access_token=bench",
+            'DINGTALK_RATE_LIMIT': '100000',
+            'TRANSLATE_URL': f"{services.url}/translate_a/single",
+            'TRANSLATE_BATCH_URL': f"{services.url}/translate_a/t",
+            'IMGBB_UPLOAD_URL': f"{services.url}/1/upload",
+            'IMGBB_API_KEY': 'bench',
+            'USE_IMAGE_BED': 'true',
+            'PARSER_BACKEND': args.parser,
+        })
+        env.update(overrides)
+
+        result_path = os.path.join(workdir, 'result.json')
+        before = [server.snapshot() for server in nitters] + [services.snapshot()]
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', '--cycles', str(args.cycles), '--result', result_path]
+            + (['--verbose'] if args.verbose else []),
+            env=env, capture_output=not args.verbose, text=True
+        )
+        if completed.returncode != 0:
+            print(completed.stderr or '', file=sys.stderr)
+            raise RuntimeError(f"策略 {name} 运行失败 (退出码 {completed.returncode})")
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+
+    after = [server.snapshot() for server in nitters] + [services.snapshot()]
+    requests = {}
+    for old, new in zip(before, after):
+        for key, value in new.items():
+            requests[key] = requests.get(key, 0) + value - old.get(key, 0)
+
+    latencies = [value for cycle in result['cycles'] for value in cycle['target_latencies']]
+    return {
+        'strategy': name,
+        'cycle_seconds': [cycle['seconds'] for cycle in result['cycles']],
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'requests': requests,
+        'rss_peak_kb': result['rss_peak_kb'],
+        'rss_children_peak_kb': result['rss_children_peak_kb'],
+        'stages': [cycle['stages'] for cycle in result['cycles']],
+    }
+
+def compare(results, baseline_path, tolerance):
+    """
+    与保存的结果比较各策略的总轮询耗时，变慢超过 tolerance 的返回 False
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {entry['strategy']: entry for entry in json.load(f)['results']}
+    ok = True
+    print()
+    for entry in results:
+        base = baseline.get(entry['strategy'])
+        if not base:
+            continue
+        now_total, base_total = sum(entry['cycle_seconds']), sum(base['cycle_seconds'])
+        change = (now_total - base_total) / base_total if base_total else 0.0
+        state = '退化' if change > tolerance else '正常'
+        ok = ok and change <= tolerance
+        print(f"  {entry['strategy']}: {base_total:.2f}s -> {now_total:.2f}s ({change:+.0%}) {state}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', type=int, default=20, help='合成目标数量')
+    parser.add_argument('--cycles', type=int, default=2, help='每个策略运行的轮数')
+    parser.add_argument('--strategies', default='http,rss,async,batch', help=f"逗号分隔: {', '.join(STRATEGIES)}")
+    parser.add_argument('--instances', type=int, default=3, help='Nitter 替身实例数')
+    parser.add_argument('--latency', type=float, default=0.2, help='Nitter 替身的平均响应延迟 (秒)')
+    parser.add_argument('--service-latency', type=float, default=0.05, help='翻译/图床/Webhook 替身的平均延迟 (秒)')
+    parser.add_argument('--challenge-rate', type=float, default=0.0, help='返回验证页的比例')
+    parser.add_argument('--forbidden-rate', type=float, default=0.0, help='返回 403 的比例')
+    parser.add_argument('--image-size', type=int, default=100, help='替身图片大小 (KB)')
+    parser.add_argument('--parser', default='auto', help='PARSER_BACKEND')
+    parser.add_argument('--save', help='把结果保存为 JSON，供 --compare 使用')
+    parser.add_argument('--compare', help='与保存的结果比较，总耗时变慢超过 --tolerance 时以退出码 1 结束')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--verbose', action='store_true', help='显示子进程日志')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.cycles, args.verbose, args.result)
+        return
+
+    from standins import TimelineTemplates, start_nitter, start_services
+
+    names = [name.strip() for name in args.strategies.split(',') if name.strip()]
+    unknown = [name for name in names if name not in STRATEGIES]
+    if unknown:
+        parser.error(f"未知策略: {', '.join(unknown)}")
+
+    templates = TimelineTemplates(load_fixtures())
+    nitters = [
+        start_nitter(templates, args.latency, args.challenge_rate, args.forbidden_rate,
+                     args.image_size * 1024, seed=index)
+        for index in range(args.instances)
+    ]
+    services = start_services(args.service_latency)
+    targets = [f"bench{index:03d}" for index in range(args.targets)]
+    print(f"目标 {len(targets)} 个, Nitter 替身 {len(nitters)} 个 (延迟 {args.latency}s, "
+          f"验证页 {args.challenge_rate:.0%}, 403 {args.forbidden_rate:.0%}), 每个策略 {args.cycles} 轮")
+
+    results = []
+    try:
+        for name in names:
+            print(f"  运行 {name} ...")
+            results.append(run_strategy(name, STRATEGIES[name], targets, nitters, services, args))
+    finally:
+        for server in nitters + [services]:
+            server.close()
+
+    print()
+    cycle_headers = ''.join(f"{f'第{i + 1}轮':>9}" for i in range(args.cycles))
+    print(f"{'策略':<8}{cycle_headers}{'p50':>8}{'p90':>8}{'p99':>8}{'页面':>6}{'RSS':>6}{'翻译':>6}{'上传':>6}{'推送':>6}{'主进程RSS峰值':>14}{'子进程RSS峰值':>14}")
+    for r in results:
+        req = r['requests']
+        cycles = ''.join(f"{seconds:>8.2f}s" for seconds in r['cycle_seconds'])
+        print(f"{r['strategy']:<8}{cycles}{r['p50']:>7.2f}s{r['p90']:>7.2f}s{r['p99']:>7.2f}s"
+              f"{req.get('timeline', 0):>6}{req.get('rss', 0):>6}"
+              f"{req.get('translate', 0) + req.get('translate_batch', 0):>6}{req.get('upload', 0):>6}"
+              f"{req.get('webhook', 0):>6}{r['rss_peak_kb'] // 1024:>11} MB{r['rss_children_peak_kb'] // 1024:>11} MB")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2, ensure_ascii=False)
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+时间线解析后端基准测试
+
+对 fixtures/ 中保存的各实例 Nitter 页面 (文件名为 <实例域名>__<目标>.html)，
+逐个后端重复解析整页，输出每秒解析的推文条数与峰值内存，并校验结果与参考后端 bs4 完全一致。
+每个后端在独立的子进程中运行，保证峰值 RSS 互不影响。
+
+用法: python benchmarks/bench_extractors.py [--repeat 30] [--backends selectolax,lxml,bs4]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from extractors import BACKEND_BS4, available_backends, parse_timeline
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+# 文件名中不便保存的目标在这里映射回真实目标
+TARGET_ALIASES = {'search': 'search:starship launch'}
+
+def load_fixtures(directory=FIXTURES_DIR):
+    """
+    返回 [(名称, 实例, 目标, html), ...]
+    """
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        name = os.path.basename(path)[:-len('.html')]
+        host, _, target = name.partition('__')
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+        fixtures.append((name, f"https://{host}", TARGET_ALIASES.get(target, target), html))
+    return fixtures
+
+def parse_all(backend, fixtures):
+    """
+    解析全部页面 (不限制条数)，返回 {名称: 推文列表}；解析日志被丢弃
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {
+            name: parse_timeline(html, instance, target, scan_limit=None, max_tweets=None, backend=backend)
+            for name, instance, target, html in fixtures
+        }
+
+def run_worker(backend, repeat):
+    """
+    子进程入口: 在当前进程内测量单个后端，结果以 JSON 输出到 stdout
+    """
+    fixtures = load_fixtures()
+    # 预热一次 (导入、编译查询)，之后的 RSS 增长才是解析本身带来的
+    results = parse_all(backend, fixtures)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    items = sum(len(tweets or []) for tweets in results.values())
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parse_all(backend, fixtures)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    parse_all(backend, fixtures)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({
+        'backend': backend,
+        'items_per_run': items,
+        'runs': repeat,
+        'seconds': elapsed,
+        'items_per_sec': items * repeat / elapsed if elapsed else 0,
+        'ms_per_page': elapsed * 1000 / (repeat * len(fixtures)),
+        'tracemalloc_peak_kb': traced_peak / 1024,
+        'rss_peak_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'rss_growth_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+    }))
+
+def check_equivalence(backends, fixtures):
+    """
+    与参考后端逐页比较解析结果，返回 {后端: [不一致的页面名, ...]}
+    """
+    reference = parse_all(BACKEND_BS4, fixtures)
+    mismatches = {}
+    for backend in backends:
+        if backend == BACKEND_BS4:
+            continue
+        results = parse_all(backend, fixtures)
+        mismatches[backend] = [name for name in reference if results.get(name) != reference[name]]
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=30, help='每个后端重复解析全部页面的次数')
+    parser.add_argument('--backends', default=','.join(available_backends()), help='逗号分隔的后端列表')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.repeat)
+        return
+
+    backends = [b.strip() for b in args.backends.split(',') if b.strip() in available_backends()]
+    fixtures = load_fixtures()
+    if not fixtures:
+        print(f"{FIXTURES_DIR} 中没有页面样本")
+        sys.exit(1)
+    print(f"页面样本: {len(fixtures)} 个 ({', '.join(name for name, *_ in fixtures)})")
+
+    mismatches = check_equivalence(backends, fixtures)
+    for backend, names in mismatches.items():
+        state = "与 bs4 一致" if not names else f"与 bs4 不一致: {', '.join(names)}"
+        print(f"  {backend}: {state}")
+
+    reports = []
+    for backend in backends:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', backend, '--repeat', str(args.repeat)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        reports.append(json.loads(output.strip().splitlines()[-1]))
+
+    baseline = next((r for r in reports if r['backend'] == BACKEND_BS4), None)
+    print()
+    print(f"{'后端':<12}{'条/秒':>10}{'毫秒/页':>10}{'相对 bs4':>10}{'tracemalloc 峰值':>18}{'RSS 增长':>12}{'RSS 峰值':>12}")
+    for r in reports:
+        speedup = f"{r['items_per_sec'] / baseline['items_per_sec']:.1f}x" if baseline else '-'
+        print(f"{r['backend']:<12}{r['items_per_sec']:>10.0f}{r['ms_per_page']:>10.2f}{speedup:>10}"
+              f"{r['tracemalloc_peak_kb']:>15.0f} KB{r['rss_growth_kb']:>9} KB{r['rss_peak_kb']:>9} KB")
+
+    if any(mismatches.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+钉钉推送队列的离线检查 (本地 Webhook 替身)
+
+1. 队列本身: Webhook 依次返回 429、500、130102、130101 后恢复，检查重试、限流后清空令牌以及积压时的合并；
+   返回不可重试的错误码时不重试
+2. 端到端: Webhook 每 60 秒只接受 2 条消息 (超出返回 130101)，对 4 个合成目标运行一次 main()，
+   检查 last_id.json 只包含消息被实际接受的目标；解除限流后再运行一次，检查其余目标补推且每个目标只推送一次
+
+用法: python benchmarks/check_delivery.py [--verbose]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_extractors import load_fixtures
+
+TARGETS = [f"check{i:02d}" for i in range(4)]
+
+class Checks:
+
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, condition, label, detail=''):
+        print(f"  [{'通过' if condition else '失败'}] {label}" + (f": {detail}" if detail and not condition else ''))
+        if not condition:
+            self.failed += 1
+
+def check_queue(checks):
+    from delivery import DingTalkDelivery, Message
+    from standins import start_services
+
+    print("推送队列 (重试 / 限流 / 合并):")
+    services = start_services(latency=0, webhook_faults=['429', '500', 'busy', 'throttle'])
+    try:
+        # 每秒 2 条配额，5 条积压合并为 2 条消息；退避缩短到毫秒级
+        delivery = DingTalkDelivery(f"{services.url}/robot/send", rate=2, per=1.0, max_retries=4, base_backoff=0.01)
+        messages = [Message(target, str(i), f"Twitter 监控: {target}", f"## {target} 📝 发布了 推文 {i}")
+                    for i, target in enumerate(['a', 'b', 'c', 'd', 'e'])]
+        delivered = delivery.deliver(messages)
+        counts = services.snapshot()
+        checks.expect(delivered == [entry for m in messages for entry in m.entries], "全部推文送达", delivered)
+        checks.expect(len(services.accepted) == 2, "积压的 5 条推文合并为 2 条消息", len(services.accepted))
+        checks.expect(all(counts.get(f"webhook_{fault}") == 1 for fault in ('429', '500', 'busy', 'throttle')),
+                      "429 / 500 / 130102 / 130101 各重试一次", counts)
+        checks.expect(counts.get('webhook') == 6, "Webhook 共收到 6 次请求", counts.get('webhook'))
+    finally:
+        services.close()
+
+    services = start_services(latency=0, webhook_faults=['reject'])
+    try:
+        delivery = DingTalkDelivery(f"{services.url}/robot/send", max_retries=4, base_backoff=0.01)
+        delivered = delivery.deliver([Message('a', '1', "Twitter 监控: a", "## a 📝 发布了 推文")])
+        checks.expect(delivered == [] and services.snapshot().get('webhook') == 1, "不可重试的错误码只请求一次")
+    finally:
+        services.close()
+
+def run_monitor(workdir, nitter, services, verbose):
+    env = dict(os.environ)
+    env.update({
+        'TWITTER_USER': ','.join(TARGETS),
+        'LOOP_MODE': 'false',
+        'FETCH_TIERS': 'http',
+        'CACHE_DIR': os.path.join(workdir, 'cache'),
+        'METRICS_DIR': '',
+        'LAST_ID_FILE': os.path.join(workdir, 'last_id.json'),
+        'HEALTH_FILE': os.path.join(workdir, 'instance_health.json'),
+        'INSTANCES_FILE': os.path.join(workdir, 'instances.json'),
+        'DINGTALK_WEBHOOK': f"{services.url}/robot/send?access_token=check",
+        'DINGTALK_RATE_LIMIT': '100000',
+        'DINGTALK_MAX_RETRIES': '1',
+        'DINGTALK_COALESCE_MAX': '1',
+        'TRANSLATE_URL': f"{services.url}/translate_a/single",
+        'TRANSLATE_BATCH_URL': f"{services.url}/translate_a/t",
+        'IMGBB_UPLOAD_URL': f"{services.url}/1/upload",
+        'IMGBB_API_KEY': 'check',
+    })
+    with open(env['INSTANCES_FILE'], 'w', encoding='utf-8') as f:
+        json.dump([nitter.url], f)
+    completed = subprocess.run([sys.executable, os.path.join(os.path.dirname(BENCH_DIR), 'twitter_monitor.py')],
+                               env=env, capture_output=not verbose, text=True)
+    if completed.returncode != 0:
+        print(completed.stderr or '', file=sys.stderr)
+        raise RuntimeError(f"监控脚本运行失败 (退出码 {completed.returncode})")
+    path = env['LAST_ID_FILE']
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def accepted_targets(services):
+    return [target for text in services.accepted for target in TARGETS if f"## {target} " in text]
+
+def check_end_to_end(checks, verbose):
+    from standins import TimelineTemplates, start_nitter, start_services
+
+    print("端到端 (Webhook 限流时的状态推进):")
+    nitter = start_nitter(TimelineTemplates(load_fixtures()), latency=0.02)
+    services = start_services(latency=0, webhook_rate=2)
+    try:
+        with tempfile.TemporaryDirectory(prefix='check_delivery_') as workdir:
+            last_ids = run_monitor(workdir, nitter, services, verbose)
+            delivered = accepted_targets(services)
+            checks.expect(services.snapshot().get('webhook_throttle', 0) > 0, "Webhook 返回了 130101")
+            checks.expect(len(delivered) == 2, "限流下只有 2 个目标送达", delivered)
+            checks.expect(sorted(last_ids) == sorted(delivered), "last_id.json 只包含已送达的目标",
+                          f"{sorted(last_ids)} != {sorted(delivered)}")
+
+            services.webhook_rate = 0
+            last_ids = run_monitor(workdir, nitter, services, verbose)
+            delivered = accepted_targets(services)
+            checks.expect(sorted(last_ids) == sorted(TARGETS), "解除限流后全部目标推进", sorted(last_ids))
+            checks.expect(sorted(delivered) == sorted(TARGETS), "每个目标只推送一次", delivered)
+    finally:
+        nitter.close()
+        services.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="钉钉推送队列离线检查")
+    parser.add_argument('--verbose', action='store_true', help="输出监控脚本的日志")
+    args = parser.parse_args()
+
+    checks = Checks()
+    check_queue(checks)
+    check_end_to_end(checks, args.verbose)
+    print("全部通过" if not checks.failed else f"{checks.failed} 项检查失败")
+    sys.exit(1 if checks.failed else 0)
+
+if __name__ == '__main__':
+    main()
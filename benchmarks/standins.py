@@ -0,0 +1,297 @@
+"""
+离线基准测试使用的本地替身服务
+
+- NitterStandIn: 以 fixtures/ 中录制的单用户页面为模板，按目标改写用户名、推文 ID 与图片地址后返回时间线，
+  支持合并时间线 (/u1,u2)、带 ETag 的 RSS (/u/rss)、图片 (/img/...)，并可配置延迟、验证页与 403 的比例
+- ServicesStandIn: 翻译 (GTX single / t)、ImgBB 上传与钉钉 Webhook，统计各接口的请求次数；
+  Webhook 可按滑动窗口限流 (超出时返回 130101)，也可按顺序注入故障，并记录实际接受的消息
+"""
+import contextlib
+import hashlib
+import html
+import io
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from extractors import parse_timeline
+
+CHALLENGE_HTML = (
+    "<!DOCTYPE html><html><head><title>Just a moment...</title></head>"
+    "<body><h1>Verifying your browser</h1></body></html>"
+)
+TIMELINE_ITEM = '<div class="timeline-item'
+# redirect_stdout 替换的是全局 sys.stdout，并发请求同时解析时需要串行，否则可能恢复成别的线程的缓冲区
+_PARSE_LOCK = threading.Lock()
+SHOW_MORE = '<div class="show-more'
+# 钉钉 Webhook 的错误响应: 发送过快、系统繁忙、关键词校验失败 (不可重试)
+WEBHOOK_FAULTS = {
+    'throttle': {'errcode': 130101, 'errmsg': 'send too fast, exceed 20 times per minute'},
+    'busy': {'errcode': 130102, 'errmsg': 'system busy'},
+    'reject': {'errcode': 310000, 'errmsg': 'keywords not in content'},
+}
+
+def _digest(*parts):
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+class TimelineTemplates:
+    """
+    把录制的单用户页面改写成任意目标的时间线
+    不同目标得到互不相同的推文 ID 与图片地址，避免被跨目标去重与图床映射合并
+    """
+
+    def __init__(self, fixtures):
+        # 只使用单用户页面 (合并时间线与搜索页的结构不同)
+        self.templates = [(target, page) for _, _, target, page in fixtures
+                          if ',' not in target and ':' not in target]
+        if not self.templates:
+            raise ValueError("fixtures 中没有单用户页面")
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def render(self, user):
+        with self._lock:
+            page = self._cache.get(user)
+        if page is not None:
+            return page
+
+        owner, page = self.templates[int(_digest(user)[:8], 16) % len(self.templates)]
+        offset = int(_digest('id', user)[:6], 16)
+        page = re.sub(rf'(?<![\w.]){re.escape(owner)}(?![\w.])', user, page)
+        page = re.sub(r'/status/(\d+)', lambda m: f"/status/{int(m.group(1)) + offset}", page)
+        page = re.sub(r'(src|href|poster)="/pic/[^"]*"',
+                      lambda m: f'{m.group(1)}="/img/{_digest(user, m.group(0))[:16]}.jpg"', page)
+        with self._lock:
+            self._cache[user] = page
+        return page
+
+    def render_combined(self, users):
+        """
+        合并时间线: 各用户的推文轮流排列，套用第一个用户页面的外壳
+        """
+        pages = [self.render(user) for user in users]
+        items = []
+        for page in pages:
+            start = page.find(TIMELINE_ITEM)
+            end = page.find(SHOW_MORE, start)
+            region = page[start:end if end != -1 else len(page)]
+            items.append([TIMELINE_ITEM + part for part in region.split(TIMELINE_ITEM)[1:]])
+        merged = [item for row in zip(*items) for item in row]
+        first = pages[0]
+        start = first.find(TIMELINE_ITEM)
+        end = first.find(SHOW_MORE, start)
+        return first[:start] + ''.join(merged) + (first[end:] if end != -1 else '')
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, **attrs):
+        super().__init__(('127.0.0.1', 0), handler)
+        for key, value in attrs.items():
+            setattr(self, key, value)
+        self.counts = {}
+        self.counts_lock = threading.Lock()
+        self.rng = random.Random(attrs.get('seed', 0))
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name):
+        with self.counts_lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def snapshot(self):
+        with self.counts_lock:
+            return dict(self.counts)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _delay(self, seconds):
+        if seconds > 0:
+            with self.server.counts_lock:
+                factor = self.server.rng.uniform(0.5, 1.5)
+            time.sleep(seconds * factor)
+
+    def _roll(self, rate):
+        if rate <= 0:
+            return False
+        with self.server.counts_lock:
+            return self.server.rng.random() < rate
+
+    def _send(self, status, body, content_type='text/html; charset=utf-8', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_json(self, obj):
+        self._send(200, json.dumps(obj, ensure_ascii=False), 'application/json; charset=utf-8')
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+class NitterHandler(_Handler):
+
+    def do_GET(self):
+        path = urllib.parse.unquote(urllib.parse.urlparse(self.path).path).strip('/')
+        if path.startswith('img/'):
+            self.server.count('image')
+            self._delay(self.server.latency / 4)
+            self._send(200, self.server.image_bytes, 'image/jpeg')
+            return
+        if not path or path.startswith('search'):
+            self._send(404, 'not found')
+            return
+
+        self._delay(self.server.latency)
+        if self._roll(self.server.forbidden_rate):
+            self.server.count('403')
+            self._send(403, 'Forbidden')
+            return
+        if self._roll(self.server.challenge_rate):
+            self.server.count('challenge')
+            self._send(200, CHALLENGE_HTML)
+            return
+
+        if path.endswith('/rss'):
+            self.server.count('rss')
+            body, etag = self._rss(path[:-len('/rss')])
+            if self.headers.get('If-None-Match') == etag:
+                self.server.count('rss_304')
+                self._send(304, b'', headers={'ETag': etag})
+            else:
+                self._send(200, body, 'application/rss+xml; charset=utf-8', {'ETag': etag})
+            return
+
+        users = [user for user in path.split(',') if user]
+        self.server.count('timeline')
+        templates = self.server.templates
+        page = templates.render(users[0]) if len(users) == 1 else templates.render_combined(users)
+        self._send(200, page)
+
+    def _rss(self, user):
+        cache = self.server.rss_cache
+        with self.server.counts_lock:
+            cached = cache.get(user)
+        if cached:
+            return cached
+        with _PARSE_LOCK, contextlib.redirect_stdout(io.StringIO()):
+            tweets = parse_timeline(self.server.templates.render(user), self.server.url, user,
+                                    scan_limit=None, max_tweets=None) or []
+        items = []
+        for index, tweet in enumerate(tweets):
+            summary = html.escape(tweet['content']) + ''.join(
+                f'<img src="{html.escape(src)}" />' for src in tweet['images']
+            )
+            title = (f"RT by @{user}: " if tweet['is_retweet'] else '') + tweet['content'][:80]
+            link = f"{self.server.url}/{user}/status/{tweet['guid']}#m"
+            items.append(
+                f"<item><title>{html.escape(title)}</title><dc:creator>{html.escape(tweet['author'])}</dc:creator>"
+                f"<description>{html.escape(summary)}</description>"
+                f"<pubDate>{formatdate(1700000000 - index * 3600, usegmt=True)}</pubDate>"
+                f"<guid>{html.escape(link)}</guid><link>{html.escape(link)}</link></item>"
+            )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0" xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>'
+            f"<title>{html.escape(user)} / nitter</title><link>{self.server.url}/{user}</link>"
+            + ''.join(items) + '</channel></rss>'
+        )
+        result = (body, f'"{_digest(body)[:16]}"')
+        with self.server.counts_lock:
+            cache[user] = result
+        return result
+
+class ServicesHandler(_Handler):
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        if parsed.path.endswith('/translate_a/single'):
+            self.server.count('translate')
+            self._delay(self.server.latency)
+            text = urllib.parse.parse_qs(parsed.query).get('q', [''])[0]
+            self._send_json([[[f"[译] {text}", text]], None, "en"])
+        elif parsed.path.startswith('/hosted/'):
+            self._send(200, b'', 'image/jpeg')
+        else:
+            self._send(404, 'not found')
+
+    def do_POST(self):
+        parsed = urllib.parse.urlparse(self.path)
+        body = self._read_body()
+        self._delay(self.server.latency)
+        if parsed.path.endswith('/translate_a/t'):
+            self.server.count('translate_batch')
+            texts = urllib.parse.parse_qs(body.decode('utf-8')).get('q', [])
+            self._send_json([[f"[译] {text}", "en"] for text in texts])
+        elif parsed.path.endswith('/upload'):
+            self.server.count('upload')
+            self._send_json({'success': True, 'data': {'url': f"{self.server.url}/hosted/{_digest(str(len(body)), str(time.time()))[:16]}.jpg"}})
+        elif parsed.path.endswith('/robot/send'):
+            self.server.count('webhook')
+            self._robot_send(body)
+        else:
+            self._send(404, 'not found')
+
+    def _robot_send(self, body):
+        server = self.server
+        now = time.monotonic()
+        with server.counts_lock:
+            fault = server.webhook_faults.pop(0) if server.webhook_faults else None
+            if fault is None and server.webhook_rate > 0:
+                # 与钉钉一致: 最近 60 秒内超过 webhook_rate 条时拒绝
+                server.webhook_sent[:] = [t for t in server.webhook_sent if now - t < 60]
+                if len(server.webhook_sent) >= server.webhook_rate:
+                    fault = 'throttle'
+            if fault is None:
+                server.webhook_sent.append(now)
+                server.accepted.append(json.loads(body.decode('utf-8'))['markdown']['text'])
+        if fault is not None:
+            server.count(f"webhook_{fault}")
+        if fault in WEBHOOK_FAULTS:
+            self._send_json(WEBHOOK_FAULTS[fault])
+        elif fault is not None:
+            self._send(int(fault), 'error')
+        else:
+            self._send_json({'errcode': 0, 'errmsg': 'ok'})
+
+def start_nitter(templates, latency=0.2, challenge_rate=0.0, forbidden_rate=0.0, image_size=100 * 1024, seed=0):
+    """
+    启动一个 Nitter 替身，latency 为平均延迟秒数 (实际在 0.5x-1.5x 之间抖动)
+    """
+    image_bytes = random.Random(seed).randbytes(image_size)
+    return _StandInServer(NitterHandler, templates=templates, latency=latency, challenge_rate=challenge_rate,
+                          forbidden_rate=forbidden_rate, image_bytes=image_bytes, rss_cache={}, seed=seed)
+
+def start_services(latency=0.05, seed=0, webhook_rate=0, webhook_faults=()):
+    """
+    启动翻译 / ImgBB / 钉钉 Webhook 替身，返回服务器 (server.url 为地址)
+    webhook_rate: Webhook 每 60 秒最多接受的消息数 (0 表示不限)；
+    webhook_faults: 依次用于接下来各个 Webhook 请求的故障 (WEBHOOK_FAULTS 中的名称或 HTTP 状态码，如 '500'、'429')；
+    server.accepted 为 Webhook 实际接受的消息正文
+    """
+    return _StandInServer(ServicesHandler, latency=latency, seed=seed, webhook_rate=webhook_rate,
+                          webhook_faults=list(webhook_faults), webhook_sent=[], accepted=[])
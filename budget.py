@@ -0,0 +1,49 @@
+import time
+
+def timeout_until(default, until=None, minimum=1.0):
+    """
+    单次请求的超时秒数: 不超过 default，也不越过 until (time.time() 时间点)；until 为空时返回 default
+    """
+    if until is None:
+        return default
+    return max(minimum, min(default, until - time.time()))
+
+class CycleBudget:
+    """
+    单次运行 (非循环模式) 的时间预算
+    deadline 为必须结束的时间点 (time.time())；抓取在 deadline - reserve 之前结束，余下的时间留给翻译、推送与保存状态，
+    其中最后 save_margin 秒只用于保存状态。抓取时把剩余时间平均分给尚未抓取的目标，每个目标的时间片再约束各实例的超时
+    """
+
+    def __init__(self, deadline, reserve=60, save_margin=10, min_window=5):
+        self.deadline = deadline
+        self.reserve = reserve
+        self.save_margin = min(save_margin, reserve / 2)
+        self.min_window = min_window
+
+    def remaining(self, margin=0):
+        return self.deadline - time.time() - margin
+
+    def fetch_remaining(self):
+        return self.remaining(self.reserve)
+
+    def target_window(self, targets_left, count=1):
+        """
+        下一个目标 (合并时间线时为 count 个目标) 可用的抓取秒数；抓取阶段剩余不足 min_window 秒时返回 None
+        """
+        left = self.fetch_remaining()
+        if left < self.min_window:
+            return None
+        return max(self.min_window, left * count / max(1, targets_left))
+
+    def can_prepare(self):
+        """
+        是否还有时间准备新的消息 (翻译、上传图片)；剩余时间不足预留时间的一半时只推送已准备好的消息
+        """
+        return self.remaining() >= self.reserve / 2
+
+    def delivery_window(self):
+        """
+        推送阶段最多还能等待的秒数 (扣除保存状态的时间)
+        """
+        return max(0.0, self.remaining(self.save_margin))
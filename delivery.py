@@ -0,0 +1,215 @@
+import random
+import threading
+import time
+
+from fetch_tiers import get_http_session
+from metrics import incr, timer
+
+# 钉钉机器人限流相关的错误码: 130101 发送过快 (每分钟超过 20 条)，130102 系统繁忙
+THROTTLE_ERRCODES = {130101, 130102}
+# 单条 markdown 消息的最大字节数 (钉钉上限约 20000 字节，留出余量)
+MAX_MESSAGE_BYTES = 18000
+COALESCE_SEPARATOR = "\n\n***\n\n"
+
+class TokenBucket:
+    """
+    令牌桶限流: 容量 capacity，每 per 秒补充 capacity 个令牌
+    """
+
+    def __init__(self, capacity=20, per=60.0):
+        self.capacity = max(1, capacity)
+        self.rate = self.capacity / per
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return int(self.tokens)
+
+    def acquire(self, timeout=None):
+        """
+        取一个令牌，必要时阻塞等待；超过 timeout 秒仍拿不到时返回 False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def wait_time(self):
+        """
+        距离下一个令牌可用还需等待的秒数
+        """
+        with self._lock:
+            self._refill()
+            return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def drain(self):
+        """
+        服务端已判定限流时清空令牌，按补充速度重新积累
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = 0.0
+
+class Message:
+    """
+    待推送的一条 markdown 消息及其携带的推文 [(target, guid), ...]
+    """
+
+    def __init__(self, target, guid, title, text):
+        self.title = title
+        self.text = text
+        self.entries = [(target, guid)]
+
+    def __repr__(self):
+        return f"Message({', '.join(target for target, _ in self.entries)})"
+
+def coalesce_messages(messages, slots, max_per_message=5):
+    """
+    把按顺序排列的消息合并成不超过 slots 条 (每条最多 max_per_message 条推文、不超过 MAX_MESSAGE_BYTES)
+    slots 不足以容纳全部推文时，合并后的条数可能仍多于 slots，剩余的由调用方等待令牌
+    """
+    if len(messages) <= max(1, slots):
+        return list(messages)
+    per_message = min(max_per_message, -(-len(messages) // max(1, slots)))
+
+    merged = []
+    group = []
+    for message in messages:
+        size = sum(len(m.text.encode('utf-8')) for m in group) + len(message.text.encode('utf-8'))
+        if group and (len(group) >= per_message or size > MAX_MESSAGE_BYTES):
+            merged.append(_merge(group))
+            group = []
+        group.append(message)
+    if group:
+        merged.append(_merge(group))
+    return merged
+
+def _merge(group):
+    if len(group) == 1:
+        return group[0]
+    targets = list(dict.fromkeys(target for m in group for target, _ in m.entries))
+    message = Message(None, None, f"Twitter 监控: {len(group)} 条更新 ({', '.join(targets)})",
+                      COALESCE_SEPARATOR.join(m.text for m in group))
+    message.entries = [entry for m in group for entry in m.entries]
+    return message
+
+class DingTalkDelivery:
+    """
+    钉钉推送队列
+    复用连接池会话，按令牌桶控制发送速度 (默认每分钟 20 条)；
+    遇到限流错误码、网络异常或 5xx 时按指数退避重试；
+    队列积压超过当前可用令牌时把多条推文合并成一条 markdown 消息
+    """
+
+    def __init__(self, webhook_url, rate=20, per=60.0, max_retries=3, coalesce=True, max_per_message=5,
+                 max_wait=120.0, base_backoff=2.0, timeout=10):
+        self.webhook_url = webhook_url
+        self.bucket = TokenBucket(rate, per)
+        self.max_retries = max_retries
+        self.coalesce = coalesce
+        self.max_per_message = max(1, max_per_message)
+        self.max_wait = max_wait
+        self.base_backoff = base_backoff
+        self.timeout = timeout
+
+    def post(self, message, deadline=None):
+        """
+        发送一条消息 (含重试)，成功返回 True
+        deadline: time.monotonic() 时间点，超过后不再等待发送配额
+        """
+        label = ', '.join(target for target, _ in message.entries)
+        data = {
+            "msgtype": "markdown",
+            "markdown": {
+                "title": message.title,
+                "text": message.text
+            }
+        }
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                incr('dingtalk_retry', target=label)
+                backoff = min(60.0, self.base_backoff * (2 ** (attempt - 1))) * random.uniform(0.8, 1.2)
+                if deadline is not None and time.monotonic() + backoff > deadline:
+                    print(f"[{label}] 剩余时间不足以重试，留待下一轮推送")
+                    return False
+                print(f"[{label}] {backoff:.1f}s 后第 {attempt} 次重试钉钉推送")
+                time.sleep(backoff)
+            timeout = self.max_wait if deadline is None else max(0.0, deadline - time.monotonic())
+            with timer('dingtalk_quota_wait', label):
+                acquired = self.bucket.acquire(timeout)
+            if not acquired:
+                print(f"[{label}] 等待发送配额超时，留待下一轮推送")
+                return False
+
+            try:
+                with timer('dingtalk_post', label):
+                    resp = get_http_session().post(self.webhook_url, json=data, timeout=self.timeout)
+            except Exception as e:
+                print(f"[{label}] 钉钉请求异常: {e}")
+                continue
+            if resp.status_code >= 500 or resp.status_code == 429:
+                print(f"[{label}] 钉钉服务端错误: HTTP {resp.status_code}")
+                continue
+            try:
+                result = resp.json()
+            except ValueError:
+                print(f"[{label}] 钉钉返回无法解析: HTTP {resp.status_code} {resp.text[:200]}")
+                return False
+
+            if result.get('errcode') == 0:
+                print(f"[{label}] 钉钉推送成功")
+                return True
+            if result.get('errcode') in THROTTLE_ERRCODES:
+                print(f"[{label}] 钉钉限流: {result}")
+                incr('dingtalk_throttled', target=label)
+                self.bucket.drain()
+                continue
+            # 其他错误 (关键词/签名校验失败等) 重试也无济于事
+            print(f"[{label}] 钉钉推送失败: {result}")
+            return False
+        return False
+
+    def deliver(self, messages, max_wait=None, on_delivered=None):
+        """
+        按顺序推送消息，返回成功送达的 [(target, guid), ...]
+        max_wait: 覆盖整个队列等待配额的总时长；on_delivered: 每条消息送达后以其 entries 调用，用于及时保存进度
+        """
+        if not self.webhook_url:
+            print("未配置 DINGTALK_WEBHOOK，跳过发送")
+            return []
+
+        queue = list(messages)
+        if self.coalesce and self.max_per_message > 1:
+            slots = self.bucket.available()
+            merged = coalesce_messages(queue, slots, self.max_per_message)
+            if len(merged) < len(queue):
+                print(f"[系统] 推送积压 {len(queue)} 条 (当前配额 {slots})，合并为 {len(merged)} 条消息")
+            queue = merged
+
+        # 整个队列等待配额的总时长不超过 max_wait，未发出的推文留待下一轮
+        deadline = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+        delivered = []
+        for index, message in enumerate(queue):
+            if self.bucket.wait_time() > deadline - time.monotonic():
+                print(f"[系统] 发送配额不足，剩余 {len(queue) - index} 条消息留待下一轮推送")
+                break
+            if self.post(message, deadline):
+                delivered.extend(message.entries)
+                if on_delivered:
+                    on_delivered(message.entries)
+        return delivered
@@ -0,0 +1,267 @@
+import re
+
+import nitter
+from nitter import extract_tweet_id, get_original_image_url, retweeter_name, split_target
+
+# 可插拔的时间线解析后端
+# bs4 为参考实现 (nitter.parse_timeline，整页构建 BeautifulSoup 树)；
+# lxml / selectolax 只解析从第一条 .timeline-item 开始的时间线区域，并使用预编译的查询提取字段
+try:
+    from lxml import etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+BACKEND_BS4 = 'bs4'
+BACKEND_LXML = 'lxml'
+BACKEND_SELECTOLAX = 'selectolax'
+# auto 时按速度从快到慢选择第一个可用的后端
+ALL_BACKENDS = [BACKEND_SELECTOLAX, BACKEND_LXML, BACKEND_BS4]
+
+# 时间线区域的起点: 第一个带 timeline-item 类的标签
+TIMELINE_START_RE = re.compile(r'<[a-zA-Z][^>]*?\sclass\s*=\s*["\']?[^"\'>]*?\btimeline-item\b(?!-)')
+
+IMAGE_CONTAINERS = ('.attachment.image', '.tweet-image', '.still-image', '.attachments')
+
+_default_backend = 'auto'
+
+def available_backends():
+    """
+    当前环境可用的后端 (按速度从快到慢)
+    """
+    installed = {
+        BACKEND_SELECTOLAX: LexborHTMLParser is not None,
+        BACKEND_LXML: lxml is not None,
+        BACKEND_BS4: True,
+    }
+    return [name for name in ALL_BACKENDS if installed[name]]
+
+def resolve_backend(name=None):
+    """
+    将配置的后端名 (auto / bs4 / lxml / selectolax) 解析为实际可用的后端，未安装时退回下一个可用的
+    """
+    name = (name or _default_backend or 'auto').strip().lower()
+    available = available_backends()
+    if name in available:
+        return name
+    if name != 'auto':
+        print(f"[解析] 后端 {name} 不可用，改用 {available[0]}")
+    return available[0]
+
+def set_default_backend(name):
+    global _default_backend
+    _default_backend = resolve_backend(name)
+    return _default_backend
+
+def timeline_region(html):
+    """
+    截取从第一条推文开始的页面片段，跳过 <head>、导航栏与资料卡；找不到推文时返回整页
+    """
+    match = TIMELINE_START_RE.search(html)
+    return html[match.start():] if match else html
+
+def _absolute_url(src, instance):
+    if src.startswith('//'):
+        return 'https:' + src
+    if src.startswith('/'):
+        return instance.rstrip('/') + src
+    return src
+
+def _parent_is_avatar(parent_class):
+    # 排除头像 (通常在 .tweet-avatar 或 .profile-card-avatar 中)
+    return any(c in (parent_class or '') for c in ['avatar', 'profile'])
+
+def build_tweet(instance, keyword, retweet_header, image_srcs, video_src, poster, content, link_href, published, author,
+                author_name):
+    """
+    由各后端提取出的原始字段组装推文字典，URL 还原与过滤规则与参考实现 nitter.parse_tweet_item 一致
+    retweet_header: 转发标记的文本，不是转发时为 None
+    image_srcs: 已排除头像的 img src 列表 (页面顺序)
+    """
+    images = []
+    for src in image_srcs:
+        if not src:
+            continue
+        full_src = get_original_image_url(_absolute_url(src, instance))
+        # 过滤掉一些明显的表情包或小图标
+        if 'emoji' in src.lower() or 'hashtag_click' in src:
+            continue
+        images.append(full_src)
+
+    if poster:
+        full_poster = get_original_image_url(_absolute_url(poster, instance))
+        if full_poster not in images:
+            images.append(full_poster)
+
+    return {
+        'content': content,
+        'link': instance.rstrip('/') + link_href,
+        'published': published,
+        'author': author if author is not None else keyword,
+        'author_name': author_name or '',
+        'guid': extract_tweet_id(link_href),
+        'is_retweet': retweet_header is not None,
+        'retweeted_by': retweeter_name(retweet_header) if retweet_header is not None else None,
+        'images': images,
+        'video_url': _absolute_url(video_src, instance) if video_src else None
+    }
+
+def _xpath_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+if lxml is not None:
+    _LXML_ITEMS = etree.XPath(f"//*[{_xpath_class('timeline-item')}]")
+    _LXML_PINNED = etree.XPath(f"boolean(.//*[{_xpath_class('pinned')}])")
+    _LXML_RETWEET = etree.XPath(f"(.//*[{_xpath_class('retweet-header')}])[1]")
+    _LXML_IMAGES = etree.XPath(
+        ".//img[ancestor::*[{} and {}] or ancestor::*[{}] or ancestor::*[{}] or ancestor::*[{}]]".format(
+            _xpath_class('attachment'), _xpath_class('image'), _xpath_class('tweet-image'),
+            _xpath_class('still-image'), _xpath_class('attachments'),
+        )
+    )
+    _LXML_VIDEO_SOURCE = etree.XPath("(.//source[ancestor::video])[1]")
+    _LXML_VIDEO = etree.XPath("(.//video)[1]")
+    _LXML_CONTENT = etree.XPath(f"(.//*[{_xpath_class('tweet-content')}])[1]")
+    _LXML_LINK = etree.XPath(f"(.//*[{_xpath_class('tweet-link')}])[1]")
+    _LXML_DATE = etree.XPath(f"(.//a[ancestor::*[{_xpath_class('tweet-date')}]])[1]")
+    _LXML_USERNAME = etree.XPath(f"(.//*[{_xpath_class('username')}])[1]")
+    _LXML_FULLNAME = etree.XPath(f"(.//*[{_xpath_class('fullname')}])[1]")
+
+def _lxml_first(query, item):
+    found = query(item)
+    return found[0] if found else None
+
+def _lxml_text(el):
+    return ''.join(s.strip() for s in el.itertext())
+
+def _lxml_items(html):
+    region = timeline_region(html)
+    if not region.strip():
+        return []
+    return _LXML_ITEMS(lxml.html.document_fromstring(region))
+
+def _lxml_extract(item, instance, target, keyword):
+    if _LXML_PINNED(item):
+        print(f"[{target}] 发现置顶推文，跳过")
+        return None
+
+    content_el = _lxml_first(_LXML_CONTENT, item)
+    link_el = _lxml_first(_LXML_LINK, item)
+    if content_el is None or link_el is None:
+        return None
+
+    image_srcs = [
+        img.get('src', '') for img in _LXML_IMAGES(item)
+        if not _parent_is_avatar(img.getparent().get('class'))
+    ]
+    video_el = _lxml_first(_LXML_VIDEO_SOURCE, item)
+    if video_el is None:
+        video_el = _lxml_first(_LXML_VIDEO, item)
+    has_video = video_el is not None
+    poster_el = _lxml_first(_LXML_VIDEO, item) if has_video else None
+    date_el = _lxml_first(_LXML_DATE, item)
+    author_el = _lxml_first(_LXML_USERNAME, item)
+    fullname_el = _lxml_first(_LXML_FULLNAME, item)
+    retweet_el = _lxml_first(_LXML_RETWEET, item)
+
+    return build_tweet(
+        instance, keyword,
+        retweet_header=_lxml_text(retweet_el) if retweet_el is not None else None,
+        image_srcs=image_srcs,
+        video_src=video_el.get('src', '') if has_video else None,
+        poster=poster_el.get('poster', '') if poster_el is not None else None,
+        content=_lxml_text(content_el),
+        link_href=link_el.get('href', ''),
+        published=date_el.get('title', '') if date_el is not None else 'Unknown Time',
+        author=_lxml_text(author_el) if author_el is not None else None,
+        author_name=_lxml_text(fullname_el) if fullname_el is not None else None,
+    )
+
+_SELECTOLAX_IMAGES = ':is({}) img'.format(', '.join(IMAGE_CONTAINERS))
+
+def _selectolax_attr(el, name):
+    return el.attributes.get(name) or ''
+
+def _selectolax_text(el):
+    return el.text(deep=True, separator='', strip=True)
+
+def _selectolax_items(html):
+    return LexborHTMLParser(timeline_region(html)).css('.timeline-item')
+
+def _selectolax_extract(item, instance, target, keyword):
+    if item.css_first('.pinned') is not None:
+        print(f"[{target}] 发现置顶推文，跳过")
+        return None
+
+    content_el = item.css_first('.tweet-content')
+    link_el = item.css_first('.tweet-link')
+    if content_el is None or link_el is None:
+        return None
+
+    image_srcs = [
+        _selectolax_attr(img, 'src') for img in item.css(_SELECTOLAX_IMAGES)
+        if not _parent_is_avatar(img.parent.attributes.get('class'))
+    ]
+    video_el = item.css_first('video source')
+    if video_el is None:
+        video_el = item.css_first('video')
+    has_video = video_el is not None
+    poster_el = item.css_first('video') if has_video else None
+    date_el = item.css_first('.tweet-date a')
+    author_el = item.css_first('.username')
+    fullname_el = item.css_first('.fullname')
+    retweet_el = item.css_first('.retweet-header')
+
+    return build_tweet(
+        instance, keyword,
+        retweet_header=_selectolax_text(retweet_el) if retweet_el is not None else None,
+        image_srcs=image_srcs,
+        video_src=_selectolax_attr(video_el, 'src') if has_video else None,
+        poster=_selectolax_attr(poster_el, 'poster') if poster_el is not None else None,
+        content=_selectolax_text(content_el),
+        link_href=_selectolax_attr(link_el, 'href'),
+        published=_selectolax_attr(date_el, 'title') if date_el is not None else 'Unknown Time',
+        author=_selectolax_text(author_el) if author_el is not None else None,
+        author_name=_selectolax_text(fullname_el) if fullname_el is not None else None,
+    )
+
+_BACKEND_FUNCS = {
+    BACKEND_LXML: (_lxml_items, _lxml_extract),
+    BACKEND_SELECTOLAX: (_selectolax_items, _selectolax_extract),
+}
+
+def parse_timeline(html, instance, target, scan_limit=8, max_tweets=1, backend=None):
+    """
+    解析 Nitter 时间线页面，返回值与日志和参考实现 nitter.parse_timeline 一致:
+    按页面顺序排列的非置顶推文列表，页面上没有任何 .timeline-item 时返回 None
+    backend 为 None 时使用 set_default_backend 配置的后端
+    """
+    backend = resolve_backend(backend)
+    if backend == BACKEND_BS4:
+        return nitter.parse_timeline(html, instance, target, scan_limit, max_tweets)
+
+    find_items, extract = _BACKEND_FUNCS[backend]
+    _, keyword = split_target(target)
+
+    items = find_items(html)
+    if not items:
+        print(f"[{target}] 在实例 {instance} 上未发现推文内容")
+        return None
+
+    valid_tweets = []
+    for item in items[:scan_limit]:
+        tweet_data = extract(item, instance, target, keyword)
+        if not tweet_data:
+            continue
+        valid_tweets.append(tweet_data)
+        if max_tweets and len(valid_tweets) >= max_tweets:
+            break
+
+    if not valid_tweets:
+        print(f"[{target}] {instance} 页面上未找到符合条件的非置顶推文")
+    return valid_tweets
@@ -0,0 +1,228 @@
+import json
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+from nitter import build_target_url, get_random_user_agent, is_challenge_page, split_target
+
+# 抓取层级 (按成本从低到高): RSS 条件请求 -> 普通 HTTP 请求静态 HTML -> 浏览器
+# 遇到挑战页/403/空时间线/实例未开放 RSS 时才升级到下一层
+TIER_RSS = 'rss'
+TIER_HTTP = 'http'
+TIER_BROWSER = 'browser'
+ALL_TIERS = [TIER_RSS, TIER_HTTP, TIER_BROWSER]
+
+# 这些结果说明需要更高成本的层级才能拿到内容，值得升级重试
+ESCALATE_REASONS = {'challenge', '403', 'empty', 'no_feed'}
+ESCALATE_MESSAGES = {
+    TIER_RSS: "RSS 结果为 {reason}，升级为页面抓取",
+    TIER_HTTP: "静态请求结果为 {reason}，升级为浏览器加载",
+}
+
+_session = None
+
+def get_http_session():
+    """
+    进程内共享的连接池会话，复用与各 Nitter 实例之间的 TCP/TLS 连接
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session = session
+    return _session
+
+def fetch_http(instance, target, timeout=15, user_agent=None, cookies=None):
+    """
+    使用普通 HTTP 请求获取时间线 HTML
+    user_agent / cookies: 浏览器通过验证后缓存的 UA 与 cookies，可让静态请求直接复用验证结果
+    返回 (html, reason)，reason 为 None 表示页面可直接解析，
+    否则为 'challenge' / '403' / 'empty' / 'error'
+    """
+    url = build_target_url(instance, target)
+    print(f"[{target}] 正在请求: {url}")
+    try:
+        resp = get_http_session().get(url, timeout=(5, timeout), cookies=cookies, headers={
+            'User-Agent': user_agent or get_random_user_agent(),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9',
+        })
+    except Exception as e:
+        print(f"[{target}] 请求 {instance} 失败: {e}")
+        return None, 'error'
+
+    if resp.status_code == 403:
+        return None, '403'
+    # 未声明编码时 requests 会按 ISO-8859-1 解码，Nitter 页面实际都是 UTF-8
+    if 'charset' not in resp.headers.get('Content-Type', '').lower():
+        resp.encoding = 'utf-8'
+    html = resp.text
+    if is_challenge_page(html):
+        return None, 'challenge'
+    if resp.status_code != 200:
+        print(f"[{target}] 请求 {instance} 返回 HTTP {resp.status_code}")
+        return None, 'error'
+    if 'timeline-item' not in html:
+        return None, 'empty'
+    return html, None
+
+def enabled_tiers(tiers_str):
+    """
+    解析 FETCH_TIERS 配置 (逗号分隔)，忽略未知层级，并按成本从低到高排序
+    """
+    tiers = [t.strip().lower() for t in (tiers_str or '').split(',') if t.strip()]
+    tiers = [t for t in ALL_TIERS if t in tiers]
+    return tiers or [TIER_BROWSER]
+
+class TierMemory:
+    """
+    记录每个实例上次成功使用的抓取层级，下一轮直接从该层级开始
+    只需要浏览器的实例在 retry_after 秒后会重新尝试一次低成本层级
+    关键词搜索与用户时间线在同一实例上的表现不同 (如搜索 RSS 未开放)，两者分开记录，互不降级
+    """
+
+    def __init__(self, path=None, tiers=None, retry_after=6 * 3600):
+        self.path = path
+        self.tiers = tiers or list(ALL_TIERS)
+        self.retry_after = retry_after
+        self._data = None
+        self._dirty = False
+
+    def _load(self):
+        if self._data is not None:
+            return
+        self._data = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._data = data
+            except Exception as e:
+                print(f"[系统] 加载抓取层级缓存失败: {e}")
+
+    @staticmethod
+    def _key(instance, target):
+        # 用户目标沿用实例地址作为键 (兼容已有的缓存文件)，关键词搜索单独记录
+        is_search, _ = split_target(target)
+        return f"{instance} search" if is_search else instance
+
+    def plan(self, instance, target):
+        """
+        返回该实例上抓取此类目标 (用户 / 关键词搜索) 本次应依次尝试的层级
+        """
+        self._load()
+        entry = self._data.get(self._key(instance, target))
+        if entry and entry.get('tier') in self.tiers:
+            start = self.tiers.index(entry['tier'])
+            if start > 0 and time.time() - entry.get('updated', 0) < self.retry_after:
+                return self.tiers[start:]
+        return list(self.tiers)
+
+    def record(self, instance, target, tier):
+        self._load()
+        key = self._key(instance, target)
+        entry = self._data.get(key)
+        # 冷却期内同一层级持续可用时不刷新时间戳，保证到期后能重新探测低成本层级；
+        # 到期后的探测失败再次落到同一层级时才重新计时
+        if entry and entry.get('tier') == tier:
+            if tier == self.tiers[0] or time.time() - entry.get('updated', 0) < self.retry_after:
+                return
+        self._data[key] = {'tier': tier, 'updated': int(time.time())}
+        self._dirty = True
+
+    def snapshot(self):
+        self._load()
+        return json.loads(json.dumps(self._data))
+
+    def merge(self, entries):
+        if not entries:
+            return
+        self._load()
+        self._data.update(entries)
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty or not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except Exception as e:
+            print(f"[系统] 保存抓取层级缓存失败: {e}")
+
+class TierAttempt:
+    """
+    一个目标在一个实例上的分层抓取: 层级计划、升级判断以及结果记账 (抓取层级、实例健康度、指标)
+    同步与异步引擎共用，引擎只负责执行各层级的 I/O:
+
+        attempt = TierAttempt(tier_memory, health, target, instance)
+        for tier in attempt.tiers():
+            ..., reason = <执行该层级>
+            attempt.result(tier, reason)
+        return attempt.finish(tweets)
+    """
+
+    def __init__(self, memory, health, target, instance):
+        self.memory = memory
+        self.health = health
+        self.target = target
+        self.instance = instance
+        self.started = time.time()
+        self.challenged = False
+        # 最后一个层级的结果，None 表示拿到了可解析的内容
+        self.reason = 'error'
+        self._done = False
+
+    def tiers(self):
+        """
+        依次产出应尝试的层级，某一层级成功或失败原因不值得升级时停止
+        """
+        for tier in self.memory.plan(self.instance, self.target):
+            if self._done:
+                return
+            yield tier
+
+    def result(self, tier, reason):
+        self.reason = reason
+        self.challenged = self.challenged or reason == 'challenge'
+        if reason is None:
+            self.memory.record(self.instance, self.target, tier)
+            self._done = True
+        elif tier == TIER_BROWSER or reason not in ESCALATE_REASONS:
+            self._done = True
+        else:
+            print(f"[{self.target}] {self.instance} " + ESCALATE_MESSAGES[tier].format(reason=reason))
+
+    def finish(self, tweets):
+        """
+        把耗时与结果记入指标和实例健康度并返回 tweets；tweets 为 None 时记为失败 (页面可解析但没有推文时原因为 empty)
+        """
+        latency = time.time() - self.started
+        METRICS.observe('scrape', latency, self.target, self.instance)
+        if tweets is not None:
+            self.health.record_success(self.instance, latency, self.challenged)
+        else:
+            reason = self.reason or 'empty'
+            METRICS.incr(f"scrape_{reason}", target=self.target, instance=self.instance)
+            self.health.record_failure(self.instance, latency, reason, self.challenged)
+        return tweets
+
+    def cancel(self, min_elapsed=0):
+        """
+        请求被取消 (对冲中输掉或时间预算用完): 已运行的时间作为延迟的下限记入实例健康度，否则慢实例的排名永远不受影响；
+        不计为失败，不会触发熔断。运行不足 min_elapsed 秒 (对冲延迟) 就被取消的说明不了它慢，不记录
+        """
+        elapsed = time.time() - self.started
+        if elapsed < min_elapsed:
+            return
+        METRICS.incr('scrape_hedged', target=self.target, instance=self.instance)
+        self.health.record_slow(self.instance, elapsed)
@@ -0,0 +1,246 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fetch_tiers import get_http_session
+from metrics import incr, timer
+from nitter import get_original_image_url, get_random_user_agent
+
+IMGBB_UPLOAD_URL = os.environ.get('IMGBB_UPLOAD_URL', 'https://api.imgbb.com/1/upload')
+# 下载时超过该大小的图片落盘暂存，避免整张图片常驻内存
+SPOOL_MAX_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+def media_key(image_url):
+    """
+    同一张媒体的归一化键: 还原为 Twitter 原图地址，并忽略尺寸参数 (name=small/large/orig)
+    """
+    original = get_original_image_url(image_url)
+    parsed = urllib.parse.urlparse(original)
+    if parsed.hostname != 'pbs.twimg.com':
+        return original
+    query = urllib.parse.parse_qs(parsed.query)
+    path = parsed.path
+    fmt = (query.get('format') or [None])[0]
+    if not fmt and '.' in path.rsplit('/', 1)[-1]:
+        path, fmt = path.rsplit('.', 1)
+    return f"pbs.twimg.com{path}.{fmt}" if fmt else f"pbs.twimg.com{path}"
+
+class MediaMap:
+    """
+    持久化的 "媒体 -> 图床地址" 映射，同一张图片只上传一次
+    超过 max_entries 时淘汰最早写入的条目
+    """
+
+    def __init__(self, path=None, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._data = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._data is not None:
+            return
+        self._data = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._data = data
+            except Exception as e:
+                print(f"[系统] 加载图床映射失败: {e}")
+
+    def get(self, key):
+        with self._lock:
+            self._load()
+            entry = self._data.get(key)
+            return entry['url'] if entry else None
+
+    def put(self, key, url):
+        with self._lock:
+            self._load()
+            self._data.pop(key, None)
+            self._data[key] = {'url': url, 'uploaded_at': int(time.time())}
+            for old_key in list(self._data)[:max(0, len(self._data) - self.max_entries)]:
+                del self._data[old_key]
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except Exception as e:
+                print(f"[系统] 保存图床映射失败: {e}")
+
+class MultipartStream:
+    """
+    流式 multipart/form-data 请求体: 按块读取暂存的图片文件，并提供总长度以便 requests 设置 Content-Length
+    """
+
+    def __init__(self, fields, file_field, filename, fileobj, file_size, content_type='application/octet-stream'):
+        self.boundary = uuid.uuid4().hex
+        head = b''.join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self._parts = [_BytesReader(head), fileobj, _BytesReader(tail)]
+        self.len = len(head) + file_size + len(tail)
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.len
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and (size < 0 or size > 0):
+            data = self._parts[0].read(size)
+            if not data:
+                self._parts.pop(0)
+                continue
+            chunks.append(data)
+            if size > 0:
+                size -= len(data)
+        return b''.join(chunks)
+
+class _BytesReader:
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    def read(self, size=-1):
+        end = len(self._data) if size < 0 else self._pos + size
+        data = self._data[self._pos:end]
+        self._pos += len(data)
+        return data
+
+def download_to_spool(image_url, timeout=30):
+    """
+    流式下载图片到 SpooledTemporaryFile，返回 (文件对象, 大小, Content-Type)
+    """
+    with get_http_session().get(image_url, timeout=timeout, stream=True, headers={
+        'User-Agent': get_random_user_agent(),
+        'Referer': 'https://twitter.com/'
+    }) as resp:
+        resp.raise_for_status()
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        size = 0
+        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+            spool.write(chunk)
+            size += len(chunk)
+        spool.seek(0)
+        return spool, size, resp.headers.get('Content-Type', 'application/octet-stream').split(';')[0]
+
+def upload_to_imgbb(image_url, api_key, timeout=30, target=None):
+    """
+    上传图片到 ImgBB 图床 (multipart 流式上传)，返回图床地址，失败返回 None
+    target 仅用于按目标统计下载/上传耗时
+    """
+    if not api_key:
+        print("[图床] ImgBB 未配置 API Key, 无法上传")
+        return None
+
+    try:
+        print(f"[图床] 正在从 {image_url} 下载图片...")
+        with timer('image_download', target):
+            spool, size, content_type = download_to_spool(image_url, timeout)
+        with spool, timer('image_upload', target):
+            print(f"[图床] 正在上传到 ImgBB ({size // 1024} KB)...")
+            filename = os.path.basename(urllib.parse.urlparse(image_url).path) or 'image'
+            body = MultipartStream({'key': api_key}, 'image', filename, spool, size, content_type)
+            upload_response = get_http_session().post(
+                IMGBB_UPLOAD_URL,
+                data=body,
+                headers={'Content-Type': body.content_type},
+                timeout=timeout
+            )
+        result = upload_response.json()
+
+        if result.get('success'):
+            url = result['data']['url']
+            print(f"[图床] ImgBB 上传成功: {url}")
+            return url
+        else:
+            print(f"[图床] ImgBB 上传失败: {result}")
+            return None
+    except Exception as e:
+        print(f"[图床] ImgBB 上传异常: {e}")
+        return None
+
+def proxy_image_url(image_url, cloudflare_proxy='', media_proxy=''):
+    """
+    图床不可用时的代理地址: 优先使用自建的媒体缓存代理 (media_proxy.py，返回适合钉钉的缩略图)，
+    其次是自建的 Cloudflare Worker，否则回退到 wsrv.nl
+    """
+    if media_proxy:
+        return f"{media_proxy.rstrip('/')}/?url={urllib.parse.quote(image_url, safe='')}"
+    if cloudflare_proxy:
+        encoded_url = urllib.parse.quote(image_url)
+        return f"{cloudflare_proxy.rstrip('/')}?url={encoded_url}"
+    clean_url = image_url.replace('https://', '').replace('http://', '')
+    encoded_url = urllib.parse.quote(clean_url)
+    return f"https://wsrv.nl/?url={encoded_url}"
+
+class ImagePipeline:
+    """
+    推文图片处理流水线
+    同一条推文的图片在线程池中并行上传，重复的媒体只处理一次，
+    已上传过的媒体直接使用 MediaMap 中记录的图床地址；上传失败时回退到代理地址
+    """
+
+    def __init__(self, media_map=None, workers=4, api_key=None):
+        self.media_map = media_map or MediaMap()
+        self.workers = max(1, workers)
+        self.api_key = api_key
+
+    def upload(self, image_url, key=None, target=None):
+        """
+        上传单张图片并返回图床地址，已上传过的媒体直接复用，失败返回 None
+        """
+        key = key or media_key(image_url)
+        hosted = self.media_map.get(key)
+        if hosted:
+            print(f"[图床] 复用已上传的图片: {hosted}")
+            incr('image_reused', target=target)
+            return hosted
+        hosted = upload_to_imgbb(image_url, self.api_key, target=target)
+        if hosted:
+            self.media_map.put(key, hosted)
+        else:
+            incr('image_upload_failed', target=target)
+        return hosted
+
+    def resolve(self, images, target, use_image_bed=True, cloudflare_proxy='', media_proxy=''):
+        """
+        返回与 images 顺序一致的最终图片地址列表 (重复的媒体只保留第一次出现)
+        """
+        unique = {}
+        for image_url in images:
+            unique.setdefault(media_key(image_url), image_url)
+
+        hosted = {}
+        if use_image_bed and unique:
+            print(f"[{target}] 正在上传 {len(unique)} 张图片到图床...")
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(unique))) as pool:
+                futures = {key: pool.submit(self.upload, url, key, target) for key, url in unique.items()}
+            hosted = {key: future.result() for key, future in futures.items()}
+
+        return [hosted.get(key) or proxy_image_url(url, cloudflare_proxy, media_proxy) for key, url in unique.items()]
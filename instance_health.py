@@ -0,0 +1,258 @@
+import json
+import os
+import random
+import threading
+import time
+
+class InstanceHealth:
+    """
+    Nitter 实例健康度登记表
+    按实例记录成功率、延迟 EWMA、验证页出现频率以及最近一次失败；
+    连续失败达到阈值后打开熔断器并按指数退避冷却，
+    排序时按 "拿到一次成功结果的期望耗时" 从小到大排列
+    """
+
+    # 每个实例保留的最近成功耗时样本数，用于估算分位数
+    RECENT_SAMPLES = 20
+
+    def __init__(self, path=None, alpha=0.3, failure_threshold=3, base_cooldown=120,
+                 max_cooldown=6 * 3600, default_latency=10.0, store=None):
+        self.path = path
+        # 可选的 StateStore: 以数据库为准，path 指向的 JSON 文件作为导出 (及数据库为空时的导入来源)
+        self.store = store
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.default_latency = default_latency
+        self._data = None
+        self._dirty = False
+        # 分片子进程中按顺序记下每次抓取结果，回传给主进程重放 (None 表示不记录)
+        self._journal = None
+        self._lock = threading.RLock()
+
+    def _load(self):
+        if self._data is not None:
+            return
+        self._data = {}
+        if self.store is not None:
+            try:
+                self._data = self.store.load_health()
+            except Exception as e:
+                print(f"[系统] 从状态库加载实例健康度失败: {e}")
+            if self._data:
+                return
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._data = data
+            except Exception as e:
+                print(f"[系统] 加载实例健康度失败: {e}")
+
+    def _entry(self, instance):
+        self._load()
+        key = instance.rstrip('/')
+        entry = self._data.get(key)
+        if entry is None:
+            entry = self._data[key] = {
+                'attempts': 0,
+                'successes': 0,
+                'success_ewma': 0.5,
+                'latency_ewma': None,
+                'failure_latency_ewma': None,
+                'challenge_ewma': 0.0,
+                'consecutive_failures': 0,
+                'open_until': 0,
+                'last_success': None,
+                'last_failure': None,
+                'last_failure_reason': None,
+                'recent_latencies': [],
+            }
+        return entry
+
+    def _ewma(self, old, value):
+        return value if old is None else old + self.alpha * (value - old)
+
+    def record_success(self, instance, latency, challenged=False):
+        with self._lock:
+            entry = self._entry(instance)
+            entry['attempts'] += 1
+            entry['successes'] += 1
+            entry['success_ewma'] = self._ewma(entry['success_ewma'], 1.0)
+            entry['latency_ewma'] = self._ewma(entry['latency_ewma'], latency)
+            recent = entry.setdefault('recent_latencies', [])
+            recent.append(round(latency, 3))
+            del recent[:-self.RECENT_SAMPLES]
+            entry['challenge_ewma'] = self._ewma(entry['challenge_ewma'], 1.0 if challenged else 0.0)
+            entry['consecutive_failures'] = 0
+            entry['open_until'] = 0
+            entry['last_success'] = int(time.time())
+            self._dirty = True
+            if self._journal is not None:
+                self._journal.append(('success', instance, latency, challenged))
+
+    def record_failure(self, instance, latency, reason, challenged=False):
+        with self._lock:
+            entry = self._entry(instance)
+            now = time.time()
+            entry['attempts'] += 1
+            entry['success_ewma'] = self._ewma(entry['success_ewma'], 0.0)
+            entry['failure_latency_ewma'] = self._ewma(entry['failure_latency_ewma'], latency)
+            entry['challenge_ewma'] = self._ewma(entry['challenge_ewma'], 1.0 if challenged else 0.0)
+            entry['consecutive_failures'] += 1
+            entry['last_failure'] = int(now)
+            entry['last_failure_reason'] = reason
+
+            excess = entry['consecutive_failures'] - self.failure_threshold
+            if excess >= 0:
+                cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** excess))
+                entry['open_until'] = int(now + cooldown)
+                print(f"[健康度] {instance} 连续失败 {entry['consecutive_failures']} 次，熔断 {cooldown}s")
+            self._dirty = True
+            if self._journal is not None:
+                self._journal.append(('failure', instance, latency, reason, challenged))
+
+    def record_slow(self, instance, elapsed):
+        """
+        请求运行 elapsed 秒后被取消 (对冲中输给了其他实例或时间预算用完)，实际耗时至少为 elapsed:
+        只把延迟估计往上拉，不计入成功率与连续失败，不会触发熔断
+        """
+        with self._lock:
+            entry = self._entry(instance)
+            if entry['latency_ewma'] is None or elapsed > entry['latency_ewma']:
+                entry['latency_ewma'] = self._ewma(entry['latency_ewma'], elapsed)
+                self._dirty = True
+            if self._journal is not None:
+                self._journal.append(('slow', instance, elapsed))
+
+    def is_available(self, instance, now=None):
+        """
+        熔断器未打开或冷却已结束 (半开状态，放行一次试探) 时返回 True
+        """
+        with self._lock:
+            self._load()
+            entry = self._data.get(instance.rstrip('/'))
+            return not entry or entry.get('open_until', 0) <= (now or time.time())
+
+    def expected_cost(self, instance):
+        """
+        估算在该实例上拿到一次成功结果的期望耗时 (秒)
+        """
+        with self._lock:
+            self._load()
+            entry = self._data.get(instance.rstrip('/')) or {}
+            p = max(entry.get('success_ewma', 0.5), 0.05)
+            latency = entry.get('latency_ewma') or self.default_latency
+            failure_latency = entry.get('failure_latency_ewma') or latency
+            cost = (p * latency + (1 - p) * failure_latency) / p
+            # 验证页意味着需要浏览器层级，成本更不稳定
+            return cost * (1 + entry.get('challenge_ewma', 0.0))
+
+    def latency_quantile(self, q, instance=None):
+        """
+        最近成功耗时的分位数 (秒)；指定实例样本不足时退回全部实例的样本，仍无数据时返回 None
+        """
+        with self._lock:
+            self._load()
+            samples = []
+            if instance is not None:
+                samples = list((self._data.get(instance.rstrip('/')) or {}).get('recent_latencies', []))
+            if len(samples) < 5:
+                samples = [x for entry in self._data.values() for x in entry.get('recent_latencies', [])]
+        if not samples:
+            return None
+        samples.sort()
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def order(self, instances):
+        """
+        按期望耗时排序，跳过熔断中的实例；全部熔断时按最早恢复的顺序兜底
+        原列表顺序 (instances.json 的排名) 作为无历史数据时的先验
+        """
+        now = time.time()
+        available = []
+        tripped = []
+        for rank, instance in enumerate(instances):
+            if self.is_available(instance, now):
+                # 小幅随机扰动分散各实例的压力
+                score = self.expected_cost(instance) * random.uniform(0.9, 1.1) + rank * 0.1
+                available.append((score, instance))
+            else:
+                with self._lock:
+                    open_until = self._data[instance.rstrip('/')]['open_until']
+                tripped.append((open_until, instance))
+
+        if available:
+            if tripped:
+                print(f"[健康度] 跳过 {len(tripped)} 个熔断中的实例")
+            return [instance for _, instance in sorted(available)]
+        return [instance for _, instance in sorted(tripped)]
+
+    def snapshot(self):
+        """
+        返回全部实例记录的副本 (用于在进程之间传递)
+        """
+        with self._lock:
+            self._load()
+            return json.loads(json.dumps(self._data))
+
+    def merge(self, entries):
+        """
+        用主进程下发的实例记录覆盖本地记录
+        """
+        if not entries:
+            return
+        with self._lock:
+            self._load()
+            self._data.update(entries)
+            self._dirty = True
+
+    def start_journal(self):
+        """
+        开始记录之后的每次抓取结果 (见 stop_journal)
+        """
+        with self._lock:
+            self._journal = []
+
+    def stop_journal(self):
+        """
+        停止记录并返回 start_journal 以来的抓取结果列表，交给另一个进程的 replay
+        """
+        with self._lock:
+            events, self._journal = self._journal or [], None
+            return events
+
+    def replay(self, events):
+        """
+        按顺序重放其他进程记录的抓取结果；多个分片的结果逐次累加到本地记录上，而不是互相覆盖
+        """
+        for event in events or []:
+            if event[0] == 'success':
+                self.record_success(*event[1:])
+            elif event[0] == 'slow':
+                self.record_slow(*event[1:])
+            else:
+                self.record_failure(*event[1:])
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.store is not None:
+                try:
+                    self.store.save_health(self._data)
+                except Exception as e:
+                    print(f"[系统] 保存实例健康度到状态库失败: {e}")
+            if not self.path:
+                self._dirty = False
+                return
+            try:
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, indent=2, ensure_ascii=False, sort_keys=True)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except Exception as e:
+                print(f"[系统] 保存实例健康度失败: {e}")
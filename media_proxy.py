@@ -0,0 +1,348 @@
+"""
+推文图片的本地缓存代理
+
+与 Cloudflare Worker 代理相同的调用方式 (/?url=<图片地址>)，可以和监控脚本一起运行:
+- 同一张媒体只回源下载一次，保存在按总大小限制的磁盘 LRU 中 (按媒体 ID 与宽度区分)
+- 默认返回适合钉钉展示的缩略图: 回源时直接请求 Twitter 的 small/medium/large 尺寸，
+  安装了 Pillow 时再在本地缩小到目标宽度
+- 响应带 ETag 与长期 Cache-Control，客户端重复加载时返回 304
+
+用法: python media_proxy.py，然后设置监控脚本的 MEDIA_PROXY_URL=http://<主机>:<端口>
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import urllib.parse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fetch_tiers import get_http_session
+from image_pipeline import CHUNK_SIZE, media_key
+from nitter import get_original_image_url, get_random_user_agent
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MEDIA_PROXY_HOST = os.environ.get('MEDIA_PROXY_HOST', '0.0.0.0')
+MEDIA_PROXY_PORT = int(os.environ.get('MEDIA_PROXY_PORT', '8080'))
+# 磁盘缓存目录与总大小上限 (MB)，超过时淘汰最久未访问的图片
+MEDIA_CACHE_DIR = os.environ.get('MEDIA_CACHE_DIR', os.path.join(BASE_DIR, '.cache', 'media'))
+MEDIA_CACHE_MAX_MB = int(os.environ.get('MEDIA_CACHE_MAX_MB', '512'))
+# 未指定 w 参数时返回的图片宽度 (钉钉消息中的图片显示宽度有限，不需要原图)
+MEDIA_PROXY_WIDTH = int(os.environ.get('MEDIA_PROXY_WIDTH', '720'))
+MEDIA_MAX_SOURCE_MB = int(os.environ.get('MEDIA_MAX_SOURCE_MB', '20'))
+
+# 与 cloudflare-worker.js 相同，只代理 Twitter/X 的媒体域名
+ALLOWED_HOSTS = {'pbs.twimg.com', 'abs.twimg.com', 'ton.twimg.com', 'video.twimg.com'}
+# Twitter 提供的图片尺寸 (最长边)，回源时选择不小于目标宽度的最小一档
+TWIMG_SIZES = [(680, 'small'), (1200, 'medium'), (2048, 'large')]
+MIN_WIDTH, MAX_WIDTH = 64, 2048
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+def sniff_content_type(head):
+    """
+    按文件头判断图片类型 (缓存文件不单独保存响应头)
+    """
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+def source_url(key, width):
+    """
+    由媒体键得到回源地址: pbs.twimg.com 的图片按目标宽度选择尺寸，其他地址原样回源
+    """
+    if not key.startswith('pbs.twimg.com/'):
+        return key
+    path = key[len('pbs.twimg.com'):]
+    name = next((name for size, name in TWIMG_SIZES if size >= width), 'orig')
+    if '.' in path.rsplit('/', 1)[-1]:
+        path, fmt = path.rsplit('.', 1)
+        return f"https://pbs.twimg.com{path}?format={fmt}&name={name}"
+    return f"https://pbs.twimg.com{path}?name={name}"
+
+def downscale(path, width):
+    """
+    安装了 Pillow 时把静态图片缩小到 width 宽 (原地替换)；动图、未知格式与已足够小的图片保持不变
+    """
+    if Image is None:
+        return
+    try:
+        with Image.open(path) as img:
+            if img.width <= width or getattr(img, 'is_animated', False) or img.format not in ('JPEG', 'PNG', 'WEBP'):
+                return
+            fmt = img.format
+            resized = img.copy()
+        resized.thumbnail((width, resized.height))
+        tmp_path = path + '.resize'
+        resized.save(tmp_path, fmt, **({'quality': 85, 'optimize': True} if fmt == 'JPEG' else {}))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[媒体代理] 缩放图片失败 (返回原尺寸): {e}")
+
+class MediaCache:
+    """
+    按总大小限制的磁盘 LRU
+    文件名为 (媒体键, 宽度) 的哈希，访问时更新 mtime；启动时按 mtime 重建访问顺序，
+    写入新文件后从最久未访问的开始淘汰，直到总大小不超过 max_bytes
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # 同一文件的并发请求只回源一次 (按文件名分段加锁)
+        self._fetch_locks = [threading.Lock() for _ in range(64)]
+        self._scan()
+
+    def _scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if '.part' in entry.name:
+                # 上次进程退出时未写完的临时文件
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._size += size
+        if entries:
+            print(f"[媒体代理] 已加载 {len(entries)} 个缓存文件 ({self._size // 1024 // 1024} MB)")
+
+    @staticmethod
+    def name_for(key, width):
+        return hashlib.sha1(f"{key}\n{width}".encode('utf-8')).hexdigest()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def fetch_lock(self, name):
+        return self._fetch_locks[int(name[:4], 16) % len(self._fetch_locks)]
+
+    def get(self, name):
+        """
+        命中时返回文件路径并标记为最近访问，未命中返回 None
+        """
+        with self._lock:
+            if name not in self._index:
+                return None
+            self._index.move_to_end(name)
+            self.hits += 1
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._size -= self._index.pop(name, 0)
+            return None
+        return path
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, name, tmp_path):
+        """
+        把写好的临时文件移入缓存，并按总大小淘汰最久未访问的文件
+        """
+        path = self.path(name)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        evicted = []
+        with self._lock:
+            self._size += size - self._index.pop(name, 0)
+            self._index[name] = size
+            while self._size > self.max_bytes and len(self._index) > 1:
+                old_name, old_size = self._index.popitem(last=False)
+                self._size -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(self.path(old_name))
+            except OSError:
+                pass
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._index), 'bytes': self._size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'downscale': Image is not None}
+
+class MediaProxy:
+    """
+    媒体回源与缓存: resolve() 返回缓存文件路径，未缓存时回源下载一次
+    """
+
+    def __init__(self, cache, default_width=720, max_source_bytes=20 * 1024 * 1024, timeout=30):
+        self.cache = cache
+        self.default_width = default_width
+        self.max_source_bytes = max_source_bytes
+        self.timeout = timeout
+
+    def resolve(self, image_url, width=None):
+        """
+        返回 (文件路径, 缓存文件名)；地址不是允许的媒体域名时抛出 PermissionError
+        """
+        key = media_key(image_url)
+        host = urllib.parse.urlparse(key if '://' in key else f"https://{key}").hostname
+        if host not in ALLOWED_HOSTS:
+            raise PermissionError(f"不支持的域名: {host}")
+        width = min(MAX_WIDTH, max(MIN_WIDTH, width or self.default_width))
+        name = MediaCache.name_for(key, width)
+
+        path = self.cache.get(name)
+        if path:
+            return path, name
+        with self.cache.fetch_lock(name):
+            # 等锁期间可能已经由其他请求下载完成
+            path = self.cache.get(name)
+            if path:
+                return path, name
+            self.cache.record_miss()
+            url = source_url(key, width)
+            print(f"[媒体代理] 回源下载: {url}")
+            tmp_path = self._download(url)
+            downscale(tmp_path, width)
+            return self.cache.put(name, tmp_path), name
+
+    def _download(self, url):
+        fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=self.cache.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f, get_http_session().get(url, timeout=self.timeout, stream=True, headers={
+                'User-Agent': get_random_user_agent(),
+                'Referer': 'https://twitter.com/',
+                'Accept': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8',
+            }) as resp:
+                resp.raise_for_status()
+                size = 0
+                for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_source_bytes:
+                        raise ValueError(f"图片超过 {self.max_source_bytes // 1024 // 1024} MB")
+                    f.write(chunk)
+            return tmp_path
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+class MediaProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send_text(self, status, text):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        if parsed.path == '/health':
+            self._send_text(200, json.dumps(self.server.proxy.cache.stats()))
+            return
+
+        query = urllib.parse.parse_qs(parsed.query)
+        image_url = (query.get('url') or [''])[0]
+        if not image_url:
+            self._send_text(400, '缺少 url 参数\n\n使用方式: ?url=https://pbs.twimg.com/media/xxx.jpg[&w=720]')
+            return
+        try:
+            width = int(query['w'][0]) if query.get('w') else None
+        except ValueError:
+            self._send_text(400, 'w 参数必须是整数')
+            return
+
+        try:
+            path, name = self.server.proxy.resolve(get_original_image_url(image_url), width)
+        except PermissionError as e:
+            self._send_text(403, str(e))
+            return
+        except Exception as e:
+            print(f"[媒体代理] 获取 {image_url} 失败: {e}")
+            self._send_text(502, f"获取图片失败: {e}")
+            return
+
+        # 同一媒体 ID 与宽度对应的内容不会变化，文件名即可作为 ETag
+        etag = f'"{name}"'
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            self.end_headers()
+            return
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            # 刚好被淘汰
+            self._send_text(503, '缓存文件不可用，请重试')
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            head = f.read(16)
+            self.send_response(200)
+            self.send_header('Content-Type', sniff_content_type(head))
+            self.send_header('Content-Length', str(size))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            if self.command == 'HEAD':
+                return
+            self.wfile.write(head)
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+def make_server(host=MEDIA_PROXY_HOST, port=MEDIA_PROXY_PORT, cache_dir=MEDIA_CACHE_DIR,
+                max_mb=MEDIA_CACHE_MAX_MB, width=MEDIA_PROXY_WIDTH):
+    server = ThreadingHTTPServer((host, port), MediaProxyHandler)
+    server.daemon_threads = True
+    server.proxy = MediaProxy(MediaCache(cache_dir, max_mb * 1024 * 1024), width,
+                              MEDIA_MAX_SOURCE_MB * 1024 * 1024)
+    return server
+
+if __name__ == "__main__":
+    server = make_server()
+    downscale_tag = "本地缩放" if Image is not None else "未安装 Pillow，仅使用 Twitter 提供的尺寸"
+    print(f"[媒体代理] 监听 {MEDIA_PROXY_HOST}:{server.server_address[1]}，缓存 {MEDIA_CACHE_DIR} "
+          f"(上限 {MEDIA_CACHE_MAX_MB} MB)，默认宽度 {MEDIA_PROXY_WIDTH}px，{downscale_tag}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
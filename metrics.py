@@ -0,0 +1,193 @@
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+# Prometheus 指标名前缀
+METRIC_PREFIX = 'x2ding'
+
+class CycleMetrics:
+    """
+    轮询周期内的分阶段计时与计数
+    计时按 (阶段, 目标, 实例) 聚合为 次数 / 总耗时 / 最大耗时，计数器按 (名称, 目标, 实例) 累加；
+    每轮结束时输出 JSON 报告与 Prometheus textfile (node_exporter textfile collector 格式)，然后清零
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._timings = {}
+            self._counters = {}
+
+    @contextlib.contextmanager
+    def timer(self, stage, target=None, instance=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, target, instance)
+
+    def observe(self, stage, seconds, target=None, instance=None):
+        key = (stage, target or '', (instance or '').rstrip('/'))
+        with self._lock:
+            entry = self._timings.get(key)
+            if entry is None:
+                entry = self._timings[key] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def incr(self, name, value=1, target=None, instance=None):
+        key = (name, target or '', (instance or '').rstrip('/'))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def merge(self, report):
+        """
+        合并其他进程 (如分片抓取的子进程) 的报告中的计时与计数
+        """
+        if not report:
+            return
+        with self._lock:
+            for t in report.get('timings', []):
+                key = (t['stage'], t['target'], t['instance'])
+                entry = self._timings.get(key)
+                if entry is None:
+                    entry = self._timings[key] = [0, 0.0, 0.0]
+                entry[0] += t['count']
+                entry[1] += t['seconds']
+                entry[2] = max(entry[2], t['max_seconds'])
+            for c in report.get('counters', []):
+                key = (c['name'], c['target'], c['instance'])
+                self._counters[key] = self._counters.get(key, 0) + c['value']
+
+    def report(self):
+        """
+        返回本轮的报告: 总耗时、按阶段汇总 (从耗时最多的开始)、按目标/实例的明细以及计数器
+        """
+        with self._lock:
+            timings = dict(self._timings)
+            counters = dict(self._counters)
+            started = self.started
+
+        stages = {}
+        for (stage, _, _), (count, total, longest) in timings.items():
+            entry = stages.setdefault(stage, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['count'] += count
+            entry['seconds'] += total
+            entry['max_seconds'] = max(entry['max_seconds'], longest)
+        return {
+            'started_at': int(started),
+            'duration_seconds': round(time.time() - started, 3),
+            'stages': {
+                stage: {k: round(v, 3) if isinstance(v, float) else v for k, v in entry.items()}
+                for stage, entry in sorted(stages.items(), key=lambda item: -item[1]['seconds'])
+            },
+            'timings': [
+                {'stage': stage, 'target': target, 'instance': instance, 'count': count,
+                 'seconds': round(total, 3), 'max_seconds': round(longest, 3)}
+                for (stage, target, instance), (count, total, longest) in sorted(timings.items())
+            ],
+            'counters': [
+                {'name': name, 'target': target, 'instance': instance, 'value': value}
+                for (name, target, instance), value in sorted(counters.items())
+            ],
+        }
+
+    def summary(self, report=None, limit=6):
+        """
+        一行文字摘要: 耗时最多的几个阶段
+        """
+        report = report or self.report()
+        parts = [f"{stage} {entry['seconds']:.1f}s/{entry['count']}次"
+                 for stage, entry in list(report['stages'].items())[:limit]]
+        return ', '.join(parts) or '无'
+
+    def write_json(self, path, report=None):
+        _write_atomic(path, json.dumps(report or self.report(), indent=2, ensure_ascii=False))
+
+    def write_prometheus(self, path, report=None):
+        report = report or self.report()
+        lines = [
+            f"# HELP {METRIC_PREFIX}_cycle_duration_seconds 最近一轮轮询的总耗时",
+            f"# TYPE {METRIC_PREFIX}_cycle_duration_seconds gauge",
+            f"{METRIC_PREFIX}_cycle_duration_seconds {report['duration_seconds']}",
+            f"# HELP {METRIC_PREFIX}_cycle_started_timestamp_seconds 最近一轮轮询的开始时间",
+            f"# TYPE {METRIC_PREFIX}_cycle_started_timestamp_seconds gauge",
+            f"{METRIC_PREFIX}_cycle_started_timestamp_seconds {report['started_at']}",
+            f"# HELP {METRIC_PREFIX}_stage_seconds 最近一轮中各阶段的累计耗时",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds gauge",
+        ]
+        lines += [f"{METRIC_PREFIX}_stage_seconds{_labels(t)} {t['seconds']}" for t in report['timings']]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_stage_max_seconds 最近一轮中各阶段单次的最大耗时",
+            f"# TYPE {METRIC_PREFIX}_stage_max_seconds gauge",
+        ]
+        lines += [f"{METRIC_PREFIX}_stage_max_seconds{_labels(t)} {t['max_seconds']}" for t in report['timings']]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_stage_calls 最近一轮中各阶段的执行次数",
+            f"# TYPE {METRIC_PREFIX}_stage_calls gauge",
+        ]
+        lines += [f"{METRIC_PREFIX}_stage_calls{_labels(t)} {t['count']}" for t in report['timings']]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_events 最近一轮中各类事件的次数",
+            f"# TYPE {METRIC_PREFIX}_events gauge",
+        ]
+        lines += [f"{METRIC_PREFIX}_events{_labels(c)} {c['value']}" for c in report['counters']]
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
+def _labels(entry):
+    pairs = [(key, entry[key]) for key in ('stage', 'name', 'target', 'instance') if entry.get(key)]
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+def _write_atomic(path, content):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+class CycleProfiler:
+    """
+    可选的 cProfile 采样: 只覆盖主线程 (线程池与 asyncio.to_thread 中的工作不计入)
+    结束时保存 .prof 文件并输出按累计耗时排序的前 limit 个函数
+    """
+
+    def __init__(self, enabled=False, limit=30):
+        self.enabled = enabled
+        self.limit = limit
+        self._profile = None
+
+    def start(self):
+        if self.enabled:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self, path):
+        if self._profile is None:
+            return
+        self._profile.disable()
+        profile, self._profile = self._profile, None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(self.limit)
+        _write_atomic(os.path.splitext(path)[0] + '.txt', out.getvalue())
+
+# 进程内共享的指标登记表，各模块直接使用 timer / incr
+METRICS = CycleMetrics()
+
+def timer(stage, target=None, instance=None):
+    return METRICS.timer(stage, target, instance)
+
+def incr(name, value=1, target=None, instance=None):
+    METRICS.incr(name, value, target, instance)
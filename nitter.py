@@ -0,0 +1,350 @@
+import random
+import re
+import urllib.parse
+from bs4 import BeautifulSoup
+
+# Nitter 站点相关的纯函数: 实例列表、URL 构造与时间线解析
+# 不涉及浏览器或网络请求，供同步/异步抓取路径共用
+
+# 备选 Nitter 实例 (仅作为域名参考)
+NITTER_INSTANCES = [
+    'https://xcancel.com',
+    'https://nitter.privacyredirect.com',
+    'https://nitter.poast.org',
+    'https://nitter.hu',
+    'https://nitter.moomoo.me',
+    'https://nitter.net',
+]
+
+# 浏览器验证/"稍等片刻"挑战页的特征文本
+CHALLENGE_KEYWORDS = ["Verifying your browser", "Just a moment", "Checking your browser"]
+
+# 浏览器中直接拦截的资源类型: 解析只需要 HTML
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font'}
+# 验证页依赖的第三方脚本域名，不能拦截，否则永远过不了验证
+CHALLENGE_SCRIPT_HOSTS = ('challenges.cloudflare.com',)
+
+# 页面就绪的标志: 出现推文、空时间线/错误面板 (可以直接解析)，或出现验证页
+READY_SELECTOR = '.timeline-item, .timeline-none, .timeline-end, .error-panel'
+PAGE_STATE_JS = """(keywords) => {
+    if (document.querySelector('%s')) return 'ready';
+    const text = (document.title || '') + ' ' + (document.body ? document.body.innerText.slice(0, 2000) : '');
+    if (keywords.some((kw) => text.includes(kw))) return 'challenge';
+    return false;
+}""" % READY_SELECTOR
+
+def get_random_user_agent():
+    ua_list = [
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/121.0.0.0",
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0"
+    ]
+    return random.choice(ua_list)
+
+def split_target(target):
+    """
+    拆分监控目标，返回 (是否搜索, 关键词/用户名)
+    """
+    is_search = target.startswith('search:')
+    keyword = target[7:] if is_search else target
+    return is_search, keyword
+
+def build_target_url(instance, target):
+    """
+    构造目标在指定实例上的时间线地址
+    """
+    is_search, keyword = split_target(target)
+    if is_search:
+        return f"{instance.rstrip('/')}/search?f=tweets&q={urllib.parse.quote(keyword)}"
+    return f"{instance.rstrip('/')}/{keyword}"
+
+def build_rss_url(instance, target):
+    """
+    构造目标在指定实例上的 RSS 地址
+    """
+    is_search, keyword = split_target(target)
+    if is_search:
+        return f"{instance.rstrip('/')}/search/rss?f=tweets&q={urllib.parse.quote(keyword)}"
+    return f"{instance.rstrip('/')}/{keyword}/rss"
+
+def extract_tweet_id(link_href):
+    """
+    从 /user/status/123...#m 形式的链接中提取推文 ID
+    """
+    return link_href.split('/status/')[-1].split('#')[0] if '/status/' in link_href else link_href
+
+def snowflake_id(guid):
+    """
+    推文 ID 的数值 (雪花 ID 随发布时间递增)，不是纯数字时返回 None
+    """
+    guid = str(guid or '')
+    return int(guid) if guid.isdigit() else None
+
+def is_challenge_page(html):
+    return any(kw in html for kw in CHALLENGE_KEYWORDS)
+
+def should_block_request(resource_type, url, instance):
+    """
+    浏览器请求拦截规则: 图片/视频/字体一律拦截，第三方脚本除验证页所需的以外也拦截
+    """
+    if resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    if resource_type == 'script':
+        host = urllib.parse.urlparse(url).hostname or ''
+        instance_host = urllib.parse.urlparse(instance).hostname or ''
+        if host == instance_host or host.endswith(CHALLENGE_SCRIPT_HOSTS):
+            return False
+        return True
+    return False
+
+def parse_timeline(html, instance, target, scan_limit=8, max_tweets=1):
+    """
+    解析 Nitter 时间线页面，返回按页面顺序排列的非置顶推文列表
+    页面上没有任何 .timeline-item 时返回 None
+    scan_limit / max_tweets 为 None 时不限制
+    """
+    _, keyword = split_target(target)
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Nitter 页面推文解析逻辑
+    items = soup.select('.timeline-item')
+    if not items:
+        print(f"[{target}] 在实例 {instance} 上未发现推文内容")
+        return None
+
+    # 扫描策略：扫描前 scan_limit 条推文，找到前 max_tweets 条非置顶的、有效的内容
+    valid_tweets = []
+    for item in items[:scan_limit]:
+        tweet_data = parse_tweet_item(item, instance, target, keyword)
+        if not tweet_data:
+            continue
+        valid_tweets.append(tweet_data)
+        if max_tweets and len(valid_tweets) >= max_tweets:
+            break
+
+    if not valid_tweets:
+        print(f"[{target}] {instance} 页面上未找到符合条件的非置顶推文")
+    return valid_tweets
+
+def announce_tweet(target, instance, tweet):
+    retweet_tag = " [转发]" if tweet['is_retweet'] else ""
+    print(f"[{target}] 成功从 {instance} 抓取{retweet_tag}推文: {tweet['guid']}")
+
+def make_batches(targets, batch_size):
+    """
+    将普通用户目标 (非 search:) 按 batch_size 分组，用于 Nitter 的合并时间线 /u1,u2,u3
+    少于 2 个用户的分组没有合并的意义，不会返回
+    """
+    if not batch_size or batch_size < 2:
+        return []
+    users = []
+    for target in targets:
+        is_search, _ = split_target(target)
+        if not is_search and target not in users:
+            users.append(target)
+    chunks = [users[i:i + batch_size] for i in range(0, len(users), batch_size)]
+    return [chunk for chunk in chunks if len(chunk) > 1]
+
+def tweet_author(tweet):
+    """
+    推文作者的用户名 (小写、不含 @)，优先取 .username，取不到时从链接路径中解析
+    """
+    author = (tweet.get('author') or '').strip().lstrip('@').lower()
+    if author:
+        return author
+    path = urllib.parse.urlparse(tweet.get('link', '')).path
+    return path.strip('/').split('/')[0].lower()
+
+def retweeter_name(header_text):
+    """
+    .retweet-header 的文本形如 "Display Name retweeted"，返回转发者的显示名称
+    """
+    text = (header_text or '').strip()
+    return text[:-len('retweeted')].strip() if text.endswith('retweeted') else text
+
+def group_tweets_by_author(tweets, usernames):
+    """
+    将合并时间线的推文按作者分回各用户，返回 {用户: [推文, ...] 或 None} (保持页面顺序)
+    转发条目的 .username 是原推作者，按转发者归属: RSS 标题直接给出转发者的用户名，页面上只有转发者的显示名称，
+    借助同一页面上该用户自己的推文对应到用户名。页面上有无法归属的转发时，显示名称未知的用户对应 None，
+    由调用方单独抓取这些用户
+    """
+    grouped = {username: [] for username in usernames}
+    lookup = {username.lstrip('@').lower(): username for username in usernames}
+    names = {}
+    for tweet in tweets:
+        username = lookup.get(tweet_author(tweet))
+        if username is not None and not tweet.get('is_retweet') and tweet.get('author_name'):
+            names.setdefault(tweet['author_name'], username)
+
+    unresolved = False
+    for tweet in tweets:
+        if not tweet.get('is_retweet'):
+            username = lookup.get(tweet_author(tweet))
+        else:
+            retweeter = (tweet.get('retweeted_by') or '').strip()
+            if retweeter.startswith('@'):
+                username = lookup.get(retweeter[1:].lower())
+                if username is not None:
+                    names.setdefault(retweeter, username)
+            else:
+                username = names.get(retweeter)
+            unresolved = unresolved or username is None
+        if username is not None:
+            grouped[username].append(tweet)
+
+    if unresolved:
+        for username in usernames:
+            if username not in names.values():
+                grouped[username] = None
+    return grouped
+
+def parse_tweet_item(item, instance, target, keyword):
+    """
+    解析单条 .timeline-item，置顶或缺少正文/链接时返回 None
+    """
+    # 1. 检查是否是置顶推文 (移除 "Pinned" text 匹配以防止误伤推文内容)
+    is_pinned = item.select_one('.pinned') is not None
+    if is_pinned:
+        print(f"[{target}] 发现置顶推文，跳过")
+        return None
+
+    # 2. 检查是否是转发
+    retweet_header = item.select_one('.retweet-header')
+    is_retweet = retweet_header is not None
+
+    # 3. 提取图片 (增加更多可能的 Nitter 图片选择器)
+    images = []
+    img_els = item.select('.attachment.image img, .tweet-image img, .still-image img, .attachments img')
+    for img in img_els:
+        # 排除头像 (通常在 .tweet-avatar 或 .profile-card-avatar 中)
+        if any(c in str(img.parent.get('class', [])) for c in ['avatar', 'profile']):
+            continue
+
+        src = img.get('src', '')
+        if src:
+            # 转换相对路径
+            if src.startswith('//'):
+                full_src = 'https:' + src
+            elif src.startswith('/'):
+                full_src = instance.rstrip('/') + src
+            else:
+                full_src = src
+
+            # 还原原始 Twitter 图片链接以提高代理稳定性
+            full_src = get_original_image_url(full_src)
+
+            # 过滤掉一些明显的表情包或小图标 (可选)
+            if 'emoji' in src.lower() or 'hashtag_click' in src:
+                continue
+
+            images.append(full_src)
+
+    # 4. 提取视频 (新增)
+    video_url = None
+    try:
+        video_el = item.select_one('video source')
+        if not video_el:
+            video_el = item.select_one('video')
+
+        if video_el:
+            # 尝试获取封面图作为额外图片
+            poster_el = item.select_one('video')
+            if poster_el:
+                poster = poster_el.get('poster', '')
+                if poster:
+                    if poster.startswith('//'):
+                        full_poster = 'https:' + poster
+                    elif poster.startswith('/'):
+                        full_poster = instance.rstrip('/') + poster
+                    else:
+                        full_poster = poster
+                    # 尝试还原原始封面图地址并加入图片列表
+                    full_poster = get_original_image_url(full_poster)
+                    if full_poster not in images:
+                        images.append(full_poster)
+
+            # 提取视频流地址
+            v_src = video_el.get('src', '')
+            if v_src:
+                if v_src.startswith('//'):
+                    video_url = 'https:' + v_src
+                elif v_src.startswith('/'):
+                    video_url = instance.rstrip('/') + v_src
+                else:
+                    video_url = v_src
+    except Exception as e:
+        print(f"[{target}] 视频提取异常: {e}")
+
+    # 提取关键信息
+    content_el = item.select_one('.tweet-content')
+    link_el = item.select_one('.tweet-link')
+    date_el = item.select_one('.tweet-date a')
+    author_el = item.select_one('.username')
+    fullname_el = item.select_one('.fullname')
+
+    if not content_el or not link_el:
+        return None
+
+    # 提取推文 ID (从 /user/status/123...#m 中提取数字)
+    link_href = link_el.get('href', '')
+    tweet_id = extract_tweet_id(link_href)
+
+    tweet_data = {
+        'content': content_el.get_text(strip=True),
+        'link': instance.rstrip('/') + link_href,
+        'published': date_el.get('title', '') if date_el else 'Unknown Time',
+        'author': author_el.get_text(strip=True) if author_el else keyword,
+        'author_name': fullname_el.get_text(strip=True) if fullname_el else '',
+        'guid': tweet_id,
+        'is_retweet': is_retweet,
+        'retweeted_by': retweeter_name(retweet_header.get_text(strip=True)) if is_retweet else None,
+        'images': images,
+        'video_url': video_url
+    }
+    return tweet_data
+
+def get_original_image_url(nitter_url):
+    """
+    尝试从 Nitter 的代理 URL 中还原出 Twitter/X 的原始图片地址
+    例如: /pic/media%2FGDR-yXfbsAA_JmS.jpg -> pbs.twimg.com
+    """
+    try:
+        if 'pbs.twimg.com' in nitter_url:
+            return nitter_url
+            
+        # 1. 处理 hex 编码的对象 (常见于 xcancel 等实例)
+        if '/pic/enc/' in nitter_url:
+            enc_part = nitter_url.split('/pic/enc/')[-1].split('?')[0]
+            try:
+                decoded = bytes.fromhex(enc_part).decode('utf-8')
+                if 'pbs.twimg.com' in decoded:
+                    return decoded
+            except:
+                pass
+
+        # 2. 处理标准 Nitter 路径
+        path = urllib.parse.unquote(nitter_url)
+        
+        # 匹配 /pic/media/ID.ext 或 /pic/orig/media/ID.ext
+        if '/media/' in path:
+            media_part = path.split('/media/')[-1].split('?')[0]
+            if '.' in media_part:
+                media_id, ext = media_part.rsplit('.', 1)
+                # 某些时候 ext 后面可能还跟着 &name=...
+                ext = ext.split('&')[0].split('?')[0]
+                return f"https://pbs.twimg.com/media/{media_id}?format={ext}&name=large"
+
+        # 3. 处理直接包含 pbs.twimg.com 的路径 (如 /pic/pbs.twimg.com/media/...)
+        if 'pbs.twimg.com' in path:
+            # 提取从 pbs.twimg.com 开始的部分
+            match = re.search(r'(pbs\.twimg\.com/media/[^?&]+)', path)
+            if match:
+                return "https://" + match.group(1)
+
+    except Exception as e:
+        print(f"[图片解析] 还原 URL 失败 {nitter_url}: {e}")
+        
+    return nitter_url
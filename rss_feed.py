@@ -0,0 +1,204 @@
+import json
+import os
+import re
+import threading
+import urllib.parse
+import feedparser
+from bs4 import BeautifulSoup
+
+from fetch_tiers import get_http_session
+from nitter import (
+    build_rss_url, extract_tweet_id, get_original_image_url, get_random_user_agent, is_challenge_page,
+    split_target,
+)
+
+RETWEET_TITLE_RE = re.compile(r'RT by @?(\w+):')
+
+class RssCache:
+    """
+    按 (目标, 实例) 保存 RSS 的 ETag / Last-Modified 以及上一次解析出的推文列表
+    命中 304 时直接复用缓存的推文，不再下载和解析
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._data = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(target, instance):
+        return f"{target}|{instance.rstrip('/')}"
+
+    def _load(self):
+        if self._data is not None:
+            return
+        self._data = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._data = data
+            except Exception as e:
+                print(f"[系统] 加载 RSS 缓存失败: {e}")
+
+    def get(self, target, instance):
+        with self._lock:
+            self._load()
+            return self._data.get(self._key(target, instance))
+
+    def snapshot(self):
+        with self._lock:
+            self._load()
+            return json.loads(json.dumps(self._data))
+
+    def merge(self, entries):
+        if not entries:
+            return
+        with self._lock:
+            self._load()
+            self._data.update(entries)
+            self._dirty = True
+
+    def put(self, target, instance, etag, last_modified, tweets, max_tweets=1):
+        with self._lock:
+            self._load()
+            self._data[self._key(target, instance)] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'tweets': tweets,
+                'max_tweets': max_tweets,
+            }
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except Exception as e:
+                print(f"[系统] 保存 RSS 缓存失败: {e}")
+
+def _absolute_url(src, instance):
+    if src.startswith('//'):
+        return 'https:' + src
+    if src.startswith('/'):
+        return instance.rstrip('/') + src
+    return src
+
+def parse_rss_entry(entry, instance, keyword):
+    """
+    将一条 RSS 条目转换为与页面解析一致的推文字典
+    """
+    link = entry.get('link') or entry.get('id') or ''
+    if '/status/' not in link:
+        return None
+    # RSS 中的链接使用实例自己配置的域名，统一换成当前访问的实例
+    link_path = urllib.parse.urlparse(link).path
+    title = entry.get('title', '')
+
+    soup = BeautifulSoup(entry.get('summary', ''), 'html.parser')
+    images = []
+    for img in soup.select('img'):
+        src = img.get('src', '')
+        if not src or 'emoji' in src.lower() or 'hashtag_click' in src:
+            continue
+        full_src = get_original_image_url(_absolute_url(src, instance))
+        if full_src not in images:
+            images.append(full_src)
+
+    video_url = None
+    video_el = soup.select_one('video source') or soup.select_one('video')
+    if video_el and video_el.get('src'):
+        video_url = _absolute_url(video_el['src'], instance)
+
+    content = soup.get_text(strip=True) or title
+    # 转发条目的标题形如 "RT by @user: ..."，直接给出转发者的用户名
+    match = RETWEET_TITLE_RE.match(title)
+    retweeter = f"@{match.group(1)}" if match else None
+    return {
+        'content': content,
+        'link': instance.rstrip('/') + link_path + '#m',
+        'published': entry.get('published', 'Unknown Time'),
+        'author': entry.get('author', '') or keyword,
+        'guid': extract_tweet_id(link_path),
+        'is_retweet': title.startswith('RT by '),
+        'retweeted_by': retweeter,
+        'images': images,
+        'video_url': video_url
+    }
+
+def parse_rss(content, instance, target, max_tweets=1):
+    """
+    解析 RSS 内容，返回按时间线顺序排列的推文列表；不是有效 RSS 时返回 None
+    """
+    _, keyword = split_target(target)
+    feed = feedparser.parse(content)
+    if feed.bozo and not feed.entries:
+        return None
+
+    tweets = []
+    for entry in feed.entries:
+        tweet = parse_rss_entry(entry, instance, keyword)
+        if not tweet:
+            continue
+        tweets.append(tweet)
+        if max_tweets and len(tweets) >= max_tweets:
+            break
+    return tweets
+
+def fetch_rss(instance, target, cache, timeout=15, max_tweets=1):
+    """
+    条件请求目标的 RSS
+    返回 (tweets, reason)，reason 为 None 表示成功 (包括 304 命中缓存)，
+    否则为 '403' / 'challenge' / 'no_feed' / 'empty' / 'error'
+    """
+    url = build_rss_url(instance, target)
+    headers = {'User-Agent': get_random_user_agent()}
+    cached = cache.get(target, instance)
+    # 缓存条数不足本次需要的数量时不能复用，按无条件请求处理
+    cached_limit = cached.get('max_tweets') if cached else None
+    usable = bool(cached and cached.get('tweets')) and (
+        cached_limit is None or (max_tweets is not None and cached_limit >= max_tweets)
+    )
+    if usable:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    try:
+        resp = get_http_session().get(url, timeout=(5, timeout), headers=headers)
+    except Exception as e:
+        print(f"[{target}] 请求 RSS {instance} 失败: {e}")
+        return None, 'error'
+
+    if resp.status_code == 304 and usable:
+        print(f"[{target}] {instance} RSS 未变化 (304)")
+        tweets = cached['tweets']
+        return (tweets[:max_tweets] if max_tweets else tweets), None
+    if resp.status_code == 403:
+        return None, '403'
+    if resp.status_code != 200:
+        return None, 'no_feed'
+
+    content_type = resp.headers.get('Content-Type', '').lower()
+    if 'html' in content_type and 'xml' not in content_type:
+        # 实例关闭了 RSS 或者返回了验证页
+        return None, 'challenge' if is_challenge_page(resp.text) else 'no_feed'
+
+    tweets = parse_rss(resp.content, instance, target, max_tweets=max_tweets)
+    if tweets is None:
+        return None, 'no_feed'
+    if not tweets:
+        return None, 'empty'
+
+    cache.put(target, instance, resp.headers.get('ETag'), resp.headers.get('Last-Modified'), tweets, max_tweets)
+    return tweets, None
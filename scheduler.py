@@ -0,0 +1,134 @@
+import heapq
+import json
+import os
+import threading
+import time
+
+from delivery import TokenBucket
+
+class PollScheduler:
+    """
+    循环模式下的自适应轮询调度器
+    按目标记录发帖速率的 EWMA (条/秒)，下次轮询间隔 = posts_per_poll / 速率，并限制在 [min_interval, max_interval]；
+    目标按下次轮询时间放在小顶堆中，到期的目标按时间先后出队，所有目标共享每分钟 fetch_budget 次的抓取配额
+    """
+
+    def __init__(self, path=None, default_interval=600, min_interval=120, max_interval=3600,
+                 fetch_budget=10, alpha=0.3, posts_per_poll=0.5):
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.alpha = alpha
+        self.posts_per_poll = posts_per_poll
+        # 没有观测数据的目标按 default_interval 轮询
+        self.default_rate = posts_per_poll / max(1, default_interval)
+        self.bucket = TokenBucket(fetch_budget, 60.0) if fetch_budget > 0 else None
+        self._data = None
+        self._dirty = False
+        self._heap = []
+        self._queued = set()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._data is not None:
+            return
+        self._data = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._data = data
+            except Exception as e:
+                print(f"[系统] 加载轮询调度记录失败: {e}")
+
+    def interval(self, target):
+        """
+        按当前发帖速率估算的轮询间隔 (秒)
+        """
+        with self._lock:
+            self._load()
+            return self._interval(self._data.get(target, {}).get('rate', self.default_rate))
+
+    def _interval(self, rate):
+        if rate <= 0:
+            return self.max_interval
+        return min(self.max_interval, max(self.min_interval, self.posts_per_poll / rate))
+
+    def sync(self, targets, now=None):
+        """
+        让调度队列与监控目标保持一致: 新目标立即到期，已有记录的目标沿用保存的下次轮询时间，已移除的目标出队
+        """
+        now = now or time.time()
+        with self._lock:
+            self._load()
+            targets = list(dict.fromkeys(targets))
+            self._heap = []
+            for target in targets:
+                entry = self._data.get(target) or {}
+                heapq.heappush(self._heap, (min(entry.get('next_due', now), now + self.max_interval), target))
+            self._queued = set(targets)
+
+    def due(self, now=None):
+        """
+        取出所有已到期的目标 (按到期时间先后)，受全局抓取配额限制，配额用完的目标留在队列中
+        """
+        now = now or time.time()
+        targets = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                if self.bucket is not None and not self.bucket.acquire(0):
+                    break
+                _, target = heapq.heappop(self._heap)
+                self._queued.discard(target)
+                targets.append(target)
+        return targets
+
+    def observe(self, target, new_posts, now=None):
+        """
+        记录一次轮询结果并重新入队
+        new_posts: 本次发现的新推文数；None 表示抓取失败或没有比较基准，只重新排期不更新速率
+        """
+        now = now or time.time()
+        with self._lock:
+            self._load()
+            entry = self._data.setdefault(target, {'rate': self.default_rate, 'last_checked': None})
+            if new_posts is not None and entry.get('last_checked'):
+                elapsed = max(1.0, now - entry['last_checked'])
+                entry['rate'] += self.alpha * (new_posts / elapsed - entry['rate'])
+            if new_posts is not None:
+                entry['last_checked'] = now
+            interval = self._interval(entry['rate'])
+            entry['next_due'] = now + interval
+            self._dirty = True
+            if target not in self._queued:
+                heapq.heappush(self._heap, (entry['next_due'], target))
+                self._queued.add(target)
+            return interval
+
+    def next_wake(self, now=None):
+        """
+        距离下一个目标可以抓取还需等待的秒数 (同时考虑到期时间与抓取配额)
+        """
+        now = now or time.time()
+        with self._lock:
+            if not self._heap:
+                return float(self.max_interval)
+            wait = max(0.0, self._heap[0][0] - now)
+        if self.bucket is not None:
+            wait = max(wait, self.bucket.wait_time())
+        return wait
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except Exception as e:
+                print(f"[系统] 保存轮询调度记录失败: {e}")
@@ -0,0 +1,155 @@
+import multiprocessing
+import queue
+import time
+import zlib
+
+def shard_of(target, shards):
+    """
+    目标所属的分片 (稳定哈希，与进程、运行次数无关)
+    """
+    return zlib.crc32(target.encode('utf-8')) % shards
+
+def worker_main(shard, requests, results):
+    """
+    分片子进程入口: 持有自己的抓取器 (浏览器)，逐个处理主进程发来的抓取请求
+    每个目标的结果立即回传；本分片处理完后回传抓取期状态的变化与本轮指标。子进程不写任何状态文件
+    """
+    import twitter_monitor as monitor
+    from metrics import METRICS
+
+    with monitor.open_fetcher() as fetch_results:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            cycle, targets, instances, shared = request
+            monitor.merge_shard_state(shared)
+            # 实例健康度不回传快照而是回传逐次抓取结果，主进程重放后各分片的结果得以累加
+            baseline = monitor.collect_shard_state(names=('tiers', 'rss'))
+            monitor.HEALTH.start_journal()
+            METRICS.reset()
+            error = None
+            try:
+                for target, tweets in fetch_results(targets, instances):
+                    results.put(('result', cycle, shard, (target, tweets)))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            state = monitor.collect_shard_state(since=baseline, names=('tiers', 'rss'))
+            state['health_events'] = monitor.HEALTH.stop_journal()
+            results.put(('done', cycle, shard, (state, METRICS.report(), error)))
+
+class ShardedFetcher:
+    """
+    多进程分片抓取
+    按目标名的稳定哈希把目标分给 shards 个长驻子进程，每个子进程各自运行一个浏览器；
+    抓取结果经队列回到主进程，由主进程统一推送并写入状态 (last_id.json 与状态库只有一个写入者)。
+    collect_state() 的结果在每轮开始时下发给子进程，子进程回传的变化交给 merge_state(state, metrics)
+    每轮最多等待 cycle_timeout 秒 (有 budget 时不超过抓取阶段剩余的时间)，超时未返回的目标产出 (target, None)
+    """
+
+    # 子进程按同一预算自行结束抓取，主进程多等几秒收回它们的结束消息
+    DONE_GRACE = 5
+
+    def __init__(self, shards, collect_state, merge_state, poll_interval=5, budget=None, cycle_timeout=None):
+        self.shards = max(1, shards)
+        self.collect_state = collect_state
+        self.merge_state = merge_state
+        self.poll_interval = poll_interval
+        self.budget = budget
+        self.cycle_timeout = cycle_timeout
+        # Playwright 不能在 fork 出来的子进程中继续使用父进程的状态，统一使用 spawn
+        self._context = multiprocessing.get_context('spawn')
+        self._results = self._context.Queue()
+        self._requests = [None] * self.shards
+        self._processes = [None] * self.shards
+        self._cycle = 0
+        for shard in range(self.shards):
+            self._start(shard)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _start(self, shard):
+        requests = self._context.Queue()
+        process = self._context.Process(target=worker_main, args=(shard, requests, self._results),
+                                        name=f"shard-{shard}")
+        process.start()
+        self._requests[shard] = requests
+        self._processes[shard] = process
+
+    def fetch(self, targets, instances):
+        """
+        与 iter_scrape_results 相同的协议: 逐个产出 (target, 推文列表或 None)，顺序为各分片返回结果的先后
+        """
+        self._cycle += 1
+        groups = {}
+        for target in dict.fromkeys(targets):
+            groups.setdefault(shard_of(target, self.shards), []).append(target)
+
+        deadlines = []
+        if self.cycle_timeout:
+            deadlines.append(time.time() + self.cycle_timeout)
+        if self.budget:
+            deadlines.append(time.time() + max(0.0, self.budget.fetch_remaining()) + self.DONE_GRACE)
+        deadline = min(deadlines) if deadlines else None
+
+        shared = self.collect_state()
+        remaining = {}
+        for shard, group in groups.items():
+            if not self._processes[shard].is_alive():
+                print(f"[分片] 子进程 {shard} 已退出 (退出码 {self._processes[shard].exitcode})，正在重启...")
+                self._start(shard)
+            self._requests[shard].put((self._cycle, group, list(instances), shared))
+            remaining[shard] = set(group)
+
+        while remaining:
+            wait = self.poll_interval
+            if deadline is not None:
+                left = deadline - time.time()
+                if left <= 0:
+                    # 与抓取失败一样产出 None (调用方据此重新排期)；子进程稍后送达的结果会因轮次不符被丢弃
+                    count = sum(len(group) for group in remaining.values())
+                    print(f"[分片] 抓取时间已用完，{count} 个目标本轮没有结果")
+                    for group in remaining.values():
+                        for target in group:
+                            yield target, None
+                    break
+                wait = min(wait, left)
+            try:
+                kind, cycle, shard, payload = self._results.get(timeout=wait)
+            except queue.Empty:
+                for shard in [s for s in remaining if not self._processes[s].is_alive()]:
+                    print(f"[分片] 子进程 {shard} 意外退出，{len(remaining[shard])} 个目标本轮没有结果")
+                    for target in remaining.pop(shard):
+                        yield target, None
+                continue
+            # 上一轮被中断时残留的结果直接丢弃
+            if cycle != self._cycle or shard not in remaining:
+                continue
+            if kind == 'result':
+                target, tweets = payload
+                remaining[shard].discard(target)
+                yield target, tweets
+                continue
+
+            state, metrics, error = payload
+            if error:
+                print(f"[分片] 子进程 {shard} 抓取异常: {error}")
+            self.merge_state(state, metrics)
+            for target in remaining.pop(shard):
+                yield target, None
+
+    def close(self):
+        for shard, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                self._requests[shard].put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+                process.join()
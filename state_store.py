@@ -0,0 +1,309 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from nitter import snowflake_id
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS last_ids (
+    target TEXT PRIMARY KEY,
+    guid TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seen (
+    target TEXT NOT NULL,
+    guid TEXT NOT NULL,
+    seen_at INTEGER NOT NULL,
+    PRIMARY KEY (target, guid)
+);
+CREATE INDEX IF NOT EXISTS seen_by_time ON seen (target, seen_at);
+CREATE INDEX IF NOT EXISTS seen_by_guid ON seen (guid);
+CREATE TABLE IF NOT EXISTS deliveries (
+    target TEXT NOT NULL,
+    guid TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (target, guid)
+);
+CREATE TABLE IF NOT EXISTS instance_health (
+    instance TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cutoffs (
+    target TEXT PRIMARY KEY,
+    tweet_id INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checks (
+    target TEXT PRIMARY KEY,
+    checked_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class StateStore:
+    """
+    基于 SQLite (WAL 模式) 的运行状态库
+    按目标记录最新推文 ID、推送过的推文 ID 历史 (带时间戳)、推送状态以及实例健康度，
+    每次变更都是一个小事务，进程中途崩溃也不会损坏已有状态；
+    last_id.json 是导出文件 (供 GitHub Actions 提交)，每轮开始时与它对账，数据库丢失或落后时从中恢复
+    """
+
+    def __init__(self, path, seen_per_target=500):
+        self.path = path
+        self.seen_per_target = seen_per_target
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def _db(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def import_last_ids(self, json_path):
+        """
+        每轮开始时与 last_id.json 对账: 文件中与上次导出不同 (数据库重建、缓存没有随失败的运行保存、人工修改) 的条目，
+        在数据库中没有该目标或文件中的推文 ID 更新时采用文件的值，并加入已推送历史
+        数据库比文件更新 (例如提交失败) 时保留数据库的值，返回采用的条目数
+        """
+        last_ids = {}
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    last_ids = {str(k): str(v) for k, v in data.items() if v}
+            except Exception as e:
+                print(f"[状态库] 读取 {json_path} 失败: {e}")
+        if not last_ids:
+            return 0
+
+        with self._lock:
+            db = self._db()
+            exported = self._exported()
+            current = self.last_ids()
+            adopted = {}
+            for target, guid in last_ids.items():
+                if exported.get(target) == guid or current.get(target) == guid:
+                    continue
+                file_number, db_number = snowflake_id(guid), snowflake_id(current.get(target))
+                if target not in current or file_number is None or db_number is None or file_number > db_number:
+                    adopted[target] = guid
+            if not adopted:
+                return 0
+            now = int(time.time())
+            with db:
+                db.executemany(
+                    "INSERT INTO last_ids (target, guid, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (target) DO UPDATE SET guid = excluded.guid, updated_at = excluded.updated_at",
+                    [(target, guid, now) for target, guid in adopted.items()]
+                )
+                db.executemany(
+                    "INSERT OR REPLACE INTO seen (target, guid, seen_at) VALUES (?, ?, ?)",
+                    [(target, guid, now) for target, guid in adopted.items()]
+                )
+            print(f"[状态库] 已从 {os.path.basename(json_path)} 采用 {len(adopted)} 个目标的最新推文 ID")
+            return len(adopted)
+
+    def _exported(self):
+        row = self._db().execute("SELECT value FROM meta WHERE key = 'exported_last_ids'").fetchone()
+        try:
+            return json.loads(row[0]) if row else {}
+        except ValueError:
+            return {}
+
+    def last_ids(self):
+        with self._lock:
+            return dict(self._db().execute("SELECT target, guid FROM last_ids ORDER BY rowid"))
+
+    def is_seen(self, target, guid):
+        with self._lock:
+            return self._db().execute(
+                "SELECT 1 FROM seen WHERE target = ? AND guid = ?", (target, guid)
+            ).fetchone() is not None
+
+    def seen_by(self, guid):
+        """
+        跨目标查询: 返回最近推送过该推文的目标 (已推送历史按目标限量保留)，没有时返回 None
+        """
+        with self._lock:
+            row = self._db().execute(
+                "SELECT target FROM seen WHERE guid = ? ORDER BY seen_at DESC LIMIT 1", (guid,)
+            ).fetchone()
+            return row[0] if row else None
+
+    def cutoff(self, target):
+        """
+        目标的原创推文比较基准 (推文 ID 数值)，没有记录时返回 None
+        """
+        with self._lock:
+            row = self._db().execute("SELECT tweet_id FROM cutoffs WHERE target = ?", (target,)).fetchone()
+            return row[0] if row else None
+
+    def raise_cutoff(self, target, tweet_id):
+        """
+        把比较基准提高到 tweet_id (只升不降)
+        """
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT INTO cutoffs (target, tweet_id, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (target) DO UPDATE SET tweet_id = MAX(tweet_id, excluded.tweet_id), "
+                    "updated_at = excluded.updated_at",
+                    (target, tweet_id, int(time.time()))
+                )
+
+    def mark_checked(self, target):
+        """
+        记录目标最近一次成功抓取的时间
+        """
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("INSERT OR REPLACE INTO checks (target, checked_at) VALUES (?, ?)", (target, int(time.time())))
+
+    def least_recently_checked(self, targets):
+        """
+        按最近一次成功抓取的时间从早到晚排列目标，从未抓取过的排在最前，时间相同的保持原有顺序
+        """
+        with self._lock:
+            checked = dict(self._db().execute("SELECT target, checked_at FROM checks"))
+        return sorted(targets, key=lambda target: checked.get(target, 0))
+
+    def record_delivery(self, target, guid, status):
+        """
+        记录推送状态 (pending / delivered / failed)，每次记录 pending 计为一次尝试
+        """
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT INTO deliveries (target, guid, status, attempts, updated_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (target, guid) DO UPDATE SET status = excluded.status, "
+                    "attempts = attempts + excluded.attempts, updated_at = excluded.updated_at",
+                    (target, guid, status, 1 if status == 'pending' else 0, int(time.time()))
+                )
+
+    def mark_delivered(self, target, guid, advance=True, status='delivered'):
+        """
+        推文确认送达: 在同一个事务中推进最新 ID、加入已推送历史并更新推送状态
+        advance 为 False 时不推进最新 ID (更早的推文尚未送达，下一轮需要从更早的位置继续追赶)；
+        status 为 duplicate 表示该推文已经通过其他目标推送过，本目标只记录不重复推送
+        """
+        with self._lock:
+            db = self._db()
+            now = int(time.time())
+            with db:
+                if advance:
+                    db.execute(
+                        "INSERT INTO last_ids (target, guid, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT (target) DO UPDATE SET guid = excluded.guid, updated_at = excluded.updated_at",
+                        (target, guid, now)
+                    )
+                db.execute("INSERT OR REPLACE INTO seen (target, guid, seen_at) VALUES (?, ?, ?)", (target, guid, now))
+                db.execute(
+                    "INSERT INTO deliveries (target, guid, status, attempts, updated_at) VALUES (?, ?, ?, 0, ?) "
+                    "ON CONFLICT (target, guid) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+                    (target, guid, status, now)
+                )
+
+    def advance_past_seen(self, target, guids):
+        """
+        guids 为页面上的推文 ID (从新到旧)。比最新 ID 更新的推文若连续已推送过 (更早的推文失败期间送达的)，
+        把最新 ID 推进到这段连续推文中最新的一条；推进了时返回新的最新 ID，否则返回 None
+        """
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT guid FROM last_ids WHERE target = ?", (target,)).fetchone()
+            if not row or row[0] not in guids:
+                return None
+            newest = None
+            for guid in reversed(guids[:guids.index(row[0])]):
+                if db.execute("SELECT 1 FROM seen WHERE target = ? AND guid = ?", (target, guid)).fetchone() is None:
+                    break
+                newest = guid
+            if newest is None:
+                return None
+            with db:
+                db.execute("UPDATE last_ids SET guid = ?, updated_at = ? WHERE target = ?", (newest, int(time.time()), target))
+            return newest
+
+    def prune(self):
+        """
+        每个目标只保留最近 seen_per_target 条已推送记录，推送状态与抓取时间保留 30 天
+        """
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "DELETE FROM seen WHERE rowid IN ("
+                    " SELECT rowid FROM (SELECT rowid, ROW_NUMBER() OVER"
+                    " (PARTITION BY target ORDER BY seen_at DESC, rowid DESC) AS rank FROM seen)"
+                    " WHERE rank > ?)",
+                    (self.seen_per_target,)
+                )
+                db.execute("DELETE FROM deliveries WHERE updated_at < ?", (int(time.time()) - 30 * 24 * 3600,))
+                db.execute("DELETE FROM checks WHERE checked_at < ?", (int(time.time()) - 30 * 24 * 3600,))
+
+    def load_health(self):
+        with self._lock:
+            return {
+                instance: json.loads(data)
+                for instance, data in self._db().execute("SELECT instance, data FROM instance_health")
+            }
+
+    def save_health(self, entries):
+        with self._lock:
+            db = self._db()
+            now = int(time.time())
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO instance_health (instance, data, updated_at) VALUES (?, ?, ?)",
+                    [(instance, json.dumps(entry, ensure_ascii=False), now) for instance, entry in entries.items()]
+                )
+
+    def export_last_ids(self, json_path):
+        """
+        导出各目标的最新推文 ID 为 last_id.json 的格式 (内容没有变化时不改写文件)，返回是否写入
+        """
+        data = self.last_ids()
+        content = json.dumps(data, indent=2, ensure_ascii=False)
+        # 记录导出的内容，下一轮对账时据此判断文件是否被外部改动
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('exported_last_ids', ?)",
+                           (json.dumps(data, ensure_ascii=False),))
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    if json.load(f) == data:
+                        return False
+            except Exception:
+                pass
+        tmp_path = json_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, json_path)
+        return True
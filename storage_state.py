@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import time
+import urllib.parse
+
+class StorageStateCache:
+    """
+    按实例缓存通过浏览器验证后的 storage_state (cookies + localStorage) 及对应的 User-Agent
+    后续同一实例的新上下文直接带上这些状态，免去重复解验证；
+    超过 ttl 的条目视为过期，验证页再次出现时由调用方主动作废
+    """
+
+    def __init__(self, directory, ttl=6 * 3600):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, instance):
+        host = urllib.parse.urlparse(instance).netloc or instance
+        digest = hashlib.sha1(instance.rstrip('/').encode('utf-8')).hexdigest()[:8]
+        safe_host = ''.join(c if c.isalnum() or c in '.-' else '_' for c in host)
+        return os.path.join(self.directory, f"{safe_host}-{digest}.json")
+
+    def get(self, instance):
+        """
+        返回 {'user_agent': ..., 'state': {...}}，不存在或已过期时返回 None
+        """
+        path = self._path(instance)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except Exception as e:
+            print(f"[验证缓存] 读取 {instance} 的缓存失败: {e}")
+            return None
+        if time.time() - entry.get('saved_at', 0) > self.ttl:
+            self.invalidate(instance)
+            return None
+        return entry
+
+    def save(self, instance, state, user_agent):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(instance)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'saved_at': int(time.time()), 'user_agent': user_agent, 'state': state}, f)
+            os.replace(tmp_path, path)
+            print(f"[验证缓存] 已保存 {instance} 的验证状态")
+        except Exception as e:
+            print(f"[验证缓存] 保存 {instance} 的验证状态失败: {e}")
+
+    def invalidate(self, instance):
+        try:
+            os.remove(self._path(instance))
+            print(f"[验证缓存] 已作废 {instance} 的验证状态")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[验证缓存] 作废 {instance} 的验证状态失败: {e}")
+
+    def cookies_for(self, instance):
+        """
+        给普通 HTTP 请求使用的 (User-Agent, {cookie 名: 值})，没有可用缓存时返回 (None, None)
+        """
+        entry = self.get(instance)
+        if not entry:
+            return None, None
+        host = urllib.parse.urlparse(instance).hostname or ''
+        cookies = {
+            c['name']: c['value']
+            for c in entry.get('state', {}).get('cookies', [])
+            if host.endswith(c.get('domain', '').lstrip('.'))
+        }
+        return entry.get('user_agent'), cookies
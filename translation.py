@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from fetch_tiers import get_http_session
+from metrics import incr, timer
+
+# Google Translate (GTX) 免费接口: single 每次翻译一段文本，t 支持在一个请求中携带多个 q
+# 可通过环境变量指向兼容的替代服务 (如离线基准测试中的本地替身)
+TRANSLATE_URL = os.environ.get('TRANSLATE_URL', "https://translate.googleapis.com/translate_a/single")
+TRANSLATE_BATCH_URL = os.environ.get('TRANSLATE_BATCH_URL', "https://translate.googleapis.com/translate_a/t")
+TRANSLATE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+# 单个批量请求携带的最大字符数，过长的请求会被接口拒绝
+BATCH_MAX_CHARS = 4000
+
+class TranslationCache:
+    """
+    持久化翻译缓存，键为 (目标语言, 原文) 的哈希
+    条目超过 ttl 秒过期；总数超过 max_entries 时淘汰最久未使用的条目
+    """
+
+    def __init__(self, path=None, max_entries=2000, ttl=30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(text, target_lang):
+        return hashlib.sha1(f"{target_lang}\n{text}".encode('utf-8')).hexdigest()
+
+    def _load(self):
+        if self._data is not None:
+            return
+        self._data = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    # 字典按最近使用时间排列，最久未使用的在最前面
+                    self._data = dict(sorted(data.items(), key=lambda item: item[1].get('used', 0)))
+            except Exception as e:
+                print(f"[系统] 加载翻译缓存失败: {e}")
+
+    def get(self, text, target_lang):
+        with self._lock:
+            self._load()
+            key = self._key(text, target_lang)
+            entry = self._data.get(key)
+            if not entry:
+                return None
+            now = time.time()
+            if now - entry.get('created', 0) > self.ttl:
+                del self._data[key]
+                self._dirty = True
+                return None
+            entry['used'] = round(now, 3)
+            self._data[key] = self._data.pop(key)
+            self._dirty = True
+            return entry['text']
+
+    def put(self, text, target_lang, translated):
+        with self._lock:
+            self._load()
+            now = time.time()
+            key = self._key(text, target_lang)
+            self._data.pop(key, None)
+            self._data[key] = {'text': translated, 'created': int(now), 'used': round(now, 3)}
+            self._dirty = True
+            self._evict(now)
+
+    def _evict(self, now):
+        expired = [key for key, entry in self._data.items() if now - entry.get('created', 0) > self.ttl]
+        for key in expired:
+            del self._data[key]
+        excess = len(self._data) - self.max_entries
+        if excess > 0:
+            for key in list(self._data)[:excess]:
+                del self._data[key]
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            try:
+                self._evict(time.time())
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except Exception as e:
+                print(f"[系统] 保存翻译缓存失败: {e}")
+
+def _request_single(text, target_lang):
+    params = {
+        "client": "gtx",
+        "sl": "auto",
+        "tl": target_lang,
+        "dt": "t",
+        "q": text
+    }
+    with timer('translate'):
+        resp = get_http_session().get(TRANSLATE_URL, params=params, headers=TRANSLATE_HEADERS, timeout=15)
+        resp.raise_for_status()
+
+        # 解析返回的 JSON
+        data = resp.json()
+    if data and data[0]:
+        translated_parts = [part[0] for part in data[0] if part[0]]
+        return "".join(translated_parts)
+    return None
+
+def _request_batch(texts, target_lang):
+    """
+    一次请求翻译多段文本，返回与 texts 一一对应的译文列表；返回条数对不上时抛出异常
+    """
+    with timer('translate_batch'):
+        resp = get_http_session().post(
+            TRANSLATE_BATCH_URL,
+            params={"client": "gtx", "sl": "auto", "tl": target_lang},
+            data=[("q", text) for text in texts],
+            headers=TRANSLATE_HEADERS,
+            timeout=20
+        )
+        resp.raise_for_status()
+        data = resp.json()
+    if not isinstance(data, list) or len(data) != len(texts):
+        raise ValueError(f"批量翻译返回 {len(data) if isinstance(data, list) else type(data).__name__} 条，期望 {len(texts)} 条")
+    # sl=auto 时每一项为 [译文, 源语言]
+    return [item[0] if isinstance(item, list) else item for item in data]
+
+def translate_text(text, target_lang='zh-CN', cache=None):
+    """
+    使用 Google Translate (GTX) 接口进行免费翻译，命中缓存时不发请求；失败返回 None
+    """
+    if not text or not text.strip():
+        return ""
+
+    if cache is not None:
+        cached = cache.get(text, target_lang)
+        if cached is not None:
+            print("[翻译] 命中缓存")
+            incr('translate_cache_hit')
+            return cached
+
+    try:
+        translated = _request_single(text, target_lang)
+    except Exception as e:
+        print(f"[翻译] 失败: {e}")
+        return None
+    if translated and cache is not None:
+        cache.put(text, target_lang, translated)
+    return translated
+
+def translate_batch(texts, target_lang='zh-CN', cache=None, batch_size=10):
+    """
+    批量翻译: 跳过空文本与已缓存的文本，其余按 batch_size 与 BATCH_MAX_CHARS 分组，每组一个请求
+    返回 {原文: 译文}；某组批量请求失败时该组逐条退回 translate_text，仍失败的原文不在结果中
+    """
+    results = {}
+    pending = []
+    for text in dict.fromkeys(texts):
+        if not text or not text.strip():
+            continue
+        cached = cache.get(text, target_lang) if cache is not None else None
+        if cached is not None:
+            results[text] = cached
+            incr('translate_cache_hit')
+        else:
+            pending.append(text)
+
+    groups = []
+    for text in pending:
+        if (groups and len(groups[-1]) < batch_size
+                and sum(len(t) for t in groups[-1]) + len(text) <= BATCH_MAX_CHARS):
+            groups[-1].append(text)
+        else:
+            groups.append([text])
+
+    for group in groups:
+        translated = None
+        if len(group) > 1:
+            try:
+                translated = _request_batch(group, target_lang)
+                print(f"[翻译] 批量翻译 {len(group)} 条")
+            except Exception as e:
+                print(f"[翻译] 批量翻译失败，改为逐条翻译: {e}")
+        if translated is None:
+            translated = [translate_text(text, target_lang, cache) for text in group]
+        for text, result in zip(group, translated):
+            if not result:
+                continue
+            results[text] = result
+            if cache is not None:
+                cache.put(text, target_lang, result)
+    return results
@@ -1,14 +1,28 @@
 import os
 import time
-import random
+import contextlib
+import functools
 import json
-import requests
 from datetime import datetime
 from playwright.sync_api import sync_playwright
 from playwright_stealth import stealth_sync
-from bs4 import BeautifulSoup
-import tempfile
-import base64
+from fetch_tiers import TIER_HTTP, TIER_RSS, TierAttempt, TierMemory, enabled_tiers, fetch_http
+from instance_health import InstanceHealth
+from rss_feed import RssCache, fetch_rss
+from storage_state import StorageStateCache
+import translation
+from translation import TranslationCache, translate_batch
+from image_pipeline import ImagePipeline, MediaMap
+from delivery import DingTalkDelivery, Message
+from state_store import StateStore
+from scheduler import PollScheduler
+from budget import CycleBudget, timeout_until
+from metrics import METRICS, CycleProfiler, timer
+from extractors import parse_timeline, set_default_backend
+from nitter import (
+    NITTER_INSTANCES, build_target_url, get_random_user_agent,
+    CHALLENGE_KEYWORDS, PAGE_STATE_JS, READY_SELECTOR, announce_tweet, group_tweets_by_author, is_challenge_page, make_batches, should_block_request, snowflake_id,
+)
 
 # 配置
 USERS_STR = os.environ.get('TWITTER_USER', 'elonmusk')
@@ -16,319 +30,436 @@ USERS = [u.strip() for u in USERS_STR.split(',') if u.strip()]
 WEBHOOK_URL = os.environ.get('DINGTALK_WEBHOOK')
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-LAST_ID_FILE = os.path.join(BASE_DIR, 'last_id.json')
+LAST_ID_FILE = os.environ.get('LAST_ID_FILE', os.path.join(BASE_DIR, 'last_id.json'))
 
 # 运行模式配置
 LOOP_MODE = os.environ.get('LOOP_MODE', 'false').lower() == 'true'
 INTERVAL = int(os.environ.get('LOOP_INTERVAL', '600')) # 默认 10 分钟 (600秒)
 
-# 备选 Nitter 实例 (仅作为域名参考)
-NITTER_INSTANCES = [
-    'https://xcancel.com',
-    'https://nitter.privacyredirect.com',
-    'https://nitter.poast.org',
-    'https://nitter.hu',
-    'https://nitter.moomoo.me',
-    'https://nitter.net',
-]
-
-INSTANCES_FILE = os.path.join(BASE_DIR, 'instances.json')
-
-def get_random_user_agent():
-    ua_list = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/121.0.0.0",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0"
-    ]
-    return random.choice(ua_list)
+# 自适应轮询 (仅循环模式): 按各目标发帖速率的 EWMA 安排下次轮询时间，间隔限制在 [SCHEDULE_MIN_INTERVAL, SCHEDULE_MAX_INTERVAL]，
+# 所有目标共享每分钟 FETCH_BUDGET 次抓取 (0 表示不限)；未开启时每轮按 LOOP_INTERVAL 抓取全部目标
+ADAPTIVE_SCHEDULE = os.environ.get('ADAPTIVE_SCHEDULE', 'false').lower() == 'true'
+SCHEDULE_MIN_INTERVAL = int(os.environ.get('SCHEDULE_MIN_INTERVAL', '120'))
+SCHEDULE_MAX_INTERVAL = int(os.environ.get('SCHEDULE_MAX_INTERVAL', '3600'))
+FETCH_BUDGET = int(os.environ.get('FETCH_BUDGET', '10'))
+
+# 浏览器复用配置: 同一个 Chromium 最多分配多少个上下文后主动重启 (防止内存膨胀)
+BROWSER_MAX_USES = int(os.environ.get('BROWSER_MAX_USES', '100'))
+# 浏览器中拦截图片/视频/字体/第三方脚本；页面就绪 (含通过验证) 的最长等待秒数
+BLOCK_RESOURCES = os.environ.get('BLOCK_RESOURCES', 'true').lower() == 'true'
+PAGE_READY_TIMEOUT = int(os.environ.get('PAGE_READY_TIMEOUT', '25'))
+
+# 异步并发抓取配置: 总并发页面数与单个实例的并发页面数
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'false').lower() == 'true'
+MAX_CONCURRENCY = int(os.environ.get('MAX_CONCURRENCY', '4'))
+PER_INSTANCE_CONCURRENCY = int(os.environ.get('PER_INSTANCE_CONCURRENCY', '2'))
+
+# 对冲请求: 当前实例在 HEDGE_DELAY 秒内没有结果时在下一个实例上并行发起同样的抓取
+# HEDGE_DELAY 为 0 时自动取该实例最近成功耗时的 p90；对冲基于异步引擎，开启后自动使用异步模式
+HEDGE_MODE = os.environ.get('HEDGE_MODE', 'false').lower() == 'true'
+HEDGE_DELAY = float(os.environ.get('HEDGE_DELAY', '0'))
+MAX_HEDGES = int(os.environ.get('MAX_HEDGES', '2'))
+
+# 时间线解析后端: auto (selectolax > lxml > bs4 中第一个已安装的) / selectolax / lxml / bs4 (参考实现)
+PARSER_BACKEND = set_default_backend(os.environ.get('PARSER_BACKEND', 'auto'))
+
+# 追赶模式: 大于 1 时解析整页时间线，把上次推送之后的所有新推文 (按雪花 ID 判断) 从旧到新依次推送，
+# 每个目标每轮最多推送 CATCHUP_MAX 条；1 表示只推送最新一条
+CATCHUP_MAX = int(os.environ.get('CATCHUP_MAX', '1'))
+
+# 跨目标去重: search: 关键词与账号目标抓到同一条推文时只翻译、上传、推送一次 (本轮内以及与历史推送记录之间)
+DEDUP_ACROSS_TARGETS = os.environ.get('DEDUP_ACROSS_TARGETS', 'true').lower() == 'true'
+
+# 分片抓取: 大于 1 时按目标名的稳定哈希把目标分给 SHARDS 个子进程 (各自一个浏览器) 并行抓取，
+# 结果汇总回主进程统一推送并写入状态
+SHARDS = int(os.environ.get('SHARDS', '1'))
+
+# 合并时间线: 每组最多合并多少个普通用户一起加载 (1 表示关闭)
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '1'))
+
+INSTANCES_FILE = os.environ.get('INSTANCES_FILE', os.path.join(BASE_DIR, 'instances.json'))
+
+# 运行期缓存目录 (抓取层级等)，GitHub Actions 中通过 actions/cache 在多次运行间保留
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+
+# 抓取层级 (按成本从低到高，逗号分隔): rss = RSS 条件请求, http = 普通 HTTP 请求, browser = Playwright
+FETCH_TIERS = enabled_tiers(os.environ.get('FETCH_TIERS', 'http,browser'))
+TIER_MEMORY = TierMemory(os.path.join(CACHE_DIR, 'fetch_tiers.json'), FETCH_TIERS)
+RSS_CACHE = RssCache(os.path.join(CACHE_DIR, 'rss_validators.json'))
+
+# 浏览器验证通过后的 cookies/localStorage 缓存 (按实例)，超过 STORAGE_STATE_TTL 秒作废
+STORAGE_STATE_TTL = int(os.environ.get('STORAGE_STATE_TTL', str(6 * 3600)))
+STORAGE_STATES = StorageStateCache(os.path.join(CACHE_DIR, 'storage_state'), STORAGE_STATE_TTL)
+
+# 翻译缓存: 按 (目标语言, 原文) 缓存译文，最多 TRANSLATION_CACHE_SIZE 条，超过 TRANSLATION_CACHE_TTL 秒过期
+TRANSLATION_CACHE_SIZE = int(os.environ.get('TRANSLATION_CACHE_SIZE', '2000'))
+TRANSLATION_CACHE_TTL = int(os.environ.get('TRANSLATION_CACHE_TTL', str(30 * 24 * 3600)))
+TRANSLATION_CACHE = TranslationCache(os.path.join(CACHE_DIR, 'translations.json'),
+                                     TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL)
+# 每轮推送前把待发送推文合并翻译，每个请求最多携带多少条 (1 表示逐条翻译)
+TRANSLATE_BATCH_SIZE = int(os.environ.get('TRANSLATE_BATCH_SIZE', '10'))
+
+# 图片上传: 同一条推文的图片并行上传的线程数；已上传过的媒体记录在 media_map.json 中直接复用
+IMAGE_UPLOAD_WORKERS = int(os.environ.get('IMAGE_UPLOAD_WORKERS', '4'))
+MEDIA_MAP = MediaMap(os.path.join(CACHE_DIR, 'media_map.json'))
+IMAGE_PIPELINE = ImagePipeline(MEDIA_MAP, IMAGE_UPLOAD_WORKERS, os.environ.get('IMGBB_API_KEY', '').strip())
+
+# 钉钉推送: 每分钟最多 DINGTALK_RATE_LIMIT 条，限流/网络错误最多重试 DINGTALK_MAX_RETRIES 次；
+# 积压超过当前配额时最多把 DINGTALK_COALESCE_MAX 条推文合并成一条消息 (1 表示不合并)
+DINGTALK_RATE_LIMIT = int(os.environ.get('DINGTALK_RATE_LIMIT', '20'))
+DINGTALK_MAX_RETRIES = int(os.environ.get('DINGTALK_MAX_RETRIES', '3'))
+DINGTALK_COALESCE_MAX = int(os.environ.get('DINGTALK_COALESCE_MAX', '5'))
+DINGTALK_MAX_WAIT = float(os.environ.get('DINGTALK_MAX_WAIT', '120'))
+DELIVERY = DingTalkDelivery(WEBHOOK_URL, DINGTALK_RATE_LIMIT, max_retries=DINGTALK_MAX_RETRIES,
+                            coalesce=DINGTALK_COALESCE_MAX > 1, max_per_message=DINGTALK_COALESCE_MAX,
+                            max_wait=DINGTALK_MAX_WAIT)
+
+# 实例健康度 (成功率/延迟/验证页频率/熔断状态) 的导出文件；每轮都会变化，放在缓存目录中不随仓库提交
+HEALTH_FILE = os.environ.get('HEALTH_FILE', os.path.join(CACHE_DIR, 'instance_health.json'))
+# 运行状态库 (SQLite WAL): 各目标最新推文 ID、已推送历史、推送状态与实例健康度
+# last_id.json 仅作为导出文件随仓库提交，数据库丢失时从中恢复
+STATE_DB = os.environ.get('STATE_DB', os.path.join(CACHE_DIR, 'state.db'))
+STATE = StateStore(STATE_DB)
+HEALTH = InstanceHealth(HEALTH_FILE, store=STATE)
+
+# 每轮的分阶段耗时报告 (cycle_report.json) 与 Prometheus textfile (x2ding.prom) 的输出目录，留空则只打印摘要；
+# PROFILE_CYCLE 开启时同时对每轮做 cProfile 采样 (cycle.prof / cycle.txt)
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(CACHE_DIR, 'metrics'))
+PROFILER = CycleProfiler(os.environ.get('PROFILE_CYCLE', 'false').lower() == 'true' and bool(METRICS_DIR))
+
+SCHEDULER = PollScheduler(os.path.join(CACHE_DIR, 'schedule.json'), INTERVAL, SCHEDULE_MIN_INTERVAL,
+                          SCHEDULE_MAX_INTERVAL, FETCH_BUDGET) if LOOP_MODE and ADAPTIVE_SCHEDULE else None
+
+# 单次运行的时间预算 (仅非循环模式): 启动 CYCLE_DEADLINE 秒后 (或到达 CYCLE_DEADLINE_AT 时间戳时) 必须结束，0 表示不限；
+# 抓取在截止前 CYCLE_RESERVE 秒停止，余下时间用于翻译、推送与保存状态。开启后最久未检查的目标优先抓取，
+# 各目标与各实例的超时按剩余时间动态收紧，每推送成功一条就导出一次 last_id.json
+CYCLE_DEADLINE = float(os.environ.get('CYCLE_DEADLINE', '0'))
+CYCLE_DEADLINE_AT = float(os.environ.get('CYCLE_DEADLINE_AT', '0'))
+CYCLE_RESERVE = float(os.environ.get('CYCLE_RESERVE', '60'))
+BUDGET = CycleBudget(CYCLE_DEADLINE_AT or time.time() + CYCLE_DEADLINE, CYCLE_RESERVE) \
+    if (CYCLE_DEADLINE_AT > 0 or CYCLE_DEADLINE > 0) and not LOOP_MODE else None
 
 def load_instances():
     """
     从本地缓存加载健康的 Nitter 实例
+    兼容两种格式: 旧版纯 URL 列表，以及 update_instances.py 探测后写入的
+    {"updated_at": ..., "instances": [{"url": ..., "total": ..., ...}, ...]}
     """
     if os.path.exists(INSTANCES_FILE):
         try:
             with open(INSTANCES_FILE, 'r', encoding='utf-8') as f:
-                instances = json.load(f)
-                if instances and isinstance(instances, list):
-                    print(f"[系统] 成功从本地缓存加载 {len(instances)} 个实例")
-                    return instances
+                data = json.load(f)
+            entries = data.get('instances', []) if isinstance(data, dict) else data
+            instances = []
+            if isinstance(entries, list):
+                for entry in entries:
+                    url = entry.get('url') if isinstance(entry, dict) else entry
+                    if isinstance(url, str) and url and url not in instances:
+                        instances.append(url)
+            if instances:
+                updated_at = data.get('updated_at') if isinstance(data, dict) else None
+                suffix = f" (探测时间 {updated_at})" if updated_at else ""
+                print(f"[系统] 成功从本地缓存加载 {len(instances)} 个实例{suffix}")
+                return instances
         except Exception as e:
             print(f"[系统] 加载实例缓存失败: {e}")
     
     print("[系统] 缓存不存在或损坏，采用内置兜底实例列表")
     return NITTER_INSTANCES
 
-def scrape_nitter_with_playwright(target, dynamic_instances=None):
+class BrowserManager:
     """
-    使用 Playwright 模拟浏览器访问 Nitter 并抓取最新推文
+    长驻 Chromium 管理器
+    整个进程只启动一次浏览器，为每次访问分配全新的上下文；
+    浏览器崩溃或使用次数达到上限后自动重启，退出时统一关闭
     """
-    is_search = target.startswith('search:')
-    keyword = target[7:] if is_search else target
-    
-    # 优先使用动态获取的实例，如果没有则用内置的
-    instances = dynamic_instances if dynamic_instances else NITTER_INSTANCES.copy()
-    # 为了分布压力，我们在保持高分实例在前的前提下，对前 5 名进行小范围随机
-    if len(instances) > 5:
-        top_5 = instances[:5]
-        random.shuffle(top_5)
-        others = instances[5:]
-        random.shuffle(others)
-        instances = top_5 + others
-    else:
-        random.shuffle(instances)
-    
-    with sync_playwright() as p:
+
+    def __init__(self, max_uses=BROWSER_MAX_USES, headless=True):
+        self.max_uses = max_uses
+        self.headless = headless
+        self.uses = 0
+        self.launches = 0
+        self._playwright = None
+        self._browser = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _launch(self):
+        self._shutdown_browser()
+        if self._playwright is None:
+            self._playwright = sync_playwright().start()
         # 启动浏览器 (头模式/无头模式取决于环境，GitHub Actions 建议 headless=True)
-        browser = p.chromium.launch(headless=True)
-        
-        for instance in instances:
+        with timer('browser_launch'):
+            self._browser = self._playwright.chromium.launch(headless=self.headless)
+        self.uses = 0
+        self.launches += 1
+        print(f"[浏览器] Chromium 已启动 (第 {self.launches} 次)")
+
+    def _shutdown_browser(self):
+        if self._browser is not None:
             try:
-                # 每个实例创建一个新上下文，模拟干净的访问
-                context = browser.new_context(
-                    user_agent=get_random_user_agent(),
-                    viewport={'width': 1280, 'height': 720}
-                )
-                page = context.new_page()
-                
-                # 应用 Stealth 插件绕过检测
-                stealth_sync(page)
-                
-                if is_search:
-                    url = f"{instance.rstrip('/')}/search?f=tweets&q={requests.utils.quote(keyword)}"
-                else:
-                    url = f"{instance.rstrip('/')}/{keyword}"
-                
-                print(f"[{target}] 正在加载: {url}")
-                
-                # 开始加载并处理可能的挑战
-                try:
-                    response = page.goto(url, wait_until="networkidle", timeout=45000)
-                    if response and response.status == 403:
-                        print(f"[{target}] 访问 {instance} 被拒 (403 Forbidden)")
-                        context.close()
-                        continue
-                except Exception as e:
-                    print(f"[{target}] 加载 {instance} 超时或失败: {e}")
-                    context.close()
-                    continue
-                
-                # 智能等待浏览器验证或"稍等片刻"挑战
-                challenge_keywords = ["Verifying your browser", "Just a moment", "Checking your browser"]
-                for i in range(5): # 最多等待 25 秒
-                    content = page.content()
-                    if any(kw in content for kw in challenge_keywords):
-                        print(f"[{target}] 检测到浏览器验证 ({i+1}/5)，尝试等待...")
-                        page.wait_for_timeout(5000)
-                    else:
-                        break
-                
-                # 获取最终渲染后的 HTML
-                soup = BeautifulSoup(page.content(), 'html.parser')
-                
-                # Nitter 页面推文解析逻辑
-                items = soup.select('.timeline-item')
-                if not items:
-                    print(f"[{target}] 在实例 {instance} 上未发现推文内容")
-                    context.close()
-                    continue
-                
-                # 扫描策略：扫描前 8 条推文，找到第一条非置顶的、有效的内容
-                valid_tweets = []
-                for item in items[:8]:
-                    # 1. 检查是否是置顶推文 (移除 "Pinned" text 匹配以防止误伤推文内容)
-                    is_pinned = item.select_one('.pinned') is not None
-                    if is_pinned:
-                        print(f"[{target}] 发现置顶推文，跳过")
-                        continue
-                    
-                    # 2. 检查是否是转发
-                    is_retweet = item.select_one('.retweet-header') is not None
-
-                    # 3. 提取图片 (增加更多可能的 Nitter 图片选择器)
-                    images = []
-                    img_els = item.select('.attachment.image img, .tweet-image img, .still-image img, .attachments img')
-                    for img in img_els:
-                        # 排除头像 (通常在 .tweet-avatar 或 .profile-card-avatar 中)
-                        if any(c in str(img.parent.get('class', [])) for c in ['avatar', 'profile']):
-                            continue
-                            
-                        src = img.get('src', '')
-                        if src:
-                            # 转换相对路径
-                            if src.startswith('//'):
-                                full_src = 'https:' + src
-                            elif src.startswith('/'):
-                                full_src = instance.rstrip('/') + src
-                            else:
-                                full_src = src
-                            
-                            # 还原原始 Twitter 图片链接以提高代理稳定性
-                            full_src = get_original_image_url(full_src)
-                            
-                            # 过滤掉一些明显的表情包或小图标 (可选)
-                            if 'emoji' in src.lower() or 'hashtag_click' in src:
-                                continue
-                                
-                            images.append(full_src)
-
-                    # 4. 提取视频 (新增)
-                    video_url = None
-                    try:
-                        video_el = item.select_one('video source')
-                        if not video_el:
-                            video_el = item.select_one('video')
-                        
-                        if video_el:
-                            # 尝试获取封面图作为额外图片
-                            poster_el = item.select_one('video')
-                            if poster_el:
-                                poster = poster_el.get('poster', '')
-                                if poster:
-                                    if poster.startswith('//'):
-                                        full_poster = 'https:' + poster
-                                    elif poster.startswith('/'):
-                                        full_poster = instance.rstrip('/') + poster
-                                    else:
-                                        full_poster = poster
-                                    # 尝试还原原始封面图地址并加入图片列表
-                                    full_poster = get_original_image_url(full_poster)
-                                    if full_poster not in images:
-                                        images.append(full_poster)
-
-                            # 提取视频流地址
-                            v_src = video_el.get('src', '')
-                            if v_src:
-                                if v_src.startswith('//'):
-                                    video_url = 'https:' + v_src
-                                elif v_src.startswith('/'):
-                                    video_url = instance.rstrip('/') + v_src
-                                else:
-                                    video_url = v_src
-                    except Exception as e:
-                        print(f"[{target}] 视频提取异常: {e}")
-
-                    # 提取关键信息
-                    content_el = item.select_one('.tweet-content')
-                    link_el = item.select_one('.tweet-link')
-                    date_el = item.select_one('.tweet-date a')
-                    author_el = item.select_one('.username')
-
-                    if not content_el or not link_el:
-                        continue
-
-                    # 提取推文 ID (从 /user/status/123...#m 中提取数字)
-                    link_href = link_el.get('href', '')
-                    tweet_id = link_href.split('/status/')[-1].split('#')[0] if '/status/' in link_href else link_href
-
-                    tweet_data = {
-                        'content': content_el.get_text(strip=True),
-                        'link': instance.rstrip('/') + link_href,
-                        'published': date_el.get('title', '') if date_el else 'Unknown Time',
-                        'author': author_el.get_text(strip=True) if author_el else keyword,
-                        'guid': tweet_id,
-                        'is_retweet': is_retweet,
-                        'images': images,
-                        'video_url': video_url
-                    }
-                    valid_tweets.append(tweet_data)
-                    
-                    # 只要找到了第一个非置顶的有效推文，我们就认为它是当前“最新的”
-                    if len(valid_tweets) >= 1:
-                        break
-
-                if valid_tweets:
-                    tweet = valid_tweets[0]
-                    retweet_tag = " [转发]" if tweet['is_retweet'] else ""
-                    print(f"[{target}] 成功从 {instance} 抓取{retweet_tag}推文: {tweet['guid']}")
-                    context.close()
-                    browser.close()
-                    return tweet
-
-                print(f"[{target}] {instance} 页面上未找到符合条件的非置顶推文")
-                context.close()
-
-            except Exception as e:
-                print(f"[{target}] 访问 {instance} 出错: {e}")
-                continue
-        
-        browser.close()
-    return None
+                self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+
+    def _ensure_browser(self):
+        if self._browser is None or not self._browser.is_connected():
+            if self._browser is not None:
+                print("[浏览器] 检测到 Chromium 已断开，正在重启...")
+            self._launch()
+        elif self.max_uses and self.uses >= self.max_uses:
+            print(f"[浏览器] 已分配 {self.uses} 个上下文，重启 Chromium 释放资源...")
+            self._launch()
+
+    def new_context(self, **kwargs):
+        """
+        分配一个全新的浏览器上下文，浏览器异常时重启后重试一次
+        """
+        self._ensure_browser()
+        try:
+            context = self._browser.new_context(**kwargs)
+        except Exception as e:
+            print(f"[浏览器] 创建上下文失败，重启后重试: {e}")
+            self._launch()
+            context = self._browser.new_context(**kwargs)
+        self.uses += 1
+        return context
+
+    def close(self):
+        self._shutdown_browser()
+        if self._playwright is not None:
+            try:
+                self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
 
-def upload_to_imgbb(image_url):
+def load_with_browser(browser_manager, target, instance, until=None):
     """
-    上传图片到 ImgBB 图床
-    需要配置环境变量: IMGBB_API_KEY
+    使用浏览器加载目标页面
+    返回 (html, reason)，reason 为 None 表示成功，否则为 '403' / 'challenge' / 'error'
+    until: 本目标的抓取截止时间点 (time.time())，各步骤的超时不会越过它
     """
-    api_key = os.environ.get('IMGBB_API_KEY', '').strip()
-    if not api_key:
-        print("[图床] ImgBB 未配置 API Key, 无法上传")
-        return None
-    
+    context = None
+    # 之前通过验证留下的 cookies/localStorage 与 UA 一并复用 (验证结果与 UA 绑定)
+    cached = STORAGE_STATES.get(instance)
+    user_agent = cached['user_agent'] if cached else get_random_user_agent()
     try:
-        # 下载图片
-        print(f"[图床] 正在从 {image_url} 下载图片...")
-        img_response = requests.get(image_url, timeout=30, headers={
-            'User-Agent': get_random_user_agent(),
-            'Referer': 'https://twitter.com/'
-        })
-        img_response.raise_for_status()
+        # 每个实例创建一个新上下文，模拟干净的访问
+        with timer('browser_context', target, instance):
+            context = browser_manager.new_context(
+                user_agent=user_agent,
+                viewport={'width': 1280, 'height': 720},
+                storage_state=cached['state'] if cached else None
+            )
+            page = context.new_page()
+
+            # 应用 Stealth 插件绕过检测
+            stealth_sync(page)
+
+        # 只需要 HTML: 拦截图片/视频/字体以及第三方脚本
+        if BLOCK_RESOURCES:
+            page.route("**/*", lambda route: route.abort()
+                       if should_block_request(route.request.resource_type, route.request.url, instance)
+                       else route.continue_())
         
-        # 转换为 base64
-        img_base64 = base64.b64encode(img_response.content).decode('utf-8')
+        url = build_target_url(instance, target)
+        print(f"[{target}] 正在加载: {url}")
         
-        # 上传到 ImgBB
-        print("[图床] 正在上传到 ImgBB...")
-        upload_response = requests.post(
-            'https://api.imgbb.com/1/upload',
-            data={
-                'key': api_key,
-                'image': img_base64
-            },
-            timeout=30
-        )
-        result = upload_response.json()
+        # 文档解析完成即可，不再等待 networkidle
+        try:
+            with timer('goto', target, instance):
+                response = page.goto(url, wait_until="domcontentloaded",
+                                     timeout=timeout_until(45, until) * 1000)
+            if response and response.status == 403:
+                print(f"[{target}] 访问 {instance} 被拒 (403 Forbidden)")
+                return None, '403'
+        except Exception as e:
+            print(f"[{target}] 加载 {instance} 超时或失败: {e}")
+            return None, 'error'
         
-        if result.get('success'):
-            url = result['data']['url']
-            print(f"[图床] ImgBB 上传成功: {url}")
-            return url
-        else:
-            print(f"[图床] ImgBB 上传失败: {result}")
-            return None
+        # 事件驱动的就绪判断: 时间线出现或验证页出现，以先到者为准
+        try:
+            with timer('page_ready', target, instance):
+                state = page.wait_for_function(PAGE_STATE_JS, arg=CHALLENGE_KEYWORDS,
+                                               timeout=timeout_until(PAGE_READY_TIMEOUT, until) * 1000).json_value()
+        except Exception:
+            state = None
+        if state == 'challenge':
+            METRICS.incr('challenge', target=target, instance=instance)
+            if cached:
+                # 缓存的验证状态已经失效
+                STORAGE_STATES.invalidate(instance)
+            # 验证页通过后会跳转回时间线，wait_for_selector 可以跨越跳转继续等待
+            print(f"[{target}] 检测到浏览器验证，等待通过...")
+            try:
+                with timer('challenge_wait', target, instance):
+                    page.wait_for_selector(READY_SELECTOR, timeout=timeout_until(PAGE_READY_TIMEOUT, until) * 1000)
+            except Exception:
+                pass
+        
+        # 获取最终渲染后的 HTML
+        html = page.content()
+        if is_challenge_page(html):
+            print(f"[{target}] {instance} 浏览器验证未通过")
+            return None, 'challenge'
+        if state == 'challenge':
+            STORAGE_STATES.save(instance, context.storage_state(), user_agent)
+        return html, None
     except Exception as e:
-        print(f"[图床] ImgBB 上传异常: {e}")
-        return None
+        print(f"[{target}] 访问 {instance} 出错: {e}")
+        return None, 'error'
+    finally:
+        # 浏览器是长驻的，任何路径上都要释放上下文
+        if context is not None:
+            try:
+                context.close()
+            except Exception:
+                pass
 
-def upload_image_to_bed(image_url):
+def scrape_instance(target, instance, browser_manager, scan_limit=8, max_tweets=1, until=None):
     """
-    上传图片到 ImgBB 图床
+    按层级在某个实例上抓取目标时间线，返回按页面顺序排列的非置顶推文列表，失败返回 None
+    优先使用该实例上次成功的层级，遇到挑战页/403/空时间线/未开放 RSS 时升级到下一层
+    结果与耗时会记入实例健康度；until 为本目标的抓取截止时间点，各层级的请求超时不会越过它
     """
-    return upload_to_imgbb(image_url)
-
+    attempt = TierAttempt(TIER_MEMORY, HEALTH, target, instance)
+    tweets, html = None, None
+    for tier in attempt.tiers():
+        if tier == TIER_RSS:
+            with timer('fetch_rss', target, instance):
+                tweets, reason = fetch_rss(instance, target, RSS_CACHE, timeout=timeout_until(15, until),
+                                           max_tweets=max_tweets)
+        elif tier == TIER_HTTP:
+            clearance_ua, clearance_cookies = STORAGE_STATES.cookies_for(instance)
+            with timer('fetch_http', target, instance):
+                html, reason = fetch_http(instance, target, timeout=timeout_until(15, until),
+                                          user_agent=clearance_ua, cookies=clearance_cookies)
+        else:
+            with timer('browser_load', target, instance):
+                html, reason = load_with_browser(browser_manager, target, instance, until)
+        attempt.result(tier, reason)
 
+    if attempt.reason is None and html is not None:
+        with timer('parse', target, instance):
+            tweets = parse_timeline(html, instance, target, scan_limit, max_tweets)
+    return attempt.finish(tweets)
 
-def send_dingtalk(webhook_url, tweet, target):
+def scrape_nitter_with_playwright(target, dynamic_instances=None, browser_manager=None, catchup=False, until=None):
     """
-    发送钉钉消息
+    访问 Nitter 并抓取最新推文 (静态请求优先，必要时使用 Playwright 模拟浏览器)
+    返回按页面顺序排列的推文列表: 默认只含最新一条；catchup 为 True 时包含页面上全部可见推文
+    browser_manager: 由调用方持有的长驻浏览器，未提供时临时启动一个并在结束后关闭
+    until: 本目标的抓取截止时间点 (time.time())，到点后不再尝试后面的实例
     """
-    if not webhook_url:
-        print("未配置 DINGTALK_WEBHOOK，跳过发送")
-        return False
+    instances = HEALTH.order(dynamic_instances or NITTER_INSTANCES)
+
+    owns_manager = browser_manager is None
+    if owns_manager:
+        browser_manager = BrowserManager()
 
+    try:
+        for instance in instances:
+            if until is not None and until - time.time() < 1:
+                print(f"[{target}] 本目标的抓取时间已用完，跳过其余实例")
+                break
+            if catchup:
+                # 追赶模式: 一次解析整页，新推文的筛选交给 run_cycles，不再额外加载
+                tweets = scrape_instance(target, instance, browser_manager, scan_limit=None, max_tweets=None, until=until)
+            else:
+                tweets = scrape_instance(target, instance, browser_manager, until=until)
+            if tweets:
+                # 只要找到了第一个非置顶的有效推文，我们就认为它是当前“最新的”
+                announce_tweet(target, instance, tweets[0])
+                return tweets
+    finally:
+        if owns_manager:
+            browser_manager.close()
+    return None
+
+def scrape_batch(usernames, dynamic_instances, browser_manager, catchup=False, until=None):
+    """
+    通过 Nitter 合并时间线 (/u1,u2,u3) 一次加载多个用户，按作者拆分回各用户
+    返回 {用户: 推文列表或 None}，列表规则与 scrape_nitter_with_playwright 一致
+    """
+    batch_target = ','.join(usernames)
+    for instance in HEALTH.order(dynamic_instances or NITTER_INSTANCES):
+        if until is not None and until - time.time() < 1:
+            print(f"[系统] 合并加载 {batch_target} 的抓取时间已用完，跳过其余实例")
+            break
+        tweets = scrape_instance(batch_target, instance, browser_manager, scan_limit=None, max_tweets=None,
+                                 until=until)
+        if not tweets:
+            continue
+        results = {}
+        for username, user_tweets in group_tweets_by_author(tweets, usernames).items():
+            if user_tweets is None:
+                # 页面上有无法归属的转发，可能属于该用户，单独加载一次
+                print(f"[{username}] 合并时间线中有无法归属的转发，单独抓取该用户")
+                results[username] = scrape_nitter_with_playwright(username, dynamic_instances, browser_manager,
+                                                                  catchup, until)
+                continue
+            results[username] = (user_tweets if catchup else user_tweets[:1]) or None
+            if user_tweets:
+                announce_tweet(username, instance, user_tweets[0])
+            else:
+                print(f"[{username}] 合并时间线中没有该用户的近期推文")
+        return results
+    return {username: None for username in usernames}
+
+def iter_scrape_results(targets, instances, browser_manager, batch_size=1, catchup=False, budget=None):
+    """
+    顺序抓取各目标，按 targets 顺序逐个产出 (target, 推文列表或 None)
+    batch_size > 1 时普通用户按组走合并时间线，每组只加载一次
+    budget: 单次运行的时间预算，每个目标 (合并加载时为整组) 分到剩余抓取时间的一份，时间用完后不再抓取其余目标
+    """
+    batch_of = {}
+    for chunk in make_batches(targets, batch_size):
+        for username in chunk:
+            batch_of[username] = chunk
+
+    batch_results = {}
+    for index, target in enumerate(targets):
+        chunk = batch_of.get(target)
+        until = None
+        if budget and not (chunk and target in batch_results):
+            window = budget.target_window(len(targets) - index, len(chunk) if chunk else 1)
+            if window is None:
+                print(f"[系统] 抓取时间预算已用完，剩余 {len(targets) - index} 个目标留待下一次运行")
+                return
+            until = time.time() + window
+        try:
+            if chunk:
+                if target not in batch_results:
+                    print(f"[系统] 合并加载 {len(chunk)} 个用户: {', '.join(chunk)}")
+                    batch_results.update(scrape_batch(chunk, instances, browser_manager, catchup, until))
+                yield target, batch_results.get(target)
+            else:
+                yield target, scrape_nitter_with_playwright(target, instances, browser_manager, catchup, until)
+        except Exception as e:
+            print(f"[{target}] 抓取异常: {e}")
+            if chunk:
+                # 整组失败时不再逐个重试，避免同一轮重复加载
+                for username in chunk:
+                    batch_results.setdefault(username, None)
+            yield target, None
+
+def build_dingtalk_message(tweet, target):
+    """
+    构造推文对应的钉钉 markdown 消息 (翻译、图片上传在这里完成)
+    """
     retweet_flag = " 🔃 转发了" if tweet.get('is_retweet') else " 📝 发布了"
     
     # 尝试翻译内容
     print(f"[{target}] 正在翻译推文内容...")
     
-    # 清理原文中的乱码或装饰性字符
     raw_content = tweet['content']
-    # 移除特定乱码序列 €∋
-    clean_content = raw_content.replace('€∋', '').strip()
-    
-    translated_content = translate_text(clean_content)
+    translated_content = translate_text(clean_tweet_content(tweet))
     
     # 构造内容展示 (如果有翻译则显示翻译+原文)
     if translated_content:
@@ -341,31 +472,14 @@ def send_dingtalk(webhook_url, tweet, target):
     if tweet.get('images'):
         # 检查是否启用图床上传
         use_image_bed = os.environ.get('USE_IMAGE_BED', 'true').lower() == 'true'
-        
-        for img_url in tweet['images']:
-            import urllib.parse
-            
-            final_url = None
-            
-            # 方案1: 尝试上传到图床 (推荐)
-            if use_image_bed:
-                print(f"[{target}] 正在上传图片到图床...")
-                final_url = upload_image_to_bed(img_url)
-            
-            # 方案2: 如果图床失败,使用代理服务
-            if not final_url:
-                cloudflare_proxy = os.environ.get('CLOUDFLARE_PROXY', '').strip()
-                if cloudflare_proxy:
-                    encoded_url = urllib.parse.quote(img_url)
-                    final_url = f"{cloudflare_proxy.rstrip('/')}?url={encoded_url}"
-                else:
-                    # 回退到 wsrv.nl 代理
-                    clean_url = img_url.replace('https://', '').replace('http://', '')
-                    encoded_url = urllib.parse.quote(clean_url)
-                    final_url = f"https://wsrv.nl/?url={encoded_url}"
-            
-            if final_url:
-                images_md += f"\n\n![image]({final_url})"
+        cloudflare_proxy = os.environ.get('CLOUDFLARE_PROXY', '').strip()
+        # 自建的媒体缓存代理 (python media_proxy.py)，优先于 Cloudflare Worker 与 wsrv.nl
+        media_proxy = os.environ.get('MEDIA_PROXY_URL', '').strip()
+
+        # 所有图片并行上传，图床失败的图片回退到代理服务
+        for final_url in IMAGE_PIPELINE.resolve(tweet['images'], target, use_image_bed, cloudflare_proxy,
+                                                media_proxy):
+            images_md += f"\n\n![image]({final_url})"
 
     # 如果有视频链接，添加观看链接
     if tweet.get('video_url'):
@@ -384,104 +498,30 @@ def send_dingtalk(webhook_url, tweet, target):
 [🔗 Nitter 原文]({tweet['link']}) | [🔗 Twitter(X) 原文]({tweet['link'].replace('xcancel.com', 'twitter.com').replace('nitter.net', 'twitter.com').replace('nitter.hu', 'twitter.com').replace('nitter.privacyredirect.com', 'twitter.com').replace('nitter.poast.org', 'twitter.com')})
     """
 
-    data = {
-        "msgtype": "markdown",
-        "markdown": {
-            "title": title,
-            "text": text
-        }
-    }
-
-    try:
-        resp = requests.post(webhook_url, json=data, timeout=10)
-        result = resp.json()
-        if result.get('errcode') == 0:
-            print(f"[{target}] 钉钉推送成功")
-            return True
-        else:
-            print(f"[{target}] 钉钉推送失败: {result}")
-            return False
-    except Exception as e:
-        print(f"[{target}] 钉钉请求异常: {e}")
-        return False
+    return Message(target, tweet['guid'], title, text)
 
-def get_original_image_url(nitter_url):
+def clean_tweet_content(tweet):
     """
-    尝试从 Nitter 的代理 URL 中还原出 Twitter/X 的原始图片地址
-    例如: /pic/media%2FGDR-yXfbsAA_JmS.jpg -> pbs.twimg.com
+    清理原文中的乱码或装饰性字符，得到用于翻译的文本
     """
-    import urllib.parse
-    import re
-    try:
-        if 'pbs.twimg.com' in nitter_url:
-            return nitter_url
-            
-        # 1. 处理 hex 编码的对象 (常见于 xcancel 等实例)
-        if '/pic/enc/' in nitter_url:
-            enc_part = nitter_url.split('/pic/enc/')[-1].split('?')[0]
-            try:
-                decoded = bytes.fromhex(enc_part).decode('utf-8')
-                if 'pbs.twimg.com' in decoded:
-                    return decoded
-            except:
-                pass
-
-        # 2. 处理标准 Nitter 路径
-        path = urllib.parse.unquote(nitter_url)
-        
-        # 匹配 /pic/media/ID.ext 或 /pic/orig/media/ID.ext
-        if '/media/' in path:
-            media_part = path.split('/media/')[-1].split('?')[0]
-            if '.' in media_part:
-                media_id, ext = media_part.rsplit('.', 1)
-                # 某些时候 ext 后面可能还跟着 &name=...
-                ext = ext.split('&')[0].split('?')[0]
-                return f"https://pbs.twimg.com/media/{media_id}?format={ext}&name=large"
-
-        # 3. 处理直接包含 pbs.twimg.com 的路径 (如 /pic/pbs.twimg.com/media/...)
-        if 'pbs.twimg.com' in path:
-            # 提取从 pbs.twimg.com 开始的部分
-            match = re.search(r'(pbs\.twimg\.com/media/[^?&]+)', path)
-            if match:
-                return "https://" + match.group(1)
-
-    except Exception as e:
-        print(f"[图片解析] 还原 URL 失败 {nitter_url}: {e}")
-        
-    return nitter_url
+    # 移除特定乱码序列 €∋
+    return tweet['content'].replace('€∋', '').strip()
 
 def translate_text(text, target_lang='zh-CN'):
     """
-    使用 Google Translate (GTX) 接口进行免费翻译
+    使用 Google Translate (GTX) 接口进行免费翻译，结果写入翻译缓存
     """
-    if not text or not text.strip():
-        return ""
-    
-    # 简单的翻译逻辑
-    try:
-        url = "https://translate.googleapis.com/translate_a/single"
-        params = {
-            "client": "gtx",
-            "sl": "auto",
-            "tl": target_lang,
-            "dt": "t",
-            "q": text
-        }
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        resp = requests.get(url, params=params, headers=headers, timeout=15)
-        resp.raise_for_status()
-        
-        # 解析返回的 JSON
-        data = resp.json()
-        if data and data[0]:
-            translated_parts = [part[0] for part in data[0] if part[0]]
-            return "".join(translated_parts)
-    except Exception as e:
-        print(f"[翻译] 失败: {e}")
-    
-    return None
+    return translation.translate_text(text, target_lang, cache=TRANSLATION_CACHE)
+
+def prefetch_translations(tweets):
+    """
+    推送前把本轮待发送的推文合并为少量批量请求翻译，结果进入缓存，随后构建消息时直接命中
+    """
+    if TRANSLATE_BATCH_SIZE < 2 or len(tweets) < 2:
+        return
+    texts = [clean_tweet_content(tweet) for tweet in tweets]
+    translated = translate_batch(texts, cache=TRANSLATION_CACHE, batch_size=TRANSLATE_BATCH_SIZE)
+    print(f"[翻译] 预取 {len(translated)}/{len(set(texts))} 条待推送推文的译文")
 
 def main():
     if not USERS:
@@ -489,44 +529,323 @@ def main():
         return
 
     print(f"[{datetime.now()}] 启动监控模式 (LOOP_MODE={LOOP_MODE}, INTERVAL={INTERVAL}s)...")
+    print(f"[系统] 时间线解析后端: {PARSER_BACKEND}")
+    if SCHEDULER:
+        budget = f"{FETCH_BUDGET} 次/分钟" if FETCH_BUDGET > 0 else "不限"
+        print(f"[系统] 自适应轮询 (间隔 {SCHEDULE_MIN_INTERVAL}-{SCHEDULE_MAX_INTERVAL}s, 抓取配额 {budget})")
     
     # 从本地缓存加载可用实例
     instances = load_instances()
 
+    if SHARDS > 1:
+        # 分片模式: 子进程各自持有浏览器抓取一部分目标，推送与状态写入只在当前进程进行
+        from sharding import ShardedFetcher
+        print(f"[系统] 分片抓取模式 ({SHARDS} 个子进程)")
+        # 每个目标固定属于一个分片，RSS 缓存只需从子进程收回，不必下发
+        shared_state = functools.partial(collect_shard_state, names=('health', 'tiers'))
+        # 每轮最多等待一个轮询间隔 (单次运行时不超过抓取阶段的预算)，卡住的子进程不会拖住推送
+        with ShardedFetcher(SHARDS, shared_state, merge_shard_state, budget=BUDGET, cycle_timeout=INTERVAL) as fetcher:
+            run_cycles(instances, fetcher.fetch)
+        return
+
+    with open_fetcher() as fetch_results:
+        run_cycles(instances, fetch_results)
+
+@contextlib.contextmanager
+def open_fetcher():
+    """
+    按配置创建抓取器，产出 fetch_results(targets, instances)，退出时关闭浏览器
+    """
+    if ASYNC_MODE or HEDGE_MODE:
+        # 异步并发模式: 多个目标同时抓取，结果仍按 USERS 顺序处理
+        from async_scraper import AsyncScraper
+        hedge_tag = f", 对冲请求 (最多 {MAX_HEDGES} 路)" if HEDGE_MODE else ""
+        print(f"[系统] 异步并发模式 (总并发 {MAX_CONCURRENCY}, 单实例并发 {PER_INSTANCE_CONCURRENCY}{hedge_tag})")
+        with AsyncScraper(MAX_CONCURRENCY, PER_INSTANCE_CONCURRENCY, tier_memory=TIER_MEMORY,
+                          rss_cache=RSS_CACHE, batch_size=BATCH_SIZE, health=HEALTH, hedge=HEDGE_MODE,
+                          hedge_delay=HEDGE_DELAY or None, max_hedges=MAX_HEDGES,
+                          block_resources=BLOCK_RESOURCES, ready_timeout=PAGE_READY_TIMEOUT,
+                          storage_states=STORAGE_STATES, catchup=CATCHUP_MAX > 1, budget=BUDGET) as scraper:
+            yield scraper.scrape
+        return
+
+    # 整个进程共用一个 Chromium，各轮询周期之间保持热启动
+    with BrowserManager() as browser_manager:
+        yield functools.partial(
+            iter_scrape_results, browser_manager=browser_manager, batch_size=BATCH_SIZE, catchup=CATCHUP_MAX > 1,
+            budget=BUDGET
+        )
+
+def collect_shard_state(since=None, names=('health', 'tiers', 'rss')):
+    """
+    分片模式下在进程之间传递的抓取期状态: 实例健康度、抓取层级与 RSS 缓存
+    since 为之前的快照时只返回有变化的条目
+    """
+    sources = {'health': HEALTH, 'tiers': TIER_MEMORY, 'rss': RSS_CACHE}
+    state = {name: sources[name].snapshot() for name in names}
+    if since:
+        state = {
+            name: {key: value for key, value in entries.items() if since.get(name, {}).get(key) != value}
+            for name, entries in state.items()
+        }
+    return state
+
+def merge_shard_state(state, metrics=None):
+    """
+    合并其他进程返回的抓取期状态与指标 (由当前进程统一保存)
+    实例健康度为主进程下发的快照时直接覆盖；子进程回传的是逐次抓取结果 (health_events)，按顺序重放
+    """
+    HEALTH.merge(state.get('health'))
+    HEALTH.replay(state.get('health_events'))
+    TIER_MEMORY.merge(state.get('tiers'))
+    RSS_CACHE.merge(state.get('rss'))
+    METRICS.merge(metrics)
+
+def update_cutoff(target, tweets, last_id):
+    """
+    时间线按动态先后排列，页面上最新 ID 所在位置及其之后的原创推文都已推送过或被有意跳过:
+    把其中最大的推文 ID 记为该目标原创推文的比较基准。最新 ID 可能是转发 (ID 为被转发的旧推文)，不能直接作为基准
+    """
+    guids = [tweet['guid'] for tweet in tweets]
+    if last_id not in guids:
+        return
+    numbers = [snowflake_id(tweet['guid']) for tweet in tweets[guids.index(last_id):] if not tweet.get('is_retweet')]
+    numbers = [number for number in numbers if number is not None]
+    if numbers:
+        STATE.raise_cutoff(target, max(numbers))
+
+def select_new_tweets(target, tweets, last_ids):
+    """
+    从按页面顺序 (新到旧) 排列的推文中选出需要推送的新推文，按从旧到新的顺序返回 (最多 CATCHUP_MAX 条)
+    遇到上次推送的推文即停止；原创推文的雪花 ID 不大于比较基准 (见 update_cutoff) 时视为旧推文 (删除/置顶/取消转发
+    等变化导致重新出现)，转发的推文 ID 是原推文的 ID，只按页面位置判断；推送过的推文一律跳过
+    """
+    last_id = last_ids.get(target)
+    update_cutoff(target, tweets, last_id)
+    last_number = STATE.cutoff(target)
+    if last_number is None:
+        # 旧版状态库没有比较基准，退回上次推送的 ID
+        last_number = snowflake_id(last_id)
+    fresh = []
+    for tweet in tweets:
+        if tweet['guid'] == last_id:
+            break
+        if STATE.is_seen(target, tweet['guid']):
+            continue
+        number = snowflake_id(tweet['guid'])
+        if not tweet.get('is_retweet') and number is not None and last_number is not None and number <= last_number:
+            continue
+        fresh.append(tweet)
+        if not last_id:
+            # 首次监控该目标时只推送最新一条，不回溯历史
+            break
+
+    if len(fresh) > CATCHUP_MAX:
+        print(f"[{target}] 发现 {len(fresh)} 条新推文，本轮推送最早的 {CATCHUP_MAX} 条，其余留待下一轮")
+        fresh = fresh[-CATCHUP_MAX:]
+    return fresh[::-1]
+
+def find_duplicates(selected):
+    """
+    跨目标去重: 返回 {(target, guid): 首次出现的 (target, guid)}，此前已由其他目标推送过的推文对应 None
+    """
+    owners = {}
+    duplicates = {}
+    for target, fresh in selected.items():
+        for tweet in fresh:
+            guid = tweet['guid']
+            if guid in owners:
+                duplicates[(target, guid)] = owners[guid]
+                print(f"[{target}] 跳过重复推文 {guid} (本轮已由 {owners[guid][0]} 推送)")
+                continue
+            earlier = STATE.seen_by(guid)
+            if earlier:
+                duplicates[(target, guid)] = None
+                print(f"[{target}] 跳过重复推文 {guid} (此前已由 {earlier} 推送)")
+                continue
+            owners[guid] = (target, guid)
+    return duplicates
+
+def settle_deliveries(selected, duplicates, queued, delivered, settled, final=False, pages=None):
+    """
+    按送达情况更新各目标的状态，推送过程中可以反复调用 (settled 记录已写入的 {(target, guid): 是否推进了最新 ID})
+    只有确认送达的推文才推进最新 ID，失败的留待下一轮重试；
+    同一目标中失败推文之后送达的推文只记入已推送历史，最新 ID 停在最后一条连续送达的推文；
+    失败的推文补推成功后，最新 ID 越过页面 (pages 为 {target: 本轮抓取的推文列表}) 上紧随其后、此前已送达的推文；
+    重复的推文随首次出现的那一份一起送达 (或此前已推送过) 时照常推进本目标的最新 ID；
+    final 为 True 时把已排队但未送达的推文记为失败
+    """
+    for target, fresh in selected.items():
+        contiguous = True
+        advanced = False
+        for tweet in fresh:
+            entry = (target, tweet['guid'])
+            if entry in duplicates:
+                owner = duplicates[entry]
+                resolved, status = owner is None or owner in delivered, 'duplicate'
+            else:
+                resolved, status = entry in delivered, 'delivered'
+            if not resolved:
+                if final and entry in queued:
+                    STATE.record_delivery(target, tweet['guid'], 'failed')
+                contiguous = False
+                continue
+            # 之前因更早的推文未送达而没有推进最新 ID 的，补上
+            if entry not in settled or (contiguous and not settled[entry]):
+                STATE.mark_delivered(target, tweet['guid'], advance=contiguous, status=status)
+                settled[entry] = contiguous
+                advanced = advanced or contiguous
+        if advanced and pages and target in pages:
+            STATE.advance_past_seen(target, [tweet['guid'] for tweet in pages[target]])
+            update_cutoff(target, pages[target], STATE.last_ids().get(target))
+
+def write_cycle_report():
+    """
+    输出本轮的分阶段耗时摘要，并写入 JSON 报告、Prometheus textfile 以及 (开启时的) cProfile 结果
+    """
+    report = METRICS.report()
+    print(f"[统计] 本轮耗时 {report['duration_seconds']:.1f}s: {METRICS.summary(report)}")
+    if not METRICS_DIR:
+        return
+    try:
+        METRICS.write_json(os.path.join(METRICS_DIR, 'cycle_report.json'), report)
+        METRICS.write_prometheus(os.path.join(METRICS_DIR, 'x2ding.prom'), report)
+        PROFILER.stop(os.path.join(METRICS_DIR, 'cycle.prof'))
+    except Exception as e:
+        print(f"[统计] 写入本轮报告失败: {e}")
+
+def run_cycles(instances, fetch_results):
+    """
+    fetch_results(targets, instances) 按目标顺序产出 (target, 推文列表或 None)
+    """
+    if SCHEDULER:
+        SCHEDULER.sync(USERS)
     while True:
+        targets = SCHEDULER.due() if SCHEDULER else USERS
+        if not targets:
+            time.sleep(max(1.0, SCHEDULER.next_wake()))
+            continue
+
         cycle_start = time.time()
+        METRICS.reset()
+        PROFILER.start()
         print(f"\n--- 启动新一轮监控轮询 [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ---")
         
-        # 加载状态 (每轮都重新加载，防止外部手动修改或异常)
-        if os.path.exists(LAST_ID_FILE):
-            try:
-                with open(LAST_ID_FILE, 'r', encoding='utf-8') as f:
-                    last_ids = json.load(f)
-            except: last_ids = {}
-        else: last_ids = {}
-
-        updated = False
-        for target in USERS:
-            try:
-                tweet = scrape_nitter_with_playwright(target, instances)
-                if not tweet:
+        # 加载状态 (与 last_id.json 对账，数据库丢失或落后时以文件为准)
+        STATE.import_last_ids(LAST_ID_FILE)
+        last_ids = STATE.last_ids()
+
+        if BUDGET:
+            # 时间有限时最久未成功检查的目标优先，上一次因超时没有抓到的目标这次排在最前
+            targets = STATE.least_recently_checked(targets)
+            print(f"[系统] 本次运行剩余 {BUDGET.remaining():.0f}s，其中抓取阶段 {max(0.0, BUDGET.fetch_remaining()):.0f}s")
+
+        # 先收集本轮所有目标的结果并选出新推文，统一批量翻译后再从旧到新逐条推送
+        with timer('cycle_fetch'):
+            selected = {}
+            pages = {}
+            reported = set()
+            for target, tweets in fetch_results(targets, instances):
+                reported.add(target)
+                if not tweets:
+                    if SCHEDULER:
+                        SCHEDULER.observe(target, None)
                     continue
-                
-                current_id = tweet['guid']
-                if last_ids.get(target) != current_id:
-                    print(f"[{target}] 发现更新: {current_id}")
-                    if send_dingtalk(WEBHOOK_URL, tweet, target):
-                        last_ids[target] = current_id
-                        updated = True
-                else:
+                STATE.mark_checked(target)
+                try:
+                    fresh = select_new_tweets(target, tweets, last_ids)
+                except Exception as e:
+                    print(f"[{target}] 处理异常: {e}")
+                    fresh = None
+                if SCHEDULER:
+                    # 没有历史 ID 时本次结果不能说明发帖频率
+                    SCHEDULER.observe(target, len(fresh) if fresh is not None and last_ids.get(target) else None)
+                if fresh is None:
+                    continue
+                if fresh:
+                    selected[target] = fresh
+                    pages[target] = tweets
+                elif last_ids.get(target) == tweets[0]['guid']:
                     print(f"[{target}] 无视更新 (ID 未变)")
-            except Exception as e:
-                print(f"[{target}] 处理异常: {e}")
-
-        if updated:
-            with open(LAST_ID_FILE, 'w', encoding='utf-8') as f:
-                json.dump(last_ids, f, indent=2, ensure_ascii=False)
-            print("[系统] 状态文件已更新")
+                else:
+                    # 置顶/删除等变化导致以前推送过的推文重新出现在最前面；
+                    # 或者之前的失败推文已补推，之后的推文早已送达，最新 ID 需要越过它们
+                    newest = STATE.advance_past_seen(target, [tweet['guid'] for tweet in tweets])
+                    if newest:
+                        update_cutoff(target, tweets, newest)
+                        print(f"[{target}] 无视更新 (最新 ID 推进到此前已推送过的 {newest})")
+                    else:
+                        print(f"[{target}] 无视更新 ({tweets[0]['guid']} 此前已推送过)")
+
+            if SCHEDULER:
+                # 抓取器没有产出结果的目标 (被取消等) 已从调度队列取出，必须重新排期，否则再也不会轮询
+                for target in targets:
+                    if target not in reported:
+                        SCHEDULER.observe(target, None)
+
+        duplicates = find_duplicates(selected) if DEDUP_ACROSS_TARGETS else {}
+        pending = [tweet for target, fresh in selected.items() for tweet in fresh
+                   if (target, tweet['guid']) not in duplicates]
+        if pending and WEBHOOK_URL and (not BUDGET or BUDGET.can_prepare()):
+            with timer('cycle_translate'):
+                prefetch_translations(pending)
+
+        messages = []
+        postponed = 0
+        for target, fresh in selected.items():
+            for tweet in fresh:
+                if (target, tweet['guid']) in duplicates:
+                    continue
+                if BUDGET and not BUDGET.can_prepare():
+                    # 剩余时间只够推送已准备好的消息，其余推文不推进最新 ID，下一次运行重新处理
+                    postponed += 1
+                    continue
+                try:
+                    print(f"[{target}] 发现更新: {tweet['guid']}")
+                    if WEBHOOK_URL:
+                        with timer('build_message', target):
+                            messages.append(build_dingtalk_message(tweet, target))
+                        STATE.record_delivery(target, tweet['guid'], 'pending')
+                    else:
+                        print("未配置 DINGTALK_WEBHOOK，跳过发送")
+                except Exception as e:
+                    print(f"[{target}] 处理异常: {e}")
+
+        if postponed:
+            print(f"[系统] 剩余时间不足，{postponed} 条推文留待下一次运行推送")
+
+        # 每送达一条消息就推进相关目标的状态并导出 last_id.json，运行中途被终止也不会丢失已推送的进度
+        queued = {entry for message in messages for entry in message.entries}
+        delivered = set()
+        settled = {}
+        exported = False
+
+        def checkpoint(entries):
+            nonlocal exported
+            delivered.update(entries)
+            settle_deliveries(selected, duplicates, queued, delivered, settled, pages=pages)
+            exported = STATE.export_last_ids(LAST_ID_FILE) or exported
+
+        with timer('cycle_deliver'):
+            if messages:
+                max_wait = min(DELIVERY.max_wait, BUDGET.delivery_window()) if BUDGET else None
+                DELIVERY.deliver(messages, max_wait=max_wait, on_delivered=checkpoint)
+        settle_deliveries(selected, duplicates, queued, delivered, settled, final=True, pages=pages)
+
+        with timer('cycle_save'):
+            TIER_MEMORY.save()
+            TRANSLATION_CACHE.save()
+            MEDIA_MAP.save()
+            RSS_CACHE.save()
+            HEALTH.save()
+            if SCHEDULER:
+                SCHEDULER.save()
+
+            STATE.prune()
+            if STATE.export_last_ids(LAST_ID_FILE) or exported:
+                print("[系统] 状态文件已更新")
+
+        write_cycle_report()
 
         if not LOOP_MODE:
             print("[系统] 非循环模式，任务结束。")
@@ -534,9 +853,15 @@ def main():
         
         # 计算需要 sleep 的时间，减去已经消耗的时间
         elapsed = time.time() - cycle_start
-        sleep_time = max(10, INTERVAL - elapsed)
+        if SCHEDULER:
+            sleep_time = max(10, SCHEDULER.next_wake())
+        else:
+            sleep_time = max(10, INTERVAL - elapsed)
         print(f"--- 轮询结束。耗时 {elapsed:.1f}s，准备休眠 {sleep_time:.1f}s ---\n")
         time.sleep(sleep_time)
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        STATE.close()
@@ -1,44 +1,151 @@
 import requests
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from bs4 import BeautifulSoup
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-OUTPUT_FILE = os.path.join(BASE_DIR, 'instances.json')
-API_URL = "https://status.d420.de/api/v1/instances"
+# 与 twitter_monitor.py 读取的是同一个实例列表文件
+OUTPUT_FILE = os.environ.get('INSTANCES_FILE', os.path.join(BASE_DIR, 'instances.json'))
+API_URL = os.environ.get('INSTANCES_API_URL', "https://status.d420.de/api/v1/instances")
+
+# 主动探测配置: 用真实的时间线请求测量每个候选实例
+PROBE_INSTANCES = os.environ.get('PROBE_INSTANCES', 'true').lower() == 'true'
+PROBE_USER = os.environ.get('PROBE_USER', 'elonmusk')
+PROBE_WORKERS = int(os.environ.get('PROBE_WORKERS', '16'))
+PROBE_TIMEOUT = int(os.environ.get('PROBE_TIMEOUT', '20'))
+
+CHALLENGE_KEYWORDS = ["Verifying your browser", "Just a moment", "Checking your browser"]
+
+def fetch_candidates():
+    """
+    从状态站获取健康且不是坏主机的实例，按分数从高到低排列
+    """
+    resp = requests.get(API_URL, timeout=20)
+    resp.raise_for_status()
+    data = resp.json()
+
+    hosts = data.get('hosts', [])
+    # 筛选准则：健康、且不是坏主机
+    healthy_hosts = [
+        {
+            "url": h['url'].rstrip('/'),
+            "points": h.get('points', 0)
+        }
+        for h in hosts
+        if h.get('healthy') and not h.get('is_bad_host')
+    ]
+
+    # 按分数从高到低排列
+    healthy_hosts.sort(key=lambda x: x['points'], reverse=True)
+    return healthy_hosts
+
+def probe_instance(url, user=PROBE_USER, timeout=PROBE_TIMEOUT):
+    """
+    对单个实例发起一次真实的时间线请求
+    测量首字节时间 (ttfb)、完整下载时间 (total)，并检查是否为验证页、能否解析出 .timeline-item
+    """
+    result = {
+        "url": url.rstrip('/'),
+        "status": None,
+        "ttfb": None,
+        "total": None,
+        "challenge": False,
+        "parsed": False,
+        "items": 0,
+        "error": None,
+    }
+    started = time.monotonic()
+    try:
+        with requests.get(f"{url.rstrip('/')}/{user}", timeout=(5, timeout), stream=True, headers={
+            'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        }) as resp:
+            # stream=True 时 requests.get 在收到响应头后即返回，此刻即为首字节时间
+            result['ttfb'] = round(time.monotonic() - started, 3)
+            result['status'] = resp.status_code
+            chunks = []
+            for chunk in resp.iter_content(chunk_size=16384):
+                chunks.append(chunk)
+            result['total'] = round(time.monotonic() - started, 3)
+            html = b''.join(chunks).decode('utf-8', errors='replace')
+    except Exception as e:
+        result['error'] = str(e)[:200]
+        result['total'] = round(time.monotonic() - started, 3)
+        return result
+
+    result['challenge'] = any(kw in html for kw in CHALLENGE_KEYWORDS)
+    if resp.status_code == 200 and not result['challenge']:
+        result['items'] = len(BeautifulSoup(html, 'html.parser').select('.timeline-item'))
+        result['parsed'] = result['items'] > 0
+    return result
+
+def probe_instances(candidates, user=PROBE_USER, workers=PROBE_WORKERS, timeout=PROBE_TIMEOUT):
+    """
+    并发探测所有候选实例，返回带测量结果的列表 (保持输入顺序)
+    candidates: [{"url": ..., "points": ...}, ...]
+    """
+    if not candidates:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(candidates)))) as pool:
+        probes = list(pool.map(lambda c: probe_instance(c['url'], user, timeout), candidates))
+    return [dict(candidate, **probe) for candidate, probe in zip(candidates, probes)]
+
+def rank_probed(probed):
+    """
+    按实际抓取体验排序:
+    能直接解析出推文的实例按完整耗时从快到慢排在最前；
+    出现验证页的实例 (浏览器可能可以通过) 排在其后；无法访问的实例丢弃
+    """
+    parsed = sorted((p for p in probed if p['parsed']), key=lambda p: (p['total'], p['ttfb'] or 0))
+    challenged = sorted((p for p in probed if p['challenge']), key=lambda p: -p.get('points', 0))
+    ranked = []
+    for p in parsed + challenged:
+        ranked.append(dict(p, ok=p['parsed']))
+    return ranked
+
+def write_instances(entries, probe_user=None):
+    """
+    写入新版 instances.json (带测量指标与时间戳)，twitter_monitor.load_instances 同时兼容旧版纯 URL 列表
+    """
+    data = {
+        "updated_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "probe_user": probe_user,
+        "instances": entries,
+    }
+    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
 
 def fetch_and_save():
     print(f"正在从 {API_URL} 获取实例状态...")
     try:
-        resp = requests.get(API_URL, timeout=20)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        hosts = data.get('hosts', [])
-        # 筛选准则：健康、且不是坏主机
-        healthy_hosts = [
-            {
-                "url": h['url'].rstrip('/'),
-                "points": h.get('points', 0)
-            }
-            for h in hosts 
-            if h.get('healthy') and not h.get('is_bad_host')
-        ]
-        
-        # 按分数从高到低排列
-        healthy_hosts.sort(key=lambda x: x['points'], reverse=True)
-        
-        # 提取纯 URL 列表
-        instance_urls = [h['url'] for h in healthy_hosts]
-        
-        if instance_urls:
-            with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-                json.dump(instance_urls, f, indent=2, ensure_ascii=False)
-            print(f"成功更新 {len(instance_urls)} 个健康实例到 {OUTPUT_FILE}")
-            return True
-        else:
+        healthy_hosts = fetch_candidates()
+        if not healthy_hosts:
             print("未能获取到任何健康实例")
             return False
-            
+
+        if PROBE_INSTANCES:
+            print(f"正在并发探测 {len(healthy_hosts)} 个候选实例 (探测用户: {PROBE_USER})...")
+            probed = probe_instances(healthy_hosts)
+            for p in probed:
+                state = "可解析" if p['parsed'] else ("验证页" if p['challenge'] else (p['error'] or f"HTTP {p['status']}"))
+                print(f"  {p['url']}: {state}, ttfb={p['ttfb']}s, total={p['total']}s")
+            ranked = rank_probed(probed)
+            if ranked:
+                write_instances(ranked, PROBE_USER)
+                print(f"成功更新 {len(ranked)} 个实例 (其中 {sum(1 for p in ranked if p['ok'])} 个可直接解析) 到 {OUTPUT_FILE}")
+                return True
+            print("所有候选实例探测失败，保留状态站的排序结果")
+
+        # 提取纯 URL 列表
+        instance_urls = [h['url'] for h in healthy_hosts]
+        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+            json.dump(instance_urls, f, indent=2, ensure_ascii=False)
+        print(f"成功更新 {len(instance_urls)} 个健康实例到 {OUTPUT_FILE}")
+        return True
+
     except Exception as e:
         print(f"获取实例列表异常: {e}")
         return False